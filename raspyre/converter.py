@@ -5,20 +5,34 @@ Binary Version: 0.4
 
 This tool converts Raspyre files between CSV format and binary format.
 If the input file is binary, the output will be CSV and vice versa.
+Binary files can also be exported for analysis with --format:
+  npz      one array per column and the header as JSON (__header__)
+  npy      one structured array, the header is written to <file>.json
+  hdf5     one dataset per column, requires h5py
+  parquet  one column per column, requires pyarrow
+The header metadata, units and column names are preserved.
 If the output file parameter is omitted, the input name will be used with
 a new file ending .csv or .bin
 The tool does support converting entire folders if the input file is a
-folder containing only valid measurement files.
+folder containing only valid measurement files. Several files can be
+converted in parallel with --jobs.
 """
 
 __version__ = "0.2"
 import argparse
 from . import storage
+import concurrent.futures
+import importlib.util
+import json
 import os.path
 import os
 import sys
+import time
+import zipfile
 
-#from .storage import RaspyreFileFormatException
+import numpy as np
+
+from .storage import RaspyreFileFormatException
 
 
 class RaspyreReaderException(Exception):
@@ -26,9 +40,14 @@ class RaspyreReaderException(Exception):
 
 
 def _convert(conversion_function, binary, source, target):
+    """converts a single file and reports errors
+
+    :returns: True if the file was converted
+    """
     try:
         conversion_function(source, target)
         sys.stdout.write("Converted {}.\n".format(source))
+        return True
     except RaspyreReaderException:
         sys.stderr.write(
             "Exception occurred while reading {}\n".format(source))
@@ -39,9 +58,34 @@ def _convert(conversion_function, binary, source, target):
         else:
             sys.stderr.write(
                 "Error! {} is not in binary format.\n".format(source))
+    return False
+
+
+def _convert_all(conversion_function, binary, tasks, jobs=1):
+    """converts a list of (source, target) pairs, using a pool of jobs
+    processes if jobs is larger than 1, and reports the throughput
+    """
+    start = time.time()
+    if jobs > 1 and len(tasks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            futures = [executor.submit(_convert, conversion_function,
+                                       binary, source, target)
+                       for source, target in tasks]
+            results = [future.result() for future in futures]
+    else:
+        results = [_convert(conversion_function, binary, source, target)
+                   for source, target in tasks]
+    seconds = time.time() - start
+    size = sum(os.path.getsize(source)
+               for (source, _), result in zip(tasks, results) if result)
+    sys.stdout.write(
+        "Converted {} of {} files ({:.1f} MB) in {:.1f} s ({:.1f} MB/s).\n"
+        .format(sum(results), len(tasks), size / 1e6, seconds,
+                size / 1e6 / seconds if seconds else 0.0))
+    return results
 
 
-def convert_binary_to_csv(source, target):
+def convert_binary_to_csv(source, target, chunk_rows=65536):
     try:
         reader = storage.getReader(source)
     except:
@@ -51,12 +95,128 @@ def convert_binary_to_csv(source, target):
     writer = storage.Writer(target, binary=False)
     writer.writeHeader(reader.header)
 
-    for line in reader.data():
-        writer.writeRow(line)
+    for array in reader.iter_arrays(chunk_rows):
+        writer.writeRows(array)
+    reader.f.close()
     writer.close()
 
 
-def convert_csv_to_binary(source, target):
+def _open_binary(source):
+    try:
+        reader = storage.getReader(source)
+    except:
+        raise RaspyreReaderException
+    if not reader.binary:
+        raise storage.RaspyreFileFormatException
+    reader.f.close()
+    return reader
+
+
+def _units(reader, names):
+    """returns a dictionary of the unit of each field of the dtype"""
+    return dict(zip(names, reader.header['units']))
+
+
+def convert_binary_to_npz(source, target, chunk_rows=65536):
+    """writes every column as a compressed array of an npz archive and the
+    header as JSON string array __header__. The columns are streamed into
+    the archive in chunks of chunk_rows rows.
+    """
+    reader = _open_binary(source)
+    view = reader.mmap_view()
+    rows = len(view)
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED,
+                         allowZip64=True) as archive:
+        for name in view.dtype.names:
+            column = view.column(name)
+            with archive.open(name + '.npy', 'w', force_zip64=True) as f:
+                np.lib.format.write_array_header_1_0(f, {
+                    'descr': np.lib.format.dtype_to_descr(column.dtype),
+                    'fortran_order': False,
+                    'shape': (rows, )})
+                for start in range(0, rows, chunk_rows):
+                    f.write(np.ascontiguousarray(
+                        column[start:start + chunk_rows]).tobytes())
+        with archive.open('__header__.npy', 'w') as f:
+            np.lib.format.write_array(f, np.array(json.dumps(reader.header)))
+
+
+def convert_binary_to_npy(source, target, chunk_rows=65536):
+    """writes the rows as structured array and the header as JSON to
+    target + ".json"
+    """
+    reader = _open_binary(source)
+    array = np.lib.format.open_memmap(target, mode='w+', dtype=reader.dtype(),
+                                      shape=(reader.row_count(), ))
+    start = 0
+    for chunk in reader.iter_arrays(chunk_rows):
+        array[start:start + len(chunk)] = chunk
+        start += len(chunk)
+    array.flush()
+    del array
+    with open(target + '.json', 'w') as f:
+        json.dump(reader.header, f)
+
+
+def convert_binary_to_hdf5(source, target, chunk_rows=65536):
+    """writes every column as a gzip compressed dataset with its unit as
+    attribute and the header as JSON attribute raspyre_header of the file
+    """
+    import h5py
+    reader = _open_binary(source)
+    dtype = reader.dtype()
+    rows = reader.row_count()
+    units = _units(reader, dtype.names)
+    with h5py.File(target, 'w') as f:
+        f.attrs['raspyre_header'] = json.dumps(reader.header)
+        datasets = {}
+        for name in dtype.names:
+            datasets[name] = f.create_dataset(
+                name, shape=(rows, ), dtype=dtype.fields[name][0],
+                chunks=(max(min(chunk_rows, rows), 1), ),
+                compression='gzip')
+            datasets[name].attrs['unit'] = units.get(name, '')
+        start = 0
+        for chunk in reader.iter_arrays(chunk_rows):
+            for name in dtype.names:
+                datasets[name][start:start + len(chunk)] = chunk[name]
+            start += len(chunk)
+
+
+def convert_binary_to_parquet(source, target, chunk_rows=65536):
+    """writes one row group per chunk of chunk_rows rows. The units are
+    stored in the field metadata, the header as JSON in the schema
+    metadata under the key raspyre.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    reader = _open_binary(source)
+    dtype = reader.dtype()
+    units = _units(reader, dtype.names)
+    schema = pa.schema(
+        [pa.field(name, pa.from_numpy_dtype(dtype.fields[name][0]),
+                  metadata={'unit': units.get(name, '')})
+         for name in dtype.names],
+        metadata={'raspyre': json.dumps(reader.header)})
+    with pq.ParquetWriter(target, schema) as writer:
+        for chunk in reader.iter_arrays(chunk_rows):
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(np.ascontiguousarray(chunk[name]))
+                 for name in dtype.names], schema=schema))
+
+
+# --format choices: extension, conversion function, required module
+FORMATS = {
+    'csv': ('.csv', convert_binary_to_csv, None),
+    'bin': ('.bin', None, None),
+    'npz': ('.npz', convert_binary_to_npz, None),
+    'npy': ('.npy', convert_binary_to_npy, None),
+    'hdf5': ('.h5', convert_binary_to_hdf5, 'h5py'),
+    'parquet': ('.parquet', convert_binary_to_parquet, 'pyarrow'),
+}
+
+
+def convert_csv_to_binary(source, target, chunk_rows=65536):
     try:
         reader = storage.getReader(source)
     except:
@@ -66,8 +226,9 @@ def convert_csv_to_binary(source, target):
     writer = storage.Writer(target, binary=True)
     writer.writeHeader(reader.header)
 
-    for line in reader.data():
-        writer.writeRow(line)
+    for array in reader.iter_arrays(chunk_rows):
+        writer.writeRows(array)
+    reader.f.close()
     writer.close()
 
 
@@ -111,20 +272,46 @@ def main():
         help="convert csv to binary",
         default=False,
         dest="tobinary")
+    parser.add_argument(
+        "--format",
+        action="store",
+        choices=sorted(FORMATS),
+        help="output format for binary input files (default csv)",
+        default=None,
+        dest="format")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        type=int,
+        help="number of files converted in parallel",
+        default=1,
+        dest="jobs")
 
     results = parser.parse_args()
     #print results
     output_argument = results.output
     input_file_flag = False
     input_files = list()
+    # (input file, output file) pairs to be converted
+    tasks = list()
 
     # determine file extension and conversion function based on input flag
+    if results.format == 'bin':
+        results.tobinary = True
     if results.tobinary:
         output_extension = ".bin"
         conversion_function = convert_csv_to_binary
-    else:
+    elif results.format in (None, 'csv'):
         output_extension = ".csv"
         conversion_function = convert_binary_to_csv
+    else:
+        output_extension, conversion_function, module = FORMATS[results.format]
+        if module is not None and importlib.util.find_spec(module) is None:
+            sys.stderr.write(
+                "Error! The {} format requires the {} package.\n".format(
+                    results.format, module))
+            sys.exit(12)
 
     # create list of input files
     if os.path.isdir(results.input[0]):
@@ -179,8 +366,7 @@ def main():
                     sys.stderr.write("Use -f to overwrite.\n")
                     continue
                 if output_filename != input_file:
-                    _convert(conversion_function, results.tobinary, input_file,
-                             output_filename)
+                    tasks.append((input_file, output_filename))
 
             else:
                 if os.path.isdir(output_argument):
@@ -193,8 +379,7 @@ def main():
                         sys.stderr.write("Use -f to overwrite.\n")
                         continue
                     if output_filename != input_file:
-                        _convert(conversion_function, results.tobinary,
-                                 input_file, output_filename)
+                        tasks.append((input_file, output_filename))
 
                 else:
                     sys.stderr.write(
@@ -211,8 +396,7 @@ def main():
             output_filename = os.path.join(
                 output_folder, (output_basename + output_extension))
             if output_filename != input_file:
-                _convert(conversion_function, results.tobinary, input_file,
-                         output_filename)
+                tasks.append((input_file, output_filename))
         else:
             if os.path.isdir(output_argument):
                 output_filename = os.path.join(
@@ -230,12 +414,13 @@ def main():
                 raise Exception("Could not determine output file.")
 
             if output_filename != input_file:
-                _convert(conversion_function, results.tobinary, input_file,
-                         output_filename)
+                tasks.append((input_file, output_filename))
     else:
         sys.stderr.write("No valid file found to convert. Exiting.\n")
         sys.exit(11)
 
+    _convert_all(conversion_function, results.tobinary, tasks, results.jobs)
+
 
 if __name__ == "__main__":  # pragma: no cover
     main()
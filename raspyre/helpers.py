@@ -8,11 +8,18 @@ from .record import Record
 from os.path import isfile
 
 
-def rec2DF(records):
+def rec2DF(records, axis=None):
     """ 
     Convert a list of Records into a Pandas DataFrame with column headers according to the attributes of the first object. NOT TESTED. Only works if all records have the same attribtues
+    Plain tuples (time, value1, ...) as returned by Sensor.getRecords carry no attribute names, the columns are named 'time' followed by axis then.
     """
     import pandas
+    if isinstance(records[0], tuple):
+        # FastRecords share one layout, no per record lookups needed
+        columns = getattr(records[0], '_fields', None)
+        if columns is None and axis is not None:
+            columns = ['time'] + list(axis)
+        return pandas.DataFrame.from_records(records, columns=columns)
     columns = [name for name in records[0]]
     return pandas.DataFrame([ [rec[name] for name in columns] for rec in records], columns = columns)
 
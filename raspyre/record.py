@@ -1,7 +1,12 @@
 """
 The Record object stores an arbitrary number of measured values. All records have the "time" attribute in common, that has the time of creation of the object in system time. Record objects can be sorted by this property. Element acces is done as in dictionarys.
 
+
+For high sampling rates sensors may return a FastRecord instead. FastRecord
+classes are tuples with a fixed layout of the time followed by the values
+of the requested attributes, see :py:func:`record_type`.
 """
+import collections
 import time
 
 class Record(object) :
@@ -25,11 +30,13 @@ class Record(object) :
         return len(self.values)
 
     def __getitem__(self, key):
-        # if key is of invalid type or value, the list values will raise the error
-        if key in ['time' , 'timestamp']:
-            return self.values['time']
-        else:
+        # if key is of invalid type or value, the dict values will raise the error
+        try:
             return self.values[key]
+        except KeyError:
+            if key == 'timestamp':
+                return self.values['time']
+            raise
 
     def __setitem__(self, key, value):
         self.values[key] = value
@@ -46,3 +53,40 @@ class Record(object) :
             repr_str += "%s: %s, " % (str(k), str(v))
         repr_str += ")"
         return repr_str
+
+
+_record_types = {}
+
+
+def record_type(axis):
+    """Returns the FastRecord class for the given attributes.
+
+    A FastRecord is a namedtuple of the time followed by the attribute
+    values. It can be packed without any lookups and is created without
+    a dictionary, but still supports the item access of Record:
+
+    >>> XY = record_type(['x', 'y'])
+    >>> rec = XY(time.time(), 0.1, 0.2)
+    >>> rec['y'] == rec.y == rec[2]
+    True
+
+    The classes are cached, so sensors can call this function for every
+    sample.
+    """
+    axis = tuple(axis)
+    cls = _record_types.get(axis)
+    if cls is None:
+        base = collections.namedtuple('FastRecord', ('time',) + axis)
+        positions = {name: i for i, name in enumerate(base._fields)}
+        positions['timestamp'] = 0
+
+        class FastRecord(base):
+            __slots__ = ()
+
+            def __getitem__(self, key):
+                if isinstance(key, str):
+                    key = positions[key]
+                return tuple.__getitem__(self, key)
+
+        cls = _record_types[axis] = FastRecord
+    return cls
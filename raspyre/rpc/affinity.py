@@ -0,0 +1,76 @@
+"""Helpers for pinning the measurement processes to CPUs.
+
+CPU sets are given either as lists of CPU numbers or in the notation of
+the kernel command line, e.g. "2-3,5". CPUs isolated from the scheduler
+with the isolcpus= boot parameter are the preferred place for the real
+time polling processes.
+"""
+import logging
+import os
+
+ISOLATED_CPUS_FILE = '/sys/devices/system/cpu/isolated'
+
+logger = logging.getLogger(__name__)
+
+
+def parse_cpus(cpus):
+    """Returns a sorted list of CPU numbers.
+
+    :param cpus: None, an integer, a list of integers or a string in the
+                 kernel cpu list notation like "2-3,5"
+    """
+    if cpus is None:
+        return None
+    if isinstance(cpus, int):
+        return [cpus]
+    if isinstance(cpus, str):
+        result = set()
+        for part in cpus.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if '-' in part:
+                first, last = part.split('-')
+                result.update(range(int(first), int(last) + 1))
+            else:
+                result.add(int(part))
+        return sorted(result)
+    return sorted(set(int(cpu) for cpu in cpus))
+
+
+def isolated_cpus(path=ISOLATED_CPUS_FILE):
+    """Returns the list of CPUs isolated with isolcpus=, an empty list if
+    there are none or the kernel does not report them.
+    """
+    try:
+        with open(path) as f:
+            return parse_cpus(f.read())
+    except (IOError, ValueError):
+        return []
+
+
+def set_affinity(cpus, pid=0):
+    """Pins a process to a set of CPUs.
+
+    :param cpus: CPU set, see :py:func:`parse_cpus`
+    :param pid: process id, 0 for the calling process
+    :returns: the effective list of CPUs of the process
+    """
+    cpus = parse_cpus(cpus)
+    if cpus:
+        try:
+            os.sched_setaffinity(pid, cpus)
+        except (OSError, ValueError):
+            logger.error("Could not set CPU affinity to {}".format(cpus),
+                         exc_info=True)
+    return get_affinity(pid)
+
+
+def get_affinity(pid=0):
+    """Returns the sorted list of CPUs a process may run on or None if the
+    process does not exist.
+    """
+    try:
+        return sorted(os.sched_getaffinity(pid))
+    except OSError:
+        return None
@@ -0,0 +1,233 @@
+"""Asyncio based Raspyre RPC server.
+
+This module serves the same XML-RPC interface and file downloads as the
+threaded server of :py:mod:`raspyre.rpc.server`, but handles all
+connections on a single event loop. The RaspyreService methods block, so
+they are dispatched to a bounded pool of worker threads while the event
+loop keeps serving other clients. File downloads are sent with
+``loop.sendfile()``, compressing a file runs on a separate pool of
+threads, so downloads never occupy an RPC worker. Byte ranges, ETags and
+compression are handled by :py:mod:`raspyre.rpc.httpfiles`.
+"""
+import asyncio
+import concurrent.futures
+import email.utils
+import http
+import logging
+import mimetypes
+import os
+import posixpath
+import urllib.parse
+from xmlrpc.server import SimpleXMLRPCDispatcher
+
+from . import httpfiles
+
+logger = logging.getLogger(__name__)
+
+SERVER_VERSION = "RaspyreRPC/0.4"
+# maximum length of the request line and of each header line
+MAX_LINE = 65536
+MAX_HEADERS = 100
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=None):
+        Exception.__init__(self, message or http.HTTPStatus(status).phrase)
+        self.status = status
+
+
+class AsyncXMLRPCServer(object):
+    """XML-RPC and file server running on an asyncio event loop.
+
+    The interface follows SimpleXMLRPCServer, so it can replace the
+    threaded server in :py:func:`raspyre.rpc.server.run_rpc_server`.
+
+    :param addr: (address, port) tuple to bind
+    :param workers: number of threads executing RPC calls, the same
+                    number of threads compresses file downloads
+    :param directory: root directory of file downloads, defaults to the
+                      current working directory
+    """
+    rpc_paths = ('/RPC2', '/')
+
+    def __init__(self, addr, workers=4, directory=None, allow_none=False,
+                 encoding=None, logRequests=True):
+        self.address, self.port = addr
+        self.dispatcher = SimpleXMLRPCDispatcher(allow_none, encoding)
+        self.workers = workers
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="rpc")
+        self.file_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="files")
+        self.directory = directory or os.getcwd()
+        self.logRequests = logRequests
+        self.server = None
+
+    def register_instance(self, instance, allow_dotted_names=False):
+        self.dispatcher.register_instance(instance, allow_dotted_names)
+
+    def register_function(self, function=None, name=None):
+        return self.dispatcher.register_function(function, name)
+
+    def register_introspection_functions(self):
+        self.dispatcher.register_introspection_functions()
+
+    def serve_forever(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def start(self):
+        """Binds the listening socket on the running event loop."""
+        # calls waiting for a worker are limited as well, further clients
+        # are not read until a call finished
+        self.pending = asyncio.Semaphore(self.workers * 4)
+        self.server = await asyncio.start_server(
+            self._handle_connection, self.address, self.port, limit=MAX_LINE)
+        logger.info("Asyncio RPC server listening on {}".format(
+            ", ".join(str(s.getsockname()) for s in self.server.sockets)))
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.executor.shutdown(wait=False)
+        self.file_executor.shutdown(wait=False)
+
+    async def _handle_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        try:
+            while await self._handle_request(reader, writer, peer):
+                pass
+        except HTTPError as e:
+            await self._send(writer, e.status, body=str(e).encode('utf-8'),
+                             keep_alive=False)
+        except (ConnectionError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, reader, writer, peer):
+        """Reads and answers one request.
+
+        :returns: True if the connection is kept open for further requests
+        """
+        request_line = await reader.readline()
+        if not request_line:
+            return False
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            raise HTTPError(400)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise HTTPError(431)
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.1':
+            keep_alive = connection != 'close'
+        else:
+            keep_alive = connection == 'keep-alive'
+        path = urllib.parse.urlsplit(target).path
+
+        if method == 'POST':
+            if path not in self.rpc_paths:
+                raise HTTPError(404)
+            if 'content-length' not in headers:
+                raise HTTPError(411)
+            body = await reader.readexactly(int(headers['content-length']))
+            response = await self._dispatch(body)
+            status = await self._send(writer, 200, [('Content-Type', 'text/xml')],
+                                      response, keep_alive)
+        elif method in ('GET', 'HEAD'):
+            status, keep_alive = await self._send_file(
+                writer, path, headers, method == 'HEAD', keep_alive)
+        else:
+            raise HTTPError(501)
+        if self.logRequests:
+            logger.info('{} "{}" {}'.format(
+                peer[0] if peer else '-', request_line.decode('latin-1').strip(),
+                status))
+        return keep_alive
+
+    async def _dispatch(self, body):
+        async with self.pending:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, self.dispatcher._marshaled_dispatch, body)
+
+    async def _send_file(self, writer, path, headers, head_only, keep_alive):
+        filename = self.translate_path(path)
+        if os.path.isdir(filename):
+            raise HTTPError(400, "Directory listing not allowed")
+        ctype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        loop = asyncio.get_running_loop()
+        # writing a cached compressed copy takes a while
+        try:
+            f, response = await loop.run_in_executor(
+                self.file_executor, httpfiles.open_file, filename, headers,
+                ctype)
+        except IOError:
+            raise HTTPError(404)
+        with f:
+            if response.stream is not None:
+                await self._send(writer, response.status, response.headers,
+                                 keep_alive=False, length=False)
+                if not head_only:
+                    while True:
+                        data = await loop.run_in_executor(
+                            self.file_executor, next, response.stream, None)
+                        if data is None:
+                            break
+                        writer.write(data)
+                        await writer.drain()
+                # the end of the compressed stream is marked by closing
+                return response.status, False
+            await self._send(writer, response.status, response.headers,
+                             length=response.length, keep_alive=keep_alive)
+            if not head_only and response.length:
+                await loop.sendfile(writer.transport, f, response.start,
+                                    response.length)
+        return response.status, keep_alive
+
+    async def _send(self, writer, status, headers=(), body=b'', keep_alive=True,
+                    length=None):
+        """Writes the status line, the headers and the body of a response.
+
+        :param length: Content-Length if the body is sent separately, False
+                       to send none
+        :returns: the status
+        """
+        lines = ["HTTP/1.1 {} {}".format(status, http.HTTPStatus(status).phrase),
+                 "Server: {}".format(SERVER_VERSION),
+                 "Date: {}".format(email.utils.formatdate(usegmt=True)),
+                 "Connection: {}".format("keep-alive" if keep_alive else "close")]
+        if length is not False:
+            lines.append("Content-Length: {}".format(
+                len(body) if length is None else length))
+        lines.extend("{}: {}".format(name, value) for name, value in headers)
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        writer.write(body)
+        await writer.drain()
+        return status
+
+    def translate_path(self, path):
+        """Maps a URL path onto the served directory like
+        SimpleHTTPRequestHandler, ignoring '..' components.
+        """
+        path = posixpath.normpath(urllib.parse.unquote(path))
+        filename = self.directory
+        for word in path.split('/'):
+            if not word or os.path.dirname(word) or word in (os.curdir, os.pardir):
+                continue
+            filename = os.path.join(filename, word)
+        return filename
@@ -8,10 +8,16 @@ Processes of the Pi's GPIO interface and should reside in a namespace
 that identifies this behaviour as such.
 """
 
-from .pollingprocess import PollingProcess
-from .handler import HandlerProcess
+from .pollingprocess import (PollingProcess, GroupPollingProcess,
+                             group_divisors)
+from .handler import HandlerProcess, GroupHandlerProcess
+from .streamer import StreamProcess
 from .blink import BlinkProcess
+from . import ringbuffer
+from . import affinity
+from . import httpfiles
 from raspyre import sensorbuilder
+from raspyre.storage import BLOCK_ROWS
 
 import sys
 if sys.version_info[0] == 3:
@@ -27,6 +33,9 @@ import datetime
 import json
 import traceback
 import mmap
+import multiprocessing
+import threading
+import functools
 
 import socket
 import fcntl
@@ -69,17 +78,42 @@ class RaspyreFileInvalid(Exception):
 
 
 
+def locked(method):
+    """Runs a RaspyreService method while holding the lock of the service.
+    The RPC servers dispatch calls from several threads, the methods
+    changing the sensors or their processes must not interleave.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class RaspyreService(object):
     PROCESS_TIMEOUT = 3
 
-    def __init__(self, data_directory, configuration_directory):
+    def __init__(self, data_directory, configuration_directory,
+                 polling_cpus=None, handler_cpus=None):
+        # reentrant, locked methods call each other
+        self._lock = threading.RLock()
         self.sensors = {}
         self.polling_processes = {}
         self.handler_processes = {}
+        # sensorname -> {reader slot: StreamProcess}
+        self.stream_processes = {}
+        # group name -> (GroupPollingProcess, GroupHandlerProcess)
+        self.group_processes = {}
         self.buffer_size = mmap.PAGESIZE * 100
         self.data_directory = os.path.normpath(data_directory)
         self.configuration_directory = os.path.normpath(configuration_directory)
         self.sensor_count = 0
+        # default CPU placement of the measurement processes, the polling
+        # processes go to the isolated CPUs if the kernel has any
+        if polling_cpus is None:
+            polling_cpus = affinity.isolated_cpus() or None
+        self.polling_cpus = affinity.parse_cpus(polling_cpus)
+        self.handler_cpus = affinity.parse_cpus(handler_cpus)
         
         self.is_ntp_master = False
 
@@ -103,6 +137,7 @@ class RaspyreService(object):
         return True
 
 
+    @locked
     def start_blink(self):
         logger.debug("start_blink() called")
         self.is_blinking = True
@@ -113,6 +148,7 @@ class RaspyreService(object):
         else:
             return False
 
+    @locked
     def stop_blink(self):
         logger.debug("stop_blink() called")
         self.is_blinking = False
@@ -124,6 +160,7 @@ class RaspyreService(object):
         else:
             return False
 
+    @locked
     def toggle_blink(self):
         if not self.is_blinking:
             self.start_blink()
@@ -147,6 +184,7 @@ class RaspyreService(object):
         subprocess.Popen(['sudo', 'ntpd', '-g', '-q'])
         return True
 
+    @locked
     def ntp_set_server(self, ip_str):
         with open('/etc/ntp.conf', 'w') as ntpfile:
             ntpfile.write('driftfile /var/lib/ntp/ntp.drift\n')
@@ -163,6 +201,7 @@ class RaspyreService(object):
         subprocess.Popen(['sudo', '/bin/systemctl', 'restart', 'ntp.service'])
         return True
 
+    @locked
     def ntp_master(self):
         with open('/etc/ntp.conf', 'w') as ntpfile:
             ntpfile.write('driftfile /var/lib/ntp/ntp.drift\n')
@@ -187,6 +226,7 @@ class RaspyreService(object):
         else:
             return False
 
+    @locked
     def start_measurement(self, measurementname, sensornames=None):
         """This function starts a measurement process for the specified sensors.
 
@@ -218,6 +258,10 @@ class RaspyreService(object):
                     raise xmlrpclib.Fault(
                         1,
                         'Sensor "{}" is not in the sensorlist'.format(sensorname))
+                elif self.sensors[sensorname]['options'].get('group') is not None:
+                    self._start_group(
+                        self.sensors[sensorname]['options']['group'],
+                        measurementname)
                 else:
 
                     #self.polling_processes[sensorname].setMeasurementName(
@@ -237,6 +281,7 @@ class RaspyreService(object):
         return True
 
 
+    @locked
     def stop_measurement(self, sensornames=None):
         """This function stops a currently running measurement.
 
@@ -265,48 +310,33 @@ class RaspyreService(object):
                     raise xmlrpclib.Fault(
                         1,
                         'Sensor "{}" is not in the sensorlist'.format(sensorname))
+                elif self.sensors[sensorname]['options'].get('group') is not None:
+                    self._stop_group(self.sensors[sensorname]['options']['group'])
                 else:
                     # TODO stop measurement
                     logger.info(
                         "Shutting down measurement subprocess with sensor \"{}\"".
                         format(sensorname))
+                    for slot in list(self.stream_processes.get(sensorname, {})):
+                        self._stop_stream_process(sensorname, slot)
+                    # the polling process is stopped first, the handler
+                    # stores the last samples before it exits
+                    logger.debug("terminating polling process")
+                    if self.polling_processes[sensorname].is_alive():
+                        self.polling_processes[sensorname].shutdown()
+                        self.polling_processes[sensorname].join(self.PROCESS_TIMEOUT)
+                        self.polling_processes[sensorname].terminate()
+
                     logger.debug("terminating handler process")
                     if self.handler_processes[sensorname].is_alive():
                         self.handler_processes[sensorname].shutdown()
                         self.handler_processes[sensorname].join(self.PROCESS_TIMEOUT)
                         self.handler_processes[sensorname].terminate()
-                        self.sensor_count -= 1
-                        self.handler_processes[sensorname] = 0
 
-                    logger.debug("terminating polling process")
-                    if self.polling_processes[sensorname].is_alive():
-                        self.polling_processes[sensorname].shutdown()
-                        self.polling_processes[sensorname].join(self.PROCESS_TIMEOUT)
-                        self.polling_processes[sensorname].terminate()
-                        self.polling_processes[sensorname] = -1
-
-                        logger.debug("subprocesses successfully terminated")
-
-                        mmap_file = '/dev/shm/raspyre_buf' + str(self.sensor_count)
-                        self.polling_processes[sensorname] = PollingProcess(
-                            sensor=self.sensors[sensorname]['sensor'],
-                            sensor_name=sensorname,
-                            config=self.sensors[sensorname]['configuration'],
-                            frequency=self.sensors[sensorname]['frequency'],
-                            axis=self.sensors[sensorname]['axis'],
-                            data_dir=self.data_directory,
-                            mmap_file=mmap_file,
-                            buffer_size=self.buffer_size)
-                        self.handler_processes[sensorname] = HandlerProcess(
-                            sensor=self.sensors[sensorname]['sensor'],
-                            sensor_name=sensorname,
-                            config=self.sensors[sensorname]['configuration'],
-                            frequency=self.sensors[sensorname]['frequency'],
-                            axis=self.sensors[sensorname]['axis'],
-                            data_dir=self.data_directory,
-                            mmap_file=mmap_file,
-                            buffer_size=self.buffer_size,
-                        )
+                    logger.debug("subprocesses successfully terminated")
+                    # a process can only be started once, the processes
+                    # are replaced even if one of them exited on its own
+                    self._create_processes(sensorname)
 
                     self.sensors[sensorname]["measuring"] = False
 
@@ -318,6 +348,57 @@ class RaspyreService(object):
         return True
         return True
 
+    def _group_members(self, group):
+        return sorted(name for name, sensor in self.sensors.items()
+                      if sensor['options'].get('group') == group)
+
+    def _start_group(self, group, measurementname):
+        """Starts a single polling and handler process for all sensors of
+        a group. The group is started as a whole, starting a running group
+        again has no effect.
+
+        :param group: String identifying the group
+        :param measurementname: String describing the measurement
+        """
+        if group in self.group_processes:
+            return
+        members = self._group_members(group)
+        logger.info("Starting sensor group \"{}\" with sensors {}".format(
+            group, ", ".join(members)))
+        polling = GroupPollingProcess(
+            [self.polling_processes[name] for name in members])
+        handler = GroupHandlerProcess(
+            [self.handler_processes[name] for name in members],
+            catch_up=polling.catch_up)
+        handler.setMeasurementName(measurementname)
+        polling.start()
+        handler.start()
+        self.group_processes[group] = (polling, handler)
+        for name in members:
+            self.sensors[name]["measuring"] = True
+
+    def _stop_group(self, group):
+        """Stops the processes of a sensor group and prepares new ones for
+        the next measurement.
+
+        :param group: String identifying the group
+        """
+        members = self._group_members(group)
+        for name in members:
+            for slot in list(self.stream_processes.get(name, {})):
+                self._stop_stream_process(name, slot)
+        polling, handler = self.group_processes.pop(group, (None, None))
+        for process in (polling, handler):
+            if process is not None and process.is_alive():
+                process.shutdown()
+                process.join(self.PROCESS_TIMEOUT)
+                process.terminate()
+        if polling is not None:
+            for name in members:
+                self._create_processes(name)
+        for name in members:
+            self.sensors[name]["measuring"] = False
+
     def is_measuring(self, sensorname):
         """This function returns True if the specified sensor is currently
         used by a measurement process.
@@ -346,6 +427,8 @@ class RaspyreService(object):
         files = [
             f for f in os.listdir(self.data_directory)
             if os.path.isfile(os.path.join(self.data_directory, f))
+            # skip the compressed copies cached for downloads
+            and not f.startswith('.')
         ]
         return files
 
@@ -358,6 +441,7 @@ class RaspyreService(object):
         """
         return []
 
+    @locked
     def get_status(self):
         # collect status information about this node
         is_portal = False
@@ -367,14 +451,159 @@ class RaspyreService(object):
         sensors = {}
         for sensorname, sensor in self.sensors.items():
             # extract relevant information out of sensor dictionary
-            sensors[sensorname] = {k : sensor[k] for k in ('sensortype', 'configuration', 'frequency', 'axis', 'measuring', 'zmq_port')}
+            sensors[sensorname] = {k : sensor[k] for k in ('sensortype', 'configuration', 'frequency', 'axis', 'options', 'measuring', 'zmq_port')}
+            sensors[sensorname]['placement'] = self._placement(sensorname)
         ret =  {"is_portal":is_portal,
                 "is_ntp_master":is_ntp_master,
                 "ip_addr":self.ip_addr,
+                "server_cpus":affinity.get_affinity(),
                 "sensors":sensors}
         return ret
         
 
+    def _placement(self, sensorname):
+        """Returns the CPUs of the polling and handler process of a sensor.
+        The effective affinity is reported for running processes, the
+        configured one otherwise (the CPUs of the server if unset).
+        """
+        group = self.sensors[sensorname]['options'].get('group')
+        if group in self.group_processes:
+            processes = self.group_processes[group]
+        else:
+            processes = (self.polling_processes[sensorname],
+                         self.handler_processes[sensorname])
+        placement = {}
+        for key, process in zip(('polling', 'handler'), processes):
+            if not isinstance(process, multiprocessing.Process):
+                placement[key] = None
+                continue
+            cpus = None
+            if process.is_alive():
+                cpus = affinity.get_affinity(process.pid)
+            if cpus is None:
+                cpus = process.cpus or affinity.get_affinity()
+            placement[key] = cpus
+        return placement
+
+    def get_buffer_stats(self, sensorname):
+        """This function returns the state of the shared memory ring buffer
+        of a sensor: the number of samples written by the polling process
+        (write_seq) and stored by the handler process (read_seq), the
+        number of overruns, the number of samples lost by them and the
+        timestamp of the first sample after the last gap.
+        The counters are returned as floats since XML-RPC integers are
+        limited to 32 bit.
+
+        :param sensorname: String of sensor name
+        :returns: Dictionary of buffer statistics
+        :rtype: Dictionary
+
+        """
+        if sensorname not in self.sensors:
+            raise xmlrpclib.Fault(
+                1, 'Sensor "{}" is not registered in the sensor list'.format(
+                    sensorname))
+        stats = ringbuffer.read_header(self.sensors[sensorname]['mmap_file'])
+        readers = [{k: float(v) for k, v in reader.items()}
+                   for reader in stats['readers']]
+        return {'index': stats['index'],
+                'write_seq': float(stats['write_seq']),
+                'readers': readers}
+
+    def get_timing_stats(self, sensorname):
+        """This function returns the timing statistics of the polling
+        process of a sensor: the number of periods, deadline misses,
+        skipped periods and gaps left by the catch up policy, the time of
+        the last gap, the maximum wake-up lateness in nanoseconds and
+        histograms of the wake-up lateness, the duration of the sensor
+        read (acquisition) and of publishing the sample (write).
+        Bin k of a histogram counts durations below bin_edges_us[k+1]
+        microseconds. The values are returned as floats since XML-RPC
+        integers are limited to 32 bit.
+
+        :param sensorname: String of sensor name
+        :returns: Dictionary of timing statistics
+        :rtype: Dictionary
+
+        """
+        if sensorname not in self.sensors:
+            raise xmlrpclib.Fault(
+                1, 'Sensor "{}" is not registered in the sensor list'.format(
+                    sensorname))
+        stats = ringbuffer.read_timing(self.sensors[sensorname]['mmap_file'])
+        return {k: [float(x) for x in v] if isinstance(v, list) else float(v)
+                for k, v in stats.items()}
+
+    @locked
+    def start_stream(self, sensorname, port):
+        """This function attaches a process publishing the samples of a
+        running measurement on a zmq PUB socket. The stream reads the
+        buffer independently of the process writing the measurement file,
+        several streams may be attached to one sensor.
+
+        :param sensorname: String of sensor name
+        :param port: TCP port of the zmq socket
+        :returns: reader slot of the stream
+        :rtype: Integer
+
+        """
+        if sensorname not in self.sensors:
+            raise xmlrpclib.Fault(
+                1, 'Sensor "{}" is not registered in the sensor list'.format(
+                    sensorname))
+        if not self.sensors[sensorname]["measuring"]:
+            raise xmlrpclib.Fault(
+                1, 'Sensor "{}" is not measuring'.format(sensorname))
+        streams = self.stream_processes.setdefault(sensorname, {})
+        free_slots = [slot for slot in range(ringbuffer.MAX_READERS)
+                      if slot != ringbuffer.HANDLER_SLOT and slot not in streams]
+        if not free_slots:
+            raise xmlrpclib.Fault(
+                1, 'No free buffer reader for sensor "{}"'.format(sensorname))
+        sensor = self.sensors[sensorname]
+        process = StreamProcess(
+            sensor=sensor['sensor'],
+            sensor_name=sensorname,
+            axis=sensor['axis'],
+            mmap_file=sensor['mmap_file'],
+            buffer_size=self.buffer_size,
+            slot=free_slots[0],
+            port=port,
+            batch_size=sensor['options'].get('batch_size', 1))
+        process.start()
+        streams[free_slots[0]] = process
+        logger.debug("started stream process in reader slot {}".format(
+            free_slots[0]))
+        return free_slots[0]
+
+    @locked
+    def stop_stream(self, sensorname, slot=None):
+        """This function detaches stream processes from a sensor.
+
+        :param sensorname: String of sensor name
+        :param slot: reader slot returned by start_stream(),
+                     None stops all streams of the sensor (optional)
+        :returns: True
+        :rtype: Boolean
+
+        """
+        streams = self.stream_processes.get(sensorname, {})
+        if slot is not None and slot not in streams:
+            raise xmlrpclib.Fault(
+                1, 'No stream in reader slot {} of sensor "{}"'.format(
+                    slot, sensorname))
+        slots = list(streams) if slot is None else [slot]
+        for slot in slots:
+            self._stop_stream_process(sensorname, slot)
+        return True
+
+    def _stop_stream_process(self, sensorname, slot):
+        process = self.stream_processes[sensorname].pop(slot)
+        if process.is_alive():
+            process.shutdown()
+            process.join(self.PROCESS_TIMEOUT)
+            process.terminate()
+
     def get_info(self):
         """This function returns the internal sensor dictionary.
 
@@ -384,7 +613,9 @@ class RaspyreService(object):
         """
         return self.sensors
 
-    def add_sensor(self, sensorname, sensortype, config, frequency, axis):
+    @locked
+    def add_sensor(self, sensorname, sensortype, config, frequency, axis,
+                   options=None):
         """This function adds a sensor to the current setup.
         Each installed raspyre-sensor-driver package can be used to instantiate
         a sensor for measurement usage (e.g. raspyre-mpu6050, raspyre-ads1115)
@@ -401,6 +632,43 @@ class RaspyreService(object):
                        method of the specified sensor driver package
         :param frequency: Polling frequency for the measurement
         :param axis: List of parameters to be polled from the sensor
+        :param options: Dictionary of measurement options (optional)
+                        chunked: Boolean, start a new file periodically
+                        chunk_minutes: length of a file in minutes
+                        batch_size: samples per zmq message
+                        batch_latency: maximum seconds between ring drains
+                        high_water: samples written before the handler
+                                    is woken up
+                        publish: Boolean, publish the samples on zmq
+                                 port 5556 (default True)
+                        block_size: samples read per wake-up from
+                                    sensors supporting getRecords()
+                        group: String, sensors of the same group are
+                               polled by a single process on a common
+                               schedule, their frequencies have to be
+                               integer divisors of the highest one
+                        polling_cpus: CPUs of the polling process, a
+                                      list or a string like "2-3"
+                        handler_cpus: CPUs of the handler process
+                        timestamps: 'realtime' (default) keeps the
+                                    timestamps of the sensor, 'monotonic'
+                                    stamps the samples with the
+                                    CLOCK_MONOTONIC deadline and writes
+                                    wall clock anchors next to the files
+                        anchor_interval: seconds between two anchors
+                        catch_up: handling of missed sampling periods,
+                                  'burst' reads the missed samples at
+                                  once (default), 'skip' leaves a gap
+                                  and keeps the sampling grid, 'resync'
+                                  also drops the late sample
+                        file_format: binary file format, '0.4' (default)
+                                     writes raw rows, '0.5' compressed
+                                     blocks
+                        block_rows: samples per block of format 0.5, a
+                                    block is written once it is full
+                        quantization: dictionary of axis and step, the
+                                      values of the axis are stored as
+                                      multiples of the step in format 0.5
         :returns: True
         :rtype: Boolean
 
@@ -411,42 +679,35 @@ class RaspyreService(object):
             logger.error('Sensor "{}" already exists.'.format(sensorname))
             raise xmlrpclib.Fault(
                 1, 'Sensor "{}" already exists!'.format(sensorname))
+        group = (options or {}).get('group')
+        if group is not None:
+            frequencies = {name: self.sensors[name]['frequency']
+                           for name in self._group_members(group)}
+            frequencies[sensorname] = frequency
+            try:
+                group_divisors(frequencies)
+            except ValueError as e:
+                logger.error(str(e))
+                raise xmlrpclib.Fault(1, str(e))
 
         try:
             sensor = sensorbuilder.createSensor(sensor_type=sensortype, **config)
             logger.debug("Successfully instantiated sensor")
 
             mmap_file = '/dev/shm/raspyre_buf' + str(self.sensor_count)
-            self.polling_processes[sensorname] = PollingProcess(
-                sensor=sensor,
-                sensor_name=sensorname,
-                config=config,
-                frequency=frequency,
-                axis=axis,
-                data_dir=self.data_directory,
-                mmap_file=mmap_file,
-                buffer_size=self.buffer_size)
-            self.handler_processes[sensorname] = HandlerProcess(
-                sensor=sensor,
-                sensor_name=sensorname,
-                config=config,
-                frequency=frequency,
-                axis=axis,
-                data_dir=self.data_directory,
-                mmap_file=mmap_file,
-                buffer_size=self.buffer_size,
-            )
             self.sensors[sensorname] = {
                 "sensortype": sensortype,
                 "configuration": config,
                 "frequency": frequency,
                 "axis": axis,
+                "options": dict(options or {}),
                 "measuring": False,
                 "stream": "",
                 "sensor": sensor,
                 "mmap_file": mmap_file,
                 "zmq_port": self.sensor_count + 1
             }
+            self._create_processes(sensorname)
             self.sensor_count += 1
             logger.debug("Successfully instantiated polling process")
             
@@ -456,10 +717,63 @@ class RaspyreService(object):
             logger.error(e)
             logger.error("Traceback:")
             logger.error(traceback.format_exc())
+            # do not leave a half registered sensor behind
+            self.sensors.pop(sensorname, None)
+            self.handler_processes.pop(sensorname, None)
+            polling_process = self.polling_processes.pop(sensorname, None)
+            if polling_process is not None:
+                polling_process.close()
             raise e
 
         return True
 
+    def _create_processes(self, sensorname):
+        """Creates the polling and handler process of a configured sensor.
+
+        :param sensorname: String identifying the sensor
+        """
+        sensor = self.sensors[sensorname]
+        options = sensor['options']
+        self.polling_processes[sensorname] = PollingProcess(
+            sensor=sensor['sensor'],
+            sensor_name=sensorname,
+            config=sensor['configuration'],
+            frequency=sensor['frequency'],
+            axis=sensor['axis'],
+            data_dir=self.data_directory,
+            mmap_file=sensor['mmap_file'],
+            buffer_size=self.buffer_size,
+            notify_every=options.get('high_water'),
+            block_size=options.get('block_size', 1),
+            catch_up=options.get('catch_up', 'burst'),
+            cpus=affinity.parse_cpus(
+                options.get('polling_cpus', self.polling_cpus)),
+            timestamps=options.get('timestamps', 'realtime'))
+        self.handler_processes[sensorname] = HandlerProcess(
+            sensor=sensor['sensor'],
+            sensor_name=sensorname,
+            config=sensor['configuration'],
+            frequency=sensor['frequency'],
+            axis=sensor['axis'],
+            data_dir=self.data_directory,
+            mmap_file=sensor['mmap_file'],
+            buffer_size=self.buffer_size,
+            chunked=options.get('chunked', False),
+            chunk_minutes=options.get('chunk_minutes', 10),
+            batch_size=options.get('batch_size', 1),
+            batch_latency=options.get('batch_latency', 0.1),
+            publish=options.get('publish', True),
+            catch_up=options.get('catch_up', 'burst'),
+            cpus=affinity.parse_cpus(
+                options.get('handler_cpus', self.handler_cpus)),
+            timestamps=options.get('timestamps', 'realtime'),
+            anchor_interval=options.get('anchor_interval', 10.0),
+            file_format=options.get('file_format', '0.4'),
+            block_rows=options.get('block_rows', BLOCK_ROWS),
+            quantization=options.get('quantization'),
+        )
+
+    @locked
     def remove_sensor(self, sensorname):
         """Removes the sensor specified by its name from the current setup.
 
@@ -480,6 +794,7 @@ class RaspyreService(object):
         del self.handler_processes[sensorname]
         return True
 
+    @locked
     def update_sensor(self, sensorname, config):
         """FIXME: This function updates the configuration of a given sensor.
 
@@ -549,6 +864,7 @@ class RaspyreService(object):
         """
         return {}
 
+    @locked
     def clear_sensors(self):
         """This function removes all configured sensors from the current setup.
 
@@ -596,6 +912,7 @@ class RaspyreService(object):
         with open(filepath, 'w') as fp:
             json.dump(state, fp)
 
+    @locked
     def configuration_restore(self, sensorname, path):
         """This function restores a sensor from a given configuration file.
 
@@ -619,6 +936,9 @@ class RaspyreService(object):
         It returns a list of 2 lists. The first list contains directories
         of the queried path, the second list contains the file names.
 
+        Hidden entries, like the cached compressed copies of the files, are
+        not listed.
+
         :param path: path to be queried relative to the data directory
         :returns: list of 2 lists with [[directories], [files]]
         :rtype: list of lists
@@ -630,7 +950,8 @@ class RaspyreService(object):
         # take one filesystem walk of the top level
         first_level_walk = os.walk(normalized_path)
         _, dirnames, filenames = next(first_level_walk)
-        return [dirnames, filenames]
+        return [[name for name in dirnames if not name.startswith('.')],
+                [name for name in filenames if not name.startswith('.')]]
 
     def fs_mkdir(self, path):
         """This function creates a directory in the specified path below
@@ -679,6 +1000,7 @@ class RaspyreService(object):
         if os.path.isdir(normalized_path):
             raise RaspyreFileInvalid("Specified path is a directory, not a file")
         os.remove(normalized_path)
+        httpfiles.remove_cached(normalized_path)
         return True
 
     def fs_mv(self, src, dst):
@@ -695,6 +1017,8 @@ class RaspyreService(object):
         normalized_src = self._sanitize_path(self.data_directory, src)
         normalized_dst = self._sanitize_path(self.data_directory, dst)
         os.rename(normalized_src, normalized_dst)
+        httpfiles.remove_cached(normalized_src)
+        httpfiles.remove_cached(normalized_dst)
         return True
 
     def fs_stat(self, path):
@@ -710,6 +1034,7 @@ class RaspyreService(object):
         os.stat(normalized_path)
         return True
 
+    @locked
     def set_network_logger(self, host, loglevel=logging.DEBUG):
         rootLogger = logging.getLogger('')
         f = IPContextFilter()
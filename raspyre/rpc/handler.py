@@ -1,4 +1,8 @@
 from .writer import generate_binary_header
+from .ringbuffer import RingReader, wait_any
+from .affinity import set_affinity
+from raspyre.storage import (ANCHOR_SUFFIX, BLOCK_ROWS, BLOCK_VERSION,
+                             BlockFile, block_header_extension)
 import multiprocessing
 import logging
 import time
@@ -10,6 +14,19 @@ import mmap
 import ctypes
 import zmq
 
+# binary file format versions a HandlerProcess can write
+FILE_FORMATS = ('0.4', '0.5')
+
+
+def bind_publisher(logger):
+    logger.debug("Setting up zmq context")
+    context = zmq.Context()
+    logger.debug("Setting up zmq socket")
+    socket = context.socket(zmq.PUB)
+    logger.debug("Binding zmq socket to port 5556")
+    socket.bind('tcp://*:%s' % '5556')
+    return context, socket
+
 
 class HandlerProcess(multiprocessing.Process):
     __version = "1.3"
@@ -25,7 +42,17 @@ class HandlerProcess(multiprocessing.Process):
                  data_dir,
                  csv=False,
                  chunked=False,
-                 chunk_minutes=10):
+                 chunk_minutes=10,
+                 batch_size=1,
+                 batch_latency=0.1,
+                 publish=True,
+                 catch_up='burst',
+                 cpus=None,
+                 timestamps='realtime',
+                 anchor_interval=10.0,
+                 file_format='0.4',
+                 block_rows=BLOCK_ROWS,
+                 quantization=None):
         multiprocessing.Process.__init__(self)
         self.logger = logging.getLogger(__name__)
         self.logger.debug("Initializing HandlerProcess")
@@ -41,6 +68,34 @@ class HandlerProcess(multiprocessing.Process):
         self.data_dir = data_dir
         self.chunked = chunked
         self.chunk_minutes = chunk_minutes
+        # maximum number of samples per zmq message, 1 publishes every
+        # sample in its own message
+        self.batch_size = batch_size
+        # maximum time in seconds to wait for a wake-up from the
+        # PollingProcess before draining the ring anyway
+        self.batch_latency = batch_latency
+        # publish the samples on zmq in addition to writing the files,
+        # a StreamProcess can be attached to the ring instead
+        self.publish = publish
+        # CPUs the process is pinned to, None keeps the inherited affinity
+        self.cpus = cpus
+        # with monotonic timestamps pairs of monotonic and wall clock time
+        # are written to a file next to each measurement file every
+        # anchor_interval seconds
+        self.monotonic = timestamps == 'monotonic'
+        self.anchor_interval = anchor_interval
+        self.anchors = None
+        # format 0.5 writes compressed blocks of block_rows samples, the
+        # values of the axis in quantization are rounded to multiples of
+        # the given step
+        if file_format not in FILE_FORMATS:
+            raise ValueError("Unknown file format \"{}\", expected one "
+                             "of {}".format(file_format, FILE_FORMATS))
+        self.block_format = file_format == '0.5'
+        self.block_rows = block_rows
+        quantization = quantization or {}
+        self.quantization = [0.0] + [quantization.get(a, 0.0) for a in axis]
+        self.clock_offset = 0.0
         self.exitEvent = multiprocessing.Event()
         self.metadata = {
             "devicename": "Raspberry Pi 3 Model B+",
@@ -53,23 +108,22 @@ class HandlerProcess(multiprocessing.Process):
             "delay": 0,
             "range": 0,
             "resolution": 0,
-            "power": 0
+            "power": 0,
+            "catch_up": catch_up,
+            "timestamps": timestamps
         }
+        if self.chunked:
+            self.metadata["chunk_minutes"] = self.chunk_minutes
 
         self.units = ['dt64'] + sensor.units(axis)
         self.column_names = ['time'] + self.axis
-        date_float = time.time()
-        self.file_header = generate_binary_header(
-            date_float, self.metadata, self.fmt, self.units, self.column_names)
         self.nodename = os.uname().nodename
 
         self.mmap_file = mmap_file
         self.buffer_size = buffer_size
-        self.fd = os.open(self.mmap_file, os.O_RDONLY)
-        self.buf = mmap.mmap(self.fd, self.buffer_size, mmap.MAP_SHARED, mmap.PROT_READ)
-        self.start_offset = struct.calcsize(ctypes.c_int._type_)
         self.data_size = struct.calcsize(self.fmt)
-        self.ring_size = (self.buffer_size - self.start_offset) // self.data_size
+        self.ring = RingReader(self.mmap_file, self.buffer_size,
+                               self.data_size)
 
         self.logger.debug("Finished initialization of HandlerProcess")
 
@@ -77,52 +131,191 @@ class HandlerProcess(multiprocessing.Process):
         self.measurement_name = measurement_name
 
     def run(self):
-        self.logger.debug("Setting up zmq context")
-        self.context = zmq.Context()
-        self.logger.debug("Setting up zmq socket")
-        self.socket = self.context.socket(zmq.PUB)
-        self.logger.debug("Binding zmq socket to port 5556")
-        self.socket.bind('tcp://*:%s' % '5556')
+        if self.cpus:
+            self.logger.info("Handler process of sensor \"{}\" runs on CPUs {}".format(
+                self.sensor_name, set_affinity(self.cpus)))
+        socket = None
+        if self.publish:
+            self.context, socket = bind_publisher(self.logger)
+
+        self.attach(socket)
+        self.logger.debug("Entering handler loop")
+        while not self.exitEvent.is_set():
+            self.poll()
+            self.ring.wait(self.batch_latency)
+        # store the samples written while waiting
+        self.poll()
+        self.detach()
+
+    def attach(self, socket=None):
+        """Opens the measurement file and attaches to the ring buffer.
+
+        :param socket: zmq socket to publish the samples on (optional)
+        """
+        self.socket = socket
+        self.file = None
+        self.chunk_end = None
+        if self.monotonic:
+            self._write_anchor()
+        if not self.chunked:
+            self.file = self._open_file(time.time())
+        self.ring.attach()
 
+    def detach(self):
+        self.ring.detach()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.anchors is not None:
+            self.anchors.close()
+            self.anchors = None
 
-        filetimestamp = time.strftime('%Y-%m-%d-%H-%M-%S')
+    def poll(self):
+        """Drains the ring buffer and records a clock anchor when due."""
+        self.ring.read(self._drain)
+        if (self.monotonic and
+                time.clock_gettime(time.CLOCK_MONOTONIC) >= self.next_anchor):
+            self._write_anchor()
 
-        #filename = "_".join((self.measurement_name, self.sensor_name, filetimestamp)) + '.csv'
+    def _write_anchor(self):
+        """Reads the monotonic clock in between two readings of the wall
+        clock and writes the pair to the anchor file.
+        """
+        before = time.time()
+        monotonic = time.clock_gettime(time.CLOCK_MONOTONIC)
+        realtime = (before + time.time()) / 2
+        self.clock_offset = realtime - monotonic
+        self.next_anchor = monotonic + self.anchor_interval
+        if self.anchors is not None:
+            self.anchors.write("{:.9f} {:.9f}\n".format(monotonic, realtime))
+            self.anchors.flush()
+
+    def _drain(self, start, stop):
+        """Writes the contiguous ring slots [start, stop) with one write
+        call per file and publishes them in batches of batch_size samples.
+        """
+        view = memoryview(self.ring.buf)
+        while start < stop:
+            split = stop
+            if self.chunked:
+                timestamp = self.ring.timestamp(start)
+                if self.chunk_end is None or timestamp >= self.chunk_end:
+                    if self.file is not None:
+                        self.file.close()
+                    # chunks are aligned on the wall clock
+                    walltime = timestamp + self.clock_offset
+                    self.chunk_end = self._chunk_end(walltime) - self.clock_offset
+                    self.file = self._open_file(walltime)
+                split = self._find_chunk_split(start, stop)
+            first = self.ring.offset(start)
+            last = self.ring.offset(split)
+            self.file.write(view[first:last])
+            if self.socket is not None:
+                step = self.batch_size * self.data_size
+                for offset in range(first, last, step):
+                    self.socket.send(view[offset:min(offset + step, last)])
+            start = split
+
+    def _find_chunk_split(self, start, stop):
+        """returns the first slot in [start, stop) with a timestamp after
+        the end of the current chunk, or stop
+        """
+        while start < stop:
+            mid = (start + stop) // 2
+            if self.ring.timestamp(mid) < self.chunk_end:
+                start = mid + 1
+            else:
+                stop = mid
+        return start
+
+    def _chunk_end(self, timestamp):
+        """returns the end of the chunk containing timestamp. Chunks are
+        aligned to multiples of chunk_minutes on the wall clock.
+        """
+        chunk_seconds = self.chunk_minutes * 60
+        return (timestamp // chunk_seconds + 1) * chunk_seconds
+
+    def _open_file(self, timestamp):
+        filetimestamp = time.strftime('%Y-%m-%d-%H-%M-%S',
+                                      time.localtime(timestamp))
         filename = self.nodename + '_' + self.measurement_name + '_' + self.sensor_name + '_' + filetimestamp + '.bin'
         filename = os.path.join(self.data_dir, filename)
+        f = open(filename, 'wb')
+        if self.block_format:
+            f.write(generate_binary_header(
+                timestamp, self.metadata, self.fmt, self.units,
+                self.column_names, BLOCK_VERSION))
+            f.write(block_header_extension(self.fmt, self.block_rows,
+                                           self.quantization))
+            f = BlockFile(f, self.fmt, self.block_rows, self.quantization)
+        else:
+            f.write(generate_binary_header(
+                timestamp, self.metadata, self.fmt, self.units,
+                self.column_names))
+        self.logger.info("Starting file \"{}\"".format(filename))
+        if self.monotonic:
+            if self.anchors is not None:
+                self.anchors.close()
+            self.anchors = open(filename + ANCHOR_SUFFIX, 'w')
+            self.anchors.write("# monotonic realtime\n")
+            self._write_anchor()
+        return f
 
-        old_index = 0
-        self.logger.debug("Entering handler loop")
+    def shutdown(self):
+        self.logger.debug("shutdown() called")
+        self.exitEvent.set()
+
+
+class GroupHandlerProcess(multiprocessing.Process):
+    """Writes the measurement files of a group of sensors polled by a
+    GroupPollingProcess.
+
+    The members are HandlerProcess instances which are never started
+    themselves, this process drains all of their ring buffers. Members
+    publishing on zmq share a single socket. The CPU affinity of the first
+    member applies to the whole group.
+
+    :param catch_up: catch up policy applied by the GroupPollingProcess,
+                     recorded in the metadata of all member files
+    """
+    __version = "1.0"
+
+    def __init__(self, members, catch_up=None):
+        multiprocessing.Process.__init__(self)
+        self.logger = logging.getLogger(__name__)
+        self.logger.debug("Initializing GroupHandlerProcess")
+        self.members = members
+        if catch_up is not None:
+            for member in members:
+                member.metadata["catch_up"] = catch_up
+        self.publish = any(member.publish for member in members)
+        self.batch_latency = min(member.batch_latency for member in members)
+        self.cpus = members[0].cpus
+        self.exitEvent = multiprocessing.Event()
+
+    def setMeasurementName(self, measurement_name):
+        for member in self.members:
+            member.setMeasurementName(measurement_name)
+
+    def run(self):
+        if self.cpus:
+            self.logger.info("Group handler process runs on CPUs {}".format(
+                set_affinity(self.cpus)))
+        socket = None
+        if self.publish:
+            self.context, socket = bind_publisher(self.logger)
+
+        for member in self.members:
+            member.attach(socket if member.publish else None)
+        readers = [member.ring for member in self.members]
+        self.logger.debug("Entering group handler loop")
         while not self.exitEvent.is_set():
-            with open(filename, 'wb') as f:
-                f.write(self.file_header)
-                self.logger.info("Starting file \"{}\"".format(filename))
-                while True:
-                    index = struct.unpack('i', self.buf[0:4])[0]
-                    buffer_range = range(0)
-                    #if old_index > index:
-                    #    buffer_range = range(old_index, self.ring_size)
-                    #    old_index = 0
-                    #elif index > old_index:
-                    #    buffer_range = range(old_index, index+1)
-                    #    old_index = index + 1
-                    if old_index == index:
-                        buffer_range = range(0)
-                    elif old_index < index:
-                        buffer_range = range(old_index, index)
-                        old_index = index
-                    else:
-                        buffer_range = range(old_index, self.ring_size)
-                        old_index = 0
-                    # process buffer slice
-                    for i in buffer_range:
-                        offset = self.start_offset + i * self.data_size
-                        sample = self.buf[offset:offset+self.data_size]
-                        f.write(sample)
-                        self.socket.send(sample)
-                    if self.exitEvent.is_set():
-                        break
-                    time.sleep(0.001)
+            for member in self.members:
+                member.poll()
+            wait_any(readers, self.batch_latency)
+        for member in self.members:
+            member.poll()
+            member.detach()
 
     def shutdown(self):
         self.logger.debug("shutdown() called")
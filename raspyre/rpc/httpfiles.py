@@ -0,0 +1,319 @@
+"""HTTP helpers for the file downloads of the RPC servers.
+
+Both the threaded and the asyncio server answer GET requests for data
+files through :py:func:`file_response`, which implements ETags,
+conditional requests and single byte ranges, so interrupted downloads of
+large measurement files can be resumed.
+
+Files are compressed with gzip or zstd if the client accepts it. The
+compressed form of files that are no longer written to is cached in a
+hidden sibling file, so it is computed once and can be downloaded with
+byte ranges like the file itself. Files still being written are
+compressed while they are sent. Clients that accept the content coding
+``x-raspyre-delta`` additionally receive Raspyre binary files through
+:py:func:`raspyre.storage.delta_filter` before compression, which has to
+be reverted with :py:func:`raspyre.storage.delta_unfilter` after
+decompression.
+"""
+import email.utils
+import importlib.util
+import logging
+import os
+import re
+import tempfile
+import time
+import zlib
+
+from .. import storage
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+# supported compressions in the order of preference
+ENCODINGS = ('zstd', 'gzip')
+DELTA_ENCODING = 'x-raspyre-delta'
+# suffixes of the cached siblings
+SUFFIXES = {'zstd': 'zst', 'gzip': 'gz', DELTA_ENCODING: 'delta'}
+# files not modified for this many seconds are considered finalized
+FINALIZED_AGE = 60
+CHUNK_SIZE = 1 << 20
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+logger = logging.getLogger(__name__)
+
+
+class FileResponse(object):
+    """Status, headers and byte range of the answer to a file request.
+
+    :ivar status: HTTP status code
+    :ivar start: offset of the first byte to send
+    :ivar length: number of bytes to send, None if the body is generated
+                  by stream
+    :ivar headers: list of (name, value) response headers
+    :ivar stream: generator of the body compressed while it is sent
+    """
+
+    def __init__(self, status, start, length, headers, stream=None):
+        self.status = status
+        self.start = start
+        self.length = length
+        self.headers = headers
+        self.stream = stream
+
+
+def etag(stat):
+    """returns a strong ETag derived from the size and mtime of a file"""
+    return '"{:x}-{:x}"'.format(stat.st_size, stat.st_mtime_ns)
+
+
+def parse_range(header, size):
+    """parses the value of a Range header for a file of size bytes.
+
+    Only single ranges are supported, other range headers are ignored as
+    allowed by RFC 7233.
+
+    :returns: (start, stop) of the requested bytes, None to send the whole
+              file or False if the range can not be satisfied
+    """
+    match = RANGE_PATTERN.match(header.strip().replace(' ', ''))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: the last bytes of the file
+        start = max(size - int(last), 0)
+        stop = size
+    else:
+        start = int(first)
+        stop = size if not last else min(int(last) + 1, size)
+        if last and int(last) < start:
+            return None
+    if start >= stop:
+        return False
+    return start, stop
+
+
+def file_response(stat, headers, content_type, codings=()):
+    """answers a GET or HEAD request for a file.
+
+    :param stat: os.stat_result of the file
+    :param headers: request headers, a mapping with lower case keys
+    :param content_type: MIME type of the file
+    :param codings: content codings the file was encoded with
+    :returns: :py:class:`FileResponse`
+    """
+    size = stat.st_size
+    tag = etag(stat)
+    last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+    response_headers = [('Content-Type', content_type),
+                        ('Last-Modified', last_modified),
+                        ('ETag', tag),
+                        ('Accept-Ranges', 'bytes'),
+                        ('Vary', 'Accept-Encoding')]
+    if codings:
+        response_headers.append(('Content-Encoding', ', '.join(codings)))
+
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None and (
+            if_none_match.strip() == '*' or
+            tag in [t.strip() for t in if_none_match.split(',')]):
+        return FileResponse(304, 0, 0, response_headers)
+
+    range_header = headers.get('range')
+    if_range = headers.get('if-range')
+    if range_header is not None and (
+            if_range is None or if_range.strip() in (tag, last_modified)):
+        byte_range = parse_range(range_header, size)
+        if byte_range is False:
+            response_headers.append(('Content-Range', 'bytes */{}'.format(size)))
+            return FileResponse(416, 0, 0, response_headers)
+        if byte_range is not None:
+            start, stop = byte_range
+            response_headers.append(('Content-Range', 'bytes {}-{}/{}'.format(
+                start, stop - 1, size)))
+            return FileResponse(206, start, stop - start, response_headers)
+    return FileResponse(200, 0, size, response_headers)
+
+
+def accepted_encodings(header):
+    """parses the value of an Accept-Encoding header.
+
+    :returns: dictionary of the content codings and their q values
+    """
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def available(coding):
+    """returns True if the compression can be used on this node"""
+    if coding == 'zstd':
+        return importlib.util.find_spec('zstandard') is not None
+    return coding in ENCODINGS
+
+
+def is_binary_file(filename):
+    """returns True for binary files with raw rows (version 0.4)"""
+    try:
+        with open(filename, 'rb') as f:
+            return f.read(4) == b'\xeb\xff\x00\x04'
+    except IOError:
+        return False
+
+
+def negotiate(headers, filename):
+    """selects the content codings of a file download.
+
+    :param headers: request headers, a mapping with lower case keys
+    :param filename: requested file
+    :returns: list of the content codings in the order they are applied,
+              empty to send the file as it is
+    """
+    accepted = accepted_encodings(headers.get('accept-encoding', ''))
+    for coding in ENCODINGS:
+        if accepted.get(coding, accepted.get('*', 0)) > 0 and available(coding):
+            break
+    else:
+        return []
+    # the filter alone does not make the file smaller
+    if accepted.get(DELTA_ENCODING, 0) > 0 and is_binary_file(filename):
+        return [DELTA_ENCODING, coding]
+    return [coding]
+
+
+def compressor(coding):
+    """returns a compression object with compress() and flush() methods"""
+    if coding == 'gzip':
+        return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    import zstandard
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+
+def read_chunks(filename, chunk_size=CHUNK_SIZE):
+    with open(filename, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def encode(filename, codings):
+    """generates the content of a file encoded with the content codings
+    returned by :py:func:`negotiate`.
+    """
+    if codings[0] == DELTA_ENCODING:
+        chunks = storage.delta_filter(filename)
+    else:
+        chunks = read_chunks(filename)
+    compress = compressor(codings[-1])
+    for chunk in chunks:
+        data = compress.compress(chunk)
+        if data:
+            yield data
+    yield compress.flush()
+
+
+def cache_path(filename, codings):
+    directory, name = os.path.split(filename)
+    return os.path.join(directory, ".{}.{}".format(
+        name, ".".join(SUFFIXES[coding] for coding in codings)))
+
+
+def remove_cached(filename):
+    """removes the cached encoded siblings of a file"""
+    for coding in ENCODINGS:
+        for codings in ([coding], [DELTA_ENCODING, coding]):
+            try:
+                os.remove(cache_path(filename, codings))
+            except OSError:
+                pass
+
+
+def cached_encoding(filename, codings, stat):
+    """returns the cached encoded sibling of a file, which is written if it
+    does not exist or the file was modified since.
+
+    The sibling gets the modification time of the file, which marks it up
+    to date.
+
+    :param stat: os.stat_result of the file
+    :returns: the path of the sibling or None if it could not be written
+    """
+    path = cache_path(filename, codings)
+    try:
+        if os.stat(path).st_mtime_ns == stat.st_mtime_ns:
+            return path
+    except OSError:
+        pass
+    directory, name = os.path.split(path)
+    try:
+        fd, temp_path = tempfile.mkstemp(prefix=name, dir=directory)
+    except OSError:
+        logger.warning("Could not cache {}".format(path), exc_info=True)
+        return None
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for data in encode(filename, codings):
+                f.write(data)
+        if os.stat(filename).st_mtime_ns != stat.st_mtime_ns:
+            # written to while it was compressed
+            os.remove(temp_path)
+            return None
+        os.utime(temp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(temp_path, path)
+    except Exception:
+        logger.warning("Could not cache {}".format(path), exc_info=True)
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return None
+    return path
+
+
+def open_file(filename, headers, content_type):
+    """opens a file to answer a GET or HEAD request.
+
+    If the client accepts a compression, the cached sibling of a finalized
+    file is opened instead, the response to other files carries a stream
+    of the compressed content and has no length.
+
+    :param filename: requested file
+    :param headers: request headers, a mapping with lower case keys
+    :param content_type: MIME type of the file
+    :returns: (open file, :py:class:`FileResponse`), the file is sent by
+              the caller unless the response has a stream
+    :raises IOError: if the file can not be opened
+    """
+    f = open(filename, 'rb')
+    stat = os.fstat(f.fileno())
+    codings = negotiate(headers, filename)
+    if not codings:
+        return f, file_response(stat, headers, content_type)
+    path = None
+    if time.time() - stat.st_mtime >= FINALIZED_AGE:
+        path = cached_encoding(filename, codings, stat)
+    if path is None:
+        response_headers = [('Content-Type', content_type),
+                            ('Vary', 'Accept-Encoding'),
+                            ('Content-Encoding', ', '.join(codings))]
+        return f, FileResponse(200, 0, None, response_headers,
+                               encode(filename, codings))
+    f.close()
+    f = open(path, 'rb')
+    return f, file_response(os.fstat(f.fileno()), headers, content_type,
+                            codings)
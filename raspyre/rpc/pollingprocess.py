@@ -1,4 +1,6 @@
 from .writer import generate_binary_header
+from .ringbuffer import RingHeader, RingNotifier, histogram_bin
+from .affinity import set_affinity
 import multiprocessing
 import logging
 #import arrow
@@ -28,6 +30,113 @@ MCL_CURRENT = ctypes.c_int(1)
 MCL_FUTURE = ctypes.c_int(2)
 SCHED_FIFO = ctypes.c_int(1)
 
+# handling of periods whose deadline passed before the process woke up:
+# burst reads the missed samples back to back, skip reads one late sample
+# and continues on the original grid, resync drops the late sample and
+# waits for the next grid point
+CATCH_UP_POLICIES = ('burst', 'skip', 'resync')
+# clock of the sample timestamps: realtime keeps the timestamps taken by
+# the sensor, monotonic replaces them by the deadline of the period
+TIMESTAMP_CLOCKS = ('realtime', 'monotonic')
+NSEC_PER_SEC = 1000 * 1000 * 1000
+
+
+def enable_realtime(logger, priority):
+    """Switches the calling process to SCHED_FIFO with the given priority,
+    disables the garbage collector and locks all memory pages.
+
+    :returns: True on success
+    """
+    logger.debug("Setting Real Time Process Priority")
+    scheduling_param = Sched_Param()
+    scheduling_param.sched_priority = priority
+    ret = librt.sched_setscheduler(0, SCHED_FIFO, ctypes.byref(scheduling_param))
+    if ret != 0:
+        logger.error("Could not set process priority! Exiting!")
+        logger.error("(Are the user/process rights set correctly?)")
+        return False
+    logger.debug("rt_priority set successfull")
+
+    logger.debug("Disabling garbage collection for polling process")
+    gc.disable()
+
+    logger.debug("Locking memory pages for polling process")
+    ret = librt.mlockall(MCL_CURRENT.value | MCL_FUTURE.value)
+    logger.debug("mlockall() returned {}".format(ret))
+    if ret == -1:
+        logger.error("Error during mlockall()! Check user/process rights.")
+        gc.enable()
+        return False
+    return True
+
+
+def timespec_ns(timespec):
+    return timespec.tv_sec * NSEC_PER_SEC + timespec.tv_nsec
+
+
+def advance(deadline, nanoseconds):
+    # computed outside of the structure, tv_nsec is 32 bit on the Pi
+    nsec = deadline.tv_nsec + nanoseconds
+    if nsec >= NSEC_PER_SEC:
+        deadline.tv_sec += nsec // NSEC_PER_SEC
+        nsec %= NSEC_PER_SEC
+    deadline.tv_nsec = nsec
+
+
+def catch_up(policy, deadline, woken, delay, timings):
+    """Records the wake-up lateness and applies the catch up policy if
+    the process woke up after the deadline of the following period.
+
+    :param timings: TimingStats of the sensors polled in this period
+    :returns: False if no sample is to be read in this period
+    """
+    lateness = max(timespec_ns(woken) - timespec_ns(deadline), 0)
+    bin_ = histogram_bin(lateness)
+    for timing in timings:
+        timing.lateness[bin_] += 1
+        if lateness > timing.max_lateness_ns:
+            timing.max_lateness_ns = lateness
+    if lateness < delay:
+        return True
+    if policy == 'burst':
+        # the missed periods follow as late periods of their own, each of
+        # them counts once
+        for timing in timings:
+            timing.skipped_periods += 1
+        return True
+    missed = lateness // delay
+    # resync drops the late period as well
+    skipped = missed + (policy == 'resync')
+    now = time.time()
+    for timing in timings:
+        timing.skipped_periods += skipped
+        timing.gaps += 1
+        timing.last_gap_time = now
+    # move the deadline to the last grid point before the wake-up
+    advance(deadline, missed * delay)
+    return policy == 'skip'
+
+
+def group_divisors(frequencies):
+    """returns the ratio of the highest frequency of a sensor group to the
+    frequency of each sensor, i.e. a sensor is read on every n-th tick of
+    the group schedule.
+
+    :param frequencies: dictionary of sensor name and frequency
+    :returns: dictionary of sensor name and divisor
+    :raises ValueError: if a frequency is no integer divisor of the
+                        highest one
+    """
+    highest = max(frequencies.values())
+    divisors = {}
+    for name, frequency in frequencies.items():
+        divisor = highest / frequency
+        if abs(divisor - round(divisor)) > 1e-9:
+            raise ValueError(
+                "Frequency {} of sensor \"{}\" is no integer divisor of "
+                "the group frequency {}".format(frequency, name, highest))
+        divisors[name] = int(round(divisor))
+    return divisors
 
 
 class PollingProcess(multiprocessing.Process):
@@ -44,7 +153,12 @@ class PollingProcess(multiprocessing.Process):
                  mmap_file,
                  buffer_size,
                  chunked=False,
-                 chunk_minutes=10):
+                 chunk_minutes=10,
+                 notify_every=None,
+                 block_size=1,
+                 catch_up='burst',
+                 cpus=None,
+                 timestamps='realtime'):
         multiprocessing.Process.__init__(self)
         self.logger = logging.getLogger(__name__)
         self.logger.debug("Initializing polling process")
@@ -59,9 +173,6 @@ class PollingProcess(multiprocessing.Process):
         self.fmt = "d" + "".join(sensor.struct_fmt(axis))
         self.struct = struct.Struct(self.fmt)
         self.exitEvent = multiprocessing.Event()
-        self.logger.debug("Preparing rt capabilities")
-        self.scheduling_param = Sched_Param()
-        self.scheduling_param.sched_priority = self.PROCESS_PRIORITY
         self.buffer_size = buffer_size
         self.mmap_file = mmap_file
         self.logger.debug("Opening shared memory buffer {}".format(self.mmap_file))
@@ -74,70 +185,241 @@ class PollingProcess(multiprocessing.Process):
         assert ret == self.buffer_size
         self.buf = mmap.mmap(self.fd, self.buffer_size, mmap.MAP_SHARED, mmap.PROT_WRITE | mmap.PROT_READ)
 
-        self.index = ctypes.c_int.from_buffer(self.buf)
-        self.start_offset = struct.calcsize(self.index._type_)
+        self.header = RingHeader.from_buffer(self.buf)
+        self.start_offset = ctypes.sizeof(RingHeader)
         self.data_size = struct.calcsize(self.fmt)
         self.ring_size = (self.buffer_size - self.start_offset) // self.data_size
         self.logger.debug("PollingProcess ring size: {}".format(self.ring_size))
+        # wake up the consumer about every 10 ms unless configured otherwise
+        if notify_every is None:
+            notify_every = max(int(self.frequency) // 100, 1)
+        self.notifier = RingNotifier(self.mmap_file, self.header,
+                                     notify_every)
+        # number of samples fetched per wake-up from sensors implementing
+        # the burst interface Sensor.getRecords()
+        self.block_size = 1
+        if block_size > 1:
+            if sensor.supportsBlockRead():
+                self.block_size = min(int(block_size), self.ring_size // 2)
+            else:
+                self.logger.warning(
+                    "Sensor \"{}\" does not support block reads, "
+                    "polling single samples".format(sensor_name))
+
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError("Unknown catch up policy \"{}\", expected one "
+                             "of {}".format(catch_up, CATCH_UP_POLICIES))
+        self.catch_up = catch_up
+        # CPUs the process is pinned to, None keeps the inherited affinity
+        self.cpus = cpus
+        if timestamps not in TIMESTAMP_CLOCKS:
+            raise ValueError("Unknown timestamp clock \"{}\", expected one "
+                             "of {}".format(timestamps, TIMESTAMP_CLOCKS))
+        self.monotonic = timestamps == 'monotonic'
+        self.stamp = struct.Struct('d')
+        self.timing = self.header.timing
+        # timestamps of the end of the sensor read and of the end of the
+        # period for the timing statistics
+        self.acquired = Timespec()
+        self.written = Timespec()
+        self.counter = 0
 
     def setMeasurementName(self, measurement_name):
         self.measurement_name = measurement_name
 
     def run(self):
-        self.logger.debug("Setting Real Time Process Priority")
-        #self.scheduler.set_scheduler(self.PROCESS_PRIORITY)
-        ret = librt.sched_setscheduler(0, SCHED_FIFO, ctypes.byref(self.scheduling_param))
-        if ret != 0:
-            self.logger.error("Could not set process priority! Exiting!")
-            self.logger.error("(Are the user/process rights set correctly?)")
+        if self.cpus:
+            self.logger.info("Polling process of sensor \"{}\" runs on CPUs {}".format(
+                self.sensor_name, set_affinity(self.cpus)))
+        if not enable_realtime(self.logger, self.PROCESS_PRIORITY):
             return
-        self.logger.debug("rt_priority set successfull")
 
         deadline = Timespec()
-        s_nsec = 1000 * 1000 * 1000
-        delay = int(self.frequency_step * s_nsec)
-        counter = 0
-
-        self.logger.debug("Disabling garbage collection for polling process")
-        gc.disable()
-
-        self.logger.debug("Locking memory pages for polling process")
-        ret = librt.mlockall(MCL_CURRENT.value | MCL_FUTURE.value)
-        self.logger.debug("mlockall() returned {}".format(ret))
-        if ret == -1:
-            self.logger.error("Error during mlockall()! Check user/process rights.")
-            return
+        woken = Timespec()
+        delay = int(self.frequency_step * NSEC_PER_SEC * self.block_size)
+        timings = (self.timing,)
 
         self.logger.info(
             "Starting polling loop for sensor \"{}\"".format(self.sensor_name))
         librt.clock_gettime(CLOCK_MONOTONIC, ctypes.byref(deadline))
 
         while not self.exitEvent.is_set():
-            deadline.tv_nsec += delay
-            if deadline.tv_nsec >= s_nsec:
-                deadline.tv_nsec -= s_nsec
-                deadline.tv_sec += 1
+            advance(deadline, delay)
             ret = librt.clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, ctypes.byref(deadline), 0)
-            try:
-                record = self.sensor.getRecord(*self.axis)
-            except Exception as e:
-                self.logger.error("Fatal error during sensor.getRecord()", exc_info=True)
+            librt.clock_gettime(CLOCK_MONOTONIC, ctypes.byref(woken))
+            if not catch_up(self.catch_up, deadline, woken, delay, timings):
                 continue
-            data = struct.pack(self.fmt, record.values['time'], *[record[x] for x in self.axis])
-            offset = self.start_offset + counter % self.ring_size * self.data_size
-            self.buf.seek(offset)
-            self.buf.write(data)
-            counter += 1
-            self.index.value = counter % self.ring_size
-            #toc = time.clock_gettime(time.CLOCK_MONOTONIC)
+            self.poll(deadline, woken, delay)
 
         self.logger.debug("polling loop terminated. Cleaning up.")
         gc.enable()
-        os.close(self.fd)
-        os.remove(self.mmap_file)
+        self.close()
         self.logger.debug("Clean up successfull")
         return
 
+    def poll(self, deadline, started, delay):
+        """Reads the sample (or block of samples) of the current period into
+        the ring buffer and updates the timing statistics.
+
+        :param deadline: Timespec of the deadline of the period
+        :param started: Timespec of the start of the read
+        :param delay: length of the period in nanoseconds
+        """
+        if self.block_size > 1:
+            self._read_block(deadline)
+        else:
+            offset = self.start_offset + self.counter % self.ring_size * self.data_size
+            try:
+                self.sensor.read_into(self.buf, offset, self.struct, *self.axis)
+            except Exception as e:
+                self.logger.error("Fatal error during sensor.read_into()", exc_info=True)
+                return
+            librt.clock_gettime(CLOCK_MONOTONIC, ctypes.byref(self.acquired))
+            if self.monotonic:
+                self.stamp.pack_into(self.buf, offset,
+                                     timespec_ns(deadline) / NSEC_PER_SEC)
+            self.counter += 1
+            self.header.write_seq = self.counter
+            self.header.index = self.counter % self.ring_size
+            self.notifier.post()
+        self._record_timing(deadline, started, delay)
+
+    def close(self):
+        """Releases the ring buffer of the process."""
+        self.notifier.close()
+        os.close(self.fd)
+        os.remove(self.mmap_file)
+
+    def _read_block(self, deadline):
+        """Fetches up to block_size samples from the sensor's FIFO and
+        publishes them to the consumers at once. With monotonic timestamps
+        the samples are stamped backwards from the deadline.
+        """
+        try:
+            rows = self.sensor.getRecords(self.block_size, *self.axis)
+        except Exception as e:
+            self.logger.error("Fatal error during sensor.getRecords()", exc_info=True)
+            return
+        librt.clock_gettime(CLOCK_MONOTONIC, ctypes.byref(self.acquired))
+        deadline_s = timespec_ns(deadline) / NSEC_PER_SEC
+        for i, row in enumerate(rows):
+            offset = self.start_offset + self.counter % self.ring_size * self.data_size
+            self.struct.pack_into(self.buf, offset, *row)
+            if self.monotonic:
+                self.stamp.pack_into(
+                    self.buf, offset,
+                    deadline_s - (len(rows) - 1 - i) * self.frequency_step)
+            self.counter += 1
+        # publish the block before waking up the consumers, they drain up
+        # to write_seq only
+        self.header.write_seq = self.counter
+        self.header.index = self.counter % self.ring_size
+        if rows:
+            self.notifier.post(len(rows))
+
+    def _record_timing(self, deadline, started, delay):
+        """Updates the timing statistics in the ring buffer header with
+        the timestamps of the current period.
+        """
+        librt.clock_gettime(CLOCK_MONOTONIC, ctypes.byref(self.written))
+        acquired_ns = timespec_ns(self.acquired)
+        written_ns = timespec_ns(self.written)
+        timing = self.timing
+        timing.periods += 1
+        timing.acquisition[histogram_bin(max(acquired_ns - timespec_ns(started), 0))] += 1
+        timing.write[histogram_bin(max(written_ns - acquired_ns, 0))] += 1
+        if written_ns > timespec_ns(deadline) + delay:
+            timing.deadline_misses += 1
+
+    def shutdown(self):
+        self.logger.info("shutdown() called. Setting exit event.")
+        self.exitEvent.set()
+
+
+class GroupPollingProcess(multiprocessing.Process):
+    """Polls the sensors of several PollingProcess instances from a single
+    real time process.
+
+    The members are created as usual but never started, this process
+    reads their sensors into their ring buffers instead. All members share
+    the schedule of the fastest member: every member is read on every
+    n-th tick, where n is the ratio of the fastest frequency to its own,
+    so the frequencies have to be integer divisors of the fastest one.
+    Within a tick the members are read in rate monotonic order, i.e. the
+    member with the shortest period first. The catch up policy and the
+    CPU affinity of the fastest member apply to the whole group.
+    """
+    __version = "1.0"
+    PROCESS_PRIORITY = PollingProcess.PROCESS_PRIORITY
+
+    def __init__(self, members):
+        multiprocessing.Process.__init__(self)
+        self.logger = logging.getLogger(__name__)
+        self.logger.debug("Initializing group polling process")
+
+        self.members = sorted(members, key=lambda member: member.frequency,
+                              reverse=True)
+        self.frequency = self.members[0].frequency
+        self.catch_up = self.members[0].catch_up
+        self.cpus = self.members[0].cpus
+        divisors = group_divisors(
+            {member.sensor_name: member.frequency for member in self.members})
+        self.divisors = [divisors[member.sensor_name]
+                         for member in self.members]
+        for member in self.members:
+            if member.block_size > 1:
+                self.logger.warning(
+                    "Block reads are not supported in sensor groups, polling "
+                    "single samples of sensor \"{}\"".format(member.sensor_name))
+                member.block_size = 1
+        self.exitEvent = multiprocessing.Event()
+
+    def setMeasurementName(self, measurement_name):
+        for member in self.members:
+            member.setMeasurementName(measurement_name)
+
+    def due(self, tick):
+        """returns the members to be read in the given tick of the group
+        schedule in rate monotonic order
+        """
+        return [member for member, divisor in zip(self.members, self.divisors)
+                if tick % divisor == 0]
+
+    def run(self):
+        if self.cpus:
+            self.logger.info("Group polling process runs on CPUs {}".format(
+                set_affinity(self.cpus)))
+        if not enable_realtime(self.logger, self.PROCESS_PRIORITY):
+            return
+
+        deadline = Timespec()
+        woken = Timespec()
+        delay = int(NSEC_PER_SEC / self.frequency)
+        timings = [member.timing for member in self.members]
+
+        self.logger.info("Starting group polling loop for sensors {}".format(
+            ", ".join(member.sensor_name for member in self.members)))
+        librt.clock_gettime(CLOCK_MONOTONIC, ctypes.byref(deadline))
+        start_ns = timespec_ns(deadline)
+
+        while not self.exitEvent.is_set():
+            advance(deadline, delay)
+            ret = librt.clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, ctypes.byref(deadline), 0)
+            librt.clock_gettime(CLOCK_MONOTONIC, ctypes.byref(woken))
+            if not catch_up(self.catch_up, deadline, woken, delay, timings):
+                continue
+            tick = (timespec_ns(deadline) - start_ns) // delay
+            started = woken
+            for member in self.due(tick):
+                member.poll(deadline, started, delay)
+                # the next read starts where the last one ended
+                started = member.written
+
+        self.logger.debug("group polling loop terminated. Cleaning up.")
+        gc.enable()
+        for member in self.members:
+            member.close()
+        self.logger.debug("Clean up successfull")
 
     def shutdown(self):
         self.logger.info("shutdown() called. Setting exit event.")
@@ -0,0 +1,356 @@
+"""Helpers for the shared memory ring buffer between the PollingProcess
+and its consumers.
+
+The ring buffer file starts with a :py:class:`RingHeader` followed by
+fixed size sample slots. The PollingProcess writes a sample into slot
+``write_seq % ring_size`` and increments ``write_seq`` afterwards. It
+never waits for a consumer: every consumer attaches to one of the
+:py:data:`MAX_READERS` reader slots of the header and keeps its own
+``read_seq`` there. The sequences never wrap, so a consumer that fell
+behind by more than the ring size can tell how many samples were
+overwritten.
+
+The PollingProcess wakes up sleeping consumers through one named pipe per
+reader slot next to the ring buffer file. Using named pipes instead of
+anonymous ones allows consumers to attach while the PollingProcess is
+already running.
+"""
+import ctypes
+import logging
+import mmap
+import os
+import select
+import struct
+
+MAX_READERS = 4
+# reader slot of the HandlerProcess writing the measurement files
+HANDLER_SLOT = 0
+# bin 0 of the timing histograms counts durations below 1 microsecond,
+# bin k durations of [2^(k-1), 2^k) microseconds, the last bin is open
+HISTOGRAM_BINS = 20
+
+
+class ReaderSlot(ctypes.Structure):
+    _fields_ = [
+        ('active', ctypes.c_int32),
+        ('reserved', ctypes.c_int32),
+        ('read_seq', ctypes.c_uint64),
+        ('overruns', ctypes.c_uint64),
+        ('lost', ctypes.c_uint64),
+        ('last_gap_time', ctypes.c_double),
+    ]
+
+
+class TimingStats(ctypes.Structure):
+    _fields_ = [
+        ('periods', ctypes.c_uint64),
+        # the work of a period ended after the following deadline
+        ('deadline_misses', ctypes.c_uint64),
+        # periods whose sample was not read in time because the wake-up
+        # was too late: read late by the burst catch up policy, left out
+        # by skip and resync
+        ('skipped_periods', ctypes.c_uint64),
+        # number of gaps in the sample stream and the wall clock time of
+        # the last one
+        ('gaps', ctypes.c_uint64),
+        ('last_gap_time', ctypes.c_double),
+        ('max_lateness_ns', ctypes.c_uint64),
+        # 64 bit bins like the period counter, 32 bits wrap within days
+        # at kHz rates
+        # time between the deadline and the wake-up
+        ('lateness', ctypes.c_uint64 * HISTOGRAM_BINS),
+        # duration of the sensor read
+        ('acquisition', ctypes.c_uint64 * HISTOGRAM_BINS),
+        # duration of publishing the sample to the consumers
+        ('write', ctypes.c_uint64 * HISTOGRAM_BINS),
+    ]
+
+
+def histogram_bin(nanoseconds):
+    return min((nanoseconds // 1000).bit_length(), HISTOGRAM_BINS - 1)
+
+
+class RingHeader(ctypes.Structure):
+    _fields_ = [
+        # slot following the last written sample, still updated by the
+        # producer and reported by get_buffer_stats. Only the field is
+        # kept: the slots start after the whole header, consumers of the
+        # old layout with the slots right after the index cannot read
+        # this ring.
+        ('index', ctypes.c_int32),
+        ('reserved', ctypes.c_int32),
+        # written by the producer
+        ('write_seq', ctypes.c_uint64),
+        # each written by the attached consumer only
+        ('readers', ReaderSlot * MAX_READERS),
+        # written by the producer
+        ('timing', TimingStats),
+    ]
+
+
+def read_sequence(struct_, field):
+    """Reads a 64 bit sequence written by another process.
+
+    The two halves are not written atomically on 32 bit ARM, so the value
+    is read until two subsequent reads agree.
+    """
+    value = getattr(struct_, field)
+    while True:
+        check = getattr(struct_, field)
+        if check == value:
+            return value
+        value = check
+
+
+def read_header(mmap_file):
+    """Returns a dictionary with the header fields of a ring buffer file.
+    The reader slots are returned as a list of dictionaries of the active
+    readers.
+    """
+    with open(mmap_file, 'rb') as f:
+        data = f.read(ctypes.sizeof(RingHeader))
+    header = RingHeader.from_buffer_copy(data)
+    readers = []
+    for slot, reader in enumerate(header.readers):
+        if reader.active:
+            stats = {name: getattr(reader, name)
+                     for name, _ in ReaderSlot._fields_
+                     if name not in ('active', 'reserved')}
+            stats['slot'] = slot
+            readers.append(stats)
+    return {'index': header.index,
+            'write_seq': header.write_seq,
+            'readers': readers}
+
+
+def read_timing(mmap_file):
+    """Returns a dictionary of the timing statistics of the producer of a
+    ring buffer file. The histograms are returned as lists together with
+    the bin edges in microseconds.
+    """
+    with open(mmap_file, 'rb') as f:
+        data = f.read(ctypes.sizeof(RingHeader))
+    timing = RingHeader.from_buffer_copy(data).timing
+    stats = {}
+    for name, type_ in TimingStats._fields_:
+        value = getattr(timing, name)
+        stats[name] = list(value) if hasattr(type_, '_length_') else value
+    stats['bin_edges_us'] = [0] + [2 ** k for k in range(HISTOGRAM_BINS - 1)]
+    return stats
+
+
+def notify_path(mmap_file, slot):
+    return '{}.notify{}'.format(mmap_file, slot)
+
+
+class RingNotifier(object):
+    """Producer side of the wake-up mechanism.
+
+    :py:meth:`post` is called after publishing written samples and writes
+    a byte to the pipe of every active reader slot every `every` samples.
+    The pipes are opened lazily, samples written before a consumer waits
+    on its pipe do not block the producer.
+    """
+
+    def __init__(self, mmap_file, header, every=1):
+        self.paths = [notify_path(mmap_file, slot)
+                      for slot in range(MAX_READERS)]
+        self.header = header
+        self.every = max(int(every), 1)
+        self.pending = 0
+        self.fds = [None] * MAX_READERS
+
+    def post(self, count=1):
+        """Counts count published samples and wakes up the consumers if
+        `every` samples are pending.
+        """
+        self.pending += count
+        if self.pending < self.every:
+            return
+        self.pending = 0
+        for slot in range(MAX_READERS):
+            if self.header.readers[slot].active:
+                self._notify(slot)
+
+    def _notify(self, slot):
+        if self.fds[slot] is None:
+            try:
+                self.fds[slot] = os.open(self.paths[slot],
+                                         os.O_WRONLY | os.O_NONBLOCK)
+            except OSError:
+                # the consumer is not waiting yet
+                return
+        try:
+            os.write(self.fds[slot], b'\x00')
+        except BlockingIOError:
+            # the pipe is full, the consumer has plenty of wake-ups pending
+            pass
+        except OSError:
+            # the consumer detached, reopen the pipe of the next one
+            os.close(self.fds[slot])
+            self.fds[slot] = None
+
+    def close(self):
+        for slot, fd in enumerate(self.fds):
+            if fd is not None:
+                os.close(fd)
+                self.fds[slot] = None
+
+
+class RingWaiter(object):
+    """Consumer side of the wake-up mechanism."""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def open(self):
+        try:
+            os.mkfifo(self.path)
+        except FileExistsError:
+            pass
+        # opening read-write keeps the pipe from signalling end of file
+        # when the producer closes its end
+        self.fd = os.open(self.path, os.O_RDWR | os.O_NONBLOCK)
+
+    def wait(self, timeout):
+        """Sleeps until the producer posts or timeout seconds passed.
+
+        :returns: True if the producer posted
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            os.read(self.fd, 4096)
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def wait_any(readers, timeout):
+    """Sleeps until the producer posts to any of the attached readers or
+    timeout seconds passed.
+
+    :returns: True if the producer posted
+    """
+    ready, _, _ = select.select([reader.waiter.fd for reader in readers],
+                                [], [], timeout)
+    for fd in ready:
+        try:
+            os.read(fd, 4096)
+        except BlockingIOError:
+            pass
+    return bool(ready)
+
+
+class RingReader(object):
+    """Consumer side of the ring buffer using one reader slot.
+
+    The reader is created in the parent process and attached in the
+    consumer process. :py:meth:`read` hands contiguous regions of new
+    samples to a drain function, so a consumer never copies single
+    samples out of the ring.
+    """
+
+    def __init__(self, mmap_file, buffer_size, data_size, slot=HANDLER_SLOT):
+        self.logger = logging.getLogger(__name__)
+        self.mmap_file = mmap_file
+        self.slot = slot
+        self.fd = os.open(mmap_file, os.O_RDWR)
+        self.buf = mmap.mmap(self.fd, buffer_size, mmap.MAP_SHARED,
+                             mmap.PROT_READ | mmap.PROT_WRITE)
+        self.header = RingHeader.from_buffer(self.buf)
+        self.reader = self.header.readers[slot]
+        self.start_offset = ctypes.sizeof(RingHeader)
+        self.data_size = data_size
+        self.ring_size = (buffer_size - self.start_offset) // data_size
+        # the slot following write_seq may be overwritten at any time,
+        # keep some distance to the producer after an overrun
+        self.max_backlog = self.ring_size - max(self.ring_size // 8, 1)
+        self.waiter = RingWaiter(notify_path(mmap_file, slot))
+        self.read_seq = 0
+
+    def attach(self, from_start=True):
+        """Activates the reader slot.
+
+        :param from_start: start with the first sample of the ring buffer
+                           instead of the next sample written
+        """
+        self.waiter.open()
+        if from_start:
+            self.read_seq = 0
+        else:
+            self.read_seq = read_sequence(self.header, 'write_seq')
+        self.reader.read_seq = self.read_seq
+        self.reader.overruns = 0
+        self.reader.lost = 0
+        self.reader.last_gap_time = 0.0
+        self.reader.active = 1
+
+    def detach(self):
+        self.reader.active = 0
+        self.waiter.close()
+
+    def wait(self, timeout):
+        return self.waiter.wait(timeout)
+
+    def read(self, drain):
+        """Passes all samples written since the last call to drain.
+
+        :param drain: function called with the first and the end slot of
+                      each contiguous region of new samples
+        :returns: the number of samples passed
+        """
+        write_seq = read_sequence(self.header, 'write_seq')
+        if write_seq - self.read_seq > self.max_backlog:
+            lost = write_seq - self.read_seq - self.max_backlog
+            self.read_seq += lost
+            self._record_gap(lost)
+        if self.read_seq == write_seq:
+            return 0
+        start = self.read_seq % self.ring_size
+        stop = write_seq % self.ring_size
+        if start < stop:
+            drain(start, stop)
+        else:
+            # the written region wraps around the end of the ring
+            drain(start, self.ring_size)
+            drain(0, stop)
+        # the producer writes slot write_seq before publishing it, at a
+        # distance of ring_size it may already overwrite the first slot
+        if read_sequence(self.header, 'write_seq') - self.read_seq >= self.ring_size:
+            self.logger.warning(
+                "Ring buffer was overwritten while it was being drained, "
+                "samples may be corrupted")
+            self.reader.overruns += 1
+        count = write_seq - self.read_seq
+        self.read_seq = write_seq
+        self.reader.read_seq = write_seq
+        return count
+
+    def offset(self, slot):
+        return self.start_offset + slot * self.data_size
+
+    def timestamp(self, slot):
+        return struct.unpack_from('d', self.buf, self.offset(slot))[0]
+
+    def _record_gap(self, lost):
+        timestamp = self.timestamp(self.read_seq % self.ring_size)
+        self.reader.overruns += 1
+        self.reader.lost += lost
+        self.reader.last_gap_time = timestamp
+        self.logger.warning(
+            "Ring buffer overrun in reader slot {}: {} samples lost before "
+            "{:.6f} ({} overruns, {} samples lost in total)".format(
+                self.slot, lost, timestamp, self.reader.overruns,
+                self.reader.lost))
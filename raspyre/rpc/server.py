@@ -8,6 +8,9 @@ from .. import _version
 #from . import mplog
 import multiprocessing_logging
 from .functions import RaspyreService
+from .aioserver import AsyncXMLRPCServer
+from . import httpfiles
+from . import affinity
 import sys
 if sys.version_info[0] == 3:
     from xmlrpc.server import SimpleXMLRPCServer
@@ -70,8 +73,9 @@ class VerboseFaultXMLRPCServer(SimpleXMLRPCServer):
         return response
 
 
-class ThreadedXMLRPCServer(SimpleXMLRPCServer, socketserver.ThreadingMixIn):
-    pass
+class ThreadedXMLRPCServer(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    # the mixin has to come first to override process_request
+    daemon_threads = True
 
 class RequestHandler(SimpleXMLRPCRequestHandler, SimpleHTTPRequestHandler):
     rpc_paths = ('/RPC2', '/')
@@ -81,27 +85,38 @@ class RequestHandler(SimpleXMLRPCRequestHandler, SimpleHTTPRequestHandler):
     def do_GET(self):
         f = self.send_head()
         if f:
-            self.copyfile(f, self.wfile)
-            f.close()
+            with f:
+                if self.file_response.stream is not None:
+                    for data in self.file_response.stream:
+                        self.wfile.write(data)
+                elif self.file_response.length:
+                    self.wfile.flush()
+                    # socket.sendfile() copies in the kernel with os.sendfile()
+                    self.connection.sendfile(f, self.file_response.start,
+                                             self.file_response.length)
 
     def send_head(self):
         path = self.translate_path(self.path)
 
         f = None
         if os.path.isdir(path):
-            self.send_response(400, "Directory listing not allowed")
+            self.send_error(400, "Directory listing not allowed")
             return None
         ctype = self.guess_type(path)
+        headers = {name.lower(): value for name, value in self.headers.items()}
         try:
-            f = open(path, 'rb')
+            f, self.file_response = httpfiles.open_file(path, headers, ctype)
         except IOError:
-            self.send_response(404)
+            self.send_error(404)
             return None
-        self.send_response(200)
-        self.send_header("Content-type", ctype)
-        fs = os.fstat(f.fileno())
-        self.send_header("Content-Length", str(fs[6]))
-        self.send_header("Last-Modified", self.date_time_string(fs.st_mtime))
+        self.send_response(self.file_response.status)
+        for name, value in self.file_response.headers:
+            self.send_header(name, value)
+        if self.file_response.length is None:
+            # the end of the compressed stream is marked by closing
+            self.close_connection = True
+        else:
+            self.send_header("Content-Length", str(self.file_response.length))
         self.end_headers()
         return f
 
@@ -116,7 +131,9 @@ def handle_exception(exc_type, exc_value, exc_traceback):
     logger.error(
         "Uncaught exception", exc_info=(exc_type, exc_value, exc_traceback))
 
-def run_rpc_server(datadir, address="0.0.0.0", port=8000, logfile=None, configdir=None, verbose=False):
+def run_rpc_server(datadir, address="0.0.0.0", port=8000, logfile=None, configdir=None, verbose=False,
+                   server_cpus=None, polling_cpus=None, handler_cpus=None,
+                   use_asyncio=False, workers=4):
     root_logger = logging.getLogger()
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     consolehandler = logging.StreamHandler(stream=sys.stdout)
@@ -160,15 +177,25 @@ def run_rpc_server(datadir, address="0.0.0.0", port=8000, logfile=None, configdi
 
     logger.debug("Logging verbose information")
 
+    if server_cpus:
+        logger.info("RPC server runs on CPUs {}".format(
+            affinity.set_affinity(server_cpus)))
+
     #server = VerboseFaultXMLRPCServer(
     #    (address, port), requestHandler=RequestHandler, allow_none=True, logRequests=True)
     #server = SimpleXMLRPCServer(
     #    (address, port), requestHandler=RequestHandler, allow_none=True, logRequests=True)
-    server = ThreadedXMLRPCServer(
+    if use_asyncio:
+        server = AsyncXMLRPCServer(
+            (address, port), workers=workers, allow_none=True, logRequests=True)
+    else:
+        server = ThreadedXMLRPCServer(
             (address, port), requestHandler=RequestHandler, allow_none=True, logRequests=True)
 
     raspyreservice = RaspyreService(data_directory=datadir,
-                                    configuration_directory=configdir)
+                                    configuration_directory=configdir,
+                                    polling_cpus=polling_cpus,
+                                    handler_cpus=handler_cpus)
     server.register_instance(raspyreservice)
     server.register_introspection_functions()
     server.serve_forever()
@@ -201,6 +228,21 @@ def main():
         type=storage_path,
         action='store')
     parser.add_argument('--verbose', '-v', action='store_true', dest='verbose')
+    parser.add_argument(
+        '--asyncio', action='store_true', dest='use_asyncio',
+        help='Serve all clients from a single asyncio event loop')
+    parser.add_argument(
+        '--workers', type=int, default=4,
+        help='Threads executing RPC calls in asyncio mode (default 4)')
+    parser.add_argument(
+        '--server-cpus', type=affinity.parse_cpus,
+        help='CPUs of the RPC server, e.g. "0-1"')
+    parser.add_argument(
+        '--polling-cpus', type=affinity.parse_cpus,
+        help='Default CPUs of the polling processes (default: isolated CPUs)')
+    parser.add_argument(
+        '--handler-cpus', type=affinity.parse_cpus,
+        help='Default CPUs of the handler processes')
     parser.add_argument(
         '--version',
         action='version',
@@ -221,7 +263,12 @@ def main():
                    port=args.port,
                    configdir=args.configdir,
                    logfile=args.logfile,
-                   verbose=args.verbose)
+                   verbose=args.verbose,
+                   server_cpus=args.server_cpus,
+                   polling_cpus=args.polling_cpus,
+                   handler_cpus=args.handler_cpus,
+                   use_asyncio=args.use_asyncio,
+                   workers=args.workers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,68 @@
+from .ringbuffer import RingReader
+import multiprocessing
+import logging
+import struct
+import zmq
+
+
+class StreamProcess(multiprocessing.Process):
+    """Publishes the samples of a running measurement on a zmq PUB socket.
+
+    The process reads the shared memory ring buffer through its own reader
+    slot, so a slow subscriber never delays the HandlerProcess writing the
+    measurement files. It starts with the next sample written after it was
+    attached.
+    """
+    __version = "1.0"
+
+    def __init__(self,
+                 sensor,
+                 sensor_name,
+                 axis,
+                 mmap_file,
+                 buffer_size,
+                 slot,
+                 port,
+                 batch_size=1,
+                 batch_latency=0.1):
+        multiprocessing.Process.__init__(self)
+        self.logger = logging.getLogger(__name__)
+        self.logger.debug("Initializing StreamProcess")
+
+        self.sensor_name = sensor_name
+        self.fmt = 'd' + ''.join(sensor.struct_fmt(axis))
+        self.data_size = struct.calcsize(self.fmt)
+        self.slot = slot
+        self.port = port
+        self.batch_size = batch_size
+        self.batch_latency = batch_latency
+        self.exitEvent = multiprocessing.Event()
+        self.ring = RingReader(mmap_file, buffer_size, self.data_size, slot)
+
+    def run(self):
+        self.logger.debug("Binding zmq socket to port {}".format(self.port))
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.PUB)
+        self.socket.bind('tcp://*:%s' % self.port)
+
+        self.ring.attach(from_start=False)
+        self.logger.info("Streaming sensor \"{}\" from reader slot {}".format(
+            self.sensor_name, self.slot))
+        while not self.exitEvent.is_set():
+            self.ring.read(self._drain)
+            self.ring.wait(self.batch_latency)
+        self.ring.detach()
+        self.socket.close()
+        self.context.term()
+
+    def _drain(self, start, stop):
+        view = memoryview(self.ring.buf)
+        first = self.ring.offset(start)
+        last = self.ring.offset(stop)
+        step = self.batch_size * self.data_size
+        for offset in range(first, last, step):
+            self.socket.send(view[offset:min(offset + step, last)])
+
+    def shutdown(self):
+        self.logger.debug("shutdown() called")
+        self.exitEvent.set()
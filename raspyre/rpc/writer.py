@@ -30,10 +30,11 @@ metadata = example_metadata
 
 column_names = ['time', 'attr1', 'attr2', 'attr3']
 
-def generate_binary_header(date_float, metadata, fmt, units, column_names):
+def generate_binary_header(date_float, metadata, fmt, units, column_names,
+                           version=(MAJOR_VERSION, MINOR_VERSION)):
     byte_buffer = io.BytesIO()
     byte_buffer.write(struct.pack('2B', *MAGIC_ID_BYTES))
-    byte_buffer.write(struct.pack('2B', MAJOR_VERSION, MINOR_VERSION))
+    byte_buffer.write(struct.pack('2B', *version))
     byte_buffer.write(struct.pack('d', date_float))
 
     metadatastring = io.StringIO()
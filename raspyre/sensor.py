@@ -32,9 +32,53 @@ class Sensor(object):
     def getRecord(self, *args):
         """ Returns a Record object containing the requested values.
         The Parameters to the function specify the attributes that will be measured.
+        A :py:func:`~raspyre.record.record_type` FastRecord with the
+        attributes in the order of the parameters may be returned instead.
         """
         raise NotImplementedError('getRecord called on base class')
 
+    def getRecords(self, n, *args):
+        """Optional burst interface for sensors with a hardware FIFO.
+
+        Returns up to n buffered samples of the requested attributes in
+        one call. Each sample is a tuple of its timestamp followed by the
+        values in the order of args. The timestamps are reconstructed from
+        the sensor clock, e.g. by counting back from the time of the read
+        with the sampling period of the sensor.
+
+        :param n: maximum number of samples to return
+        :param args: the attributes to be measured
+        :returns: list of tuples (time, value1, value2, ...)
+        """
+        raise NotImplementedError('getRecords called on base class')
+
+    def supportsBlockRead(self):
+        """Returns True if the sensor implements :py:meth:`getRecords`."""
+        return type(self).getRecords is not Sensor.getRecords
+
+    def read_into(self, buffer, offset, packer, *args):
+        """Writes one sample of the requested attributes into buffer.
+
+        The PollingProcess calls this function for every sample with a
+        preallocated slot of its ring buffer. The default implementation
+        packs the Record returned by :py:meth:`getRecord`. Drivers may
+        override it to pack the values directly and avoid creating a
+        Record for every sample.
+
+        :param buffer: writable buffer, e.g. the mmap of the ring buffer
+        :param offset: byte offset of the sample in buffer
+        :param packer: :py:class:`struct.Struct` of the timestamp followed
+                       by the attributes
+        :param args: the attributes to be measured
+        """
+        record = self.getRecord(*args)
+        if isinstance(record, tuple):
+            # a FastRecord already has the layout of the packer
+            packer.pack_into(buffer, offset, *record)
+        else:
+            packer.pack_into(buffer, offset, record['time'],
+                             *[record[x] for x in args])
+
     def updateConfig(self, **kwargs):
         """Pass a list of parameter names and values.
         The parameters of the sensor will be changed accordingly
@@ -6,7 +6,7 @@ import random
 import logging
 
 from raspyre.sensor import Sensor
-from raspyre.record import Record
+from raspyre.record import record_type
 
 class Mockup(Sensor) :
     sensor_attributes = { 'x': ('g', 'd'),
@@ -25,15 +25,33 @@ class Mockup(Sensor) :
         now = time.time()
         #while (now - self.lastSample < period):
         #    now = time.time()
-        record = Record()
         for axis in args :
-            if axis in ['x' , 'y' , 'z'] :
-                record[axis] = random.random()
-            else:
+            if axis not in ['x' , 'y' , 'z'] :
                 raise KeyError('Invalid axis specifier given')
+        record = record_type(args)(now, *[random.random() for axis in args])
         self.lastSample = now
         return record
 
+    def getRecords(self, n, *args):
+        for axis in args:
+            if axis not in self.sensor_attributes:
+                raise KeyError('Invalid axis specifier given')
+        now = time.time()
+        period = 1. / self.sps
+        # the mockup FIFO holds every sample since the last read
+        count = min(int((now - self.lastSample) * self.sps), n)
+        self.lastSample = now
+        return [tuple([now - (count - 1 - i) * period] +
+                      [random.random() for axis in args])
+                for i in range(count)]
+
+    def read_into(self, buffer, offset, packer, *args):
+        for axis in args:
+            if axis not in self.sensor_attributes:
+                raise KeyError('Invalid axis specifier given')
+        packer.pack_into(buffer, offset, time.time(),
+                         *[random.random() for axis in args])
+
     def getAttributes(self) :
         return ['x' , 'y' , 'z']
 
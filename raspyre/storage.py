@@ -25,14 +25,34 @@ followed by a number of value columns. The firs line of the file
 contains the name of the columns.
 '''
 
+import bisect
 import os
 import struct
 import datetime
 import csv
 import io
+import itertools
+import json
 import logging
+import re
+import warnings
+import zlib
+
+import numpy as np
+from numpy.lib import recfunctions
 
 MAGIC_ID_BYTES = [0xEB, 0xFF]
+# version of the block based binary format, see BlockFile
+BLOCK_VERSION = (0, 5)
+BLOCK_ROWS = 4096
+BLOCK_MARKER = b'RBLK'
+INDEX_MARKER = b'RIDX'
+# marker, rows, compressed size, first and last timestamp
+BLOCK_HEADER = struct.Struct('=4siidd')
+# offset, rows, first and last timestamp of a block
+INDEX_ENTRY = struct.Struct('=qidd')
+# marker and offset of the block index at the end of a closed file
+INDEX_TRAILER = struct.Struct('=4sq')
 TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 
@@ -40,7 +60,34 @@ class RaspyreFileFormatException(Exception):
     pass
 
 
-def process_files(in_folder, out_folder, level):
+# resampling levels: extension -> (interval in seconds, blocksize)
+LEVELS = {
+    'rm02': (1, 'hour'),
+    'rm03': (1, 'day'),
+    'rm04': (60, 'day'),
+    'rm05': (60, 'week'),
+    'rm06': (60, 'month'),
+    'rm07': (3600, 'month'),
+}
+# aggregates stored for each value column of a resampled file
+AGGREGATES = ('min', 'max', 'mean', 'rms')
+FILE_TIME_FORMAT = "%Y-%m-%d-%H-%M-%S"
+FILE_TIME_PATTERN = re.compile(r"_(\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2})$")
+RESAMPLE_STATE_FILE = ".raspyre_{}_state.json"
+# <node>_<measurement>_<sensor>_<timestamp> as written by the HandlerProcess
+FILE_NAME_PATTERN = re.compile(
+    r"^(?P<node>[^_]+)_(?P<measurement>.+)_(?P<sensor>[^_]+)"
+    r"_(?P<timestamp>\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2})$")
+CATALOG_FILE = ".raspyre_catalog.json"
+# (monotonic, realtime) pairs written next to files with monotonic
+# timestamps
+ANCHOR_SUFFIX = ".anchors"
+# NumPy types of the CSV datatypes matching the values of CSVReader.data(),
+# columns of other datatypes are skipped
+CSV_TYPES = {'f': 'f8', 'd': 'f8', 'i': 'i4', 'B': '?'}
+
+
+def process_files(in_folder, out_folder, level, chunk_rows=65536):
     """
     This function processes all the files in the in_folder such that
     it resamples them to the required sampling rate and stores them in
@@ -48,17 +95,594 @@ def process_files(in_folder, out_folder, level):
     ability to see, which data has already been resampled, so that it
     can be called multiple times with the same arguments and only
     updates the new data.
+
+    Files belonging to the same stream (equal file names apart from the
+    trailing timestamp) are merged into one series of output blocks. Each
+    output row holds the start of the interval, the number of samples and
+    the min, max, mean and rms of every value column. The last interval
+    of a stream stays open in the state file of the out_folder until a
+    sample of a later interval arrives.
+
+    :param in_folder: folder containing the raw (rm01) files
+    :param out_folder: folder the resampled files are written to
+    :param level: file extension of the target level, e.g. "rm02"
+    :returns: number of rows written to the resampled files
+    """
+    logger = logging.getLogger(__name__)
+    if level not in LEVELS:
+        raise ValueError("Unknown resampling level {}".format(level))
+    state_filename = os.path.join(out_folder,
+                                  RESAMPLE_STATE_FILE.format(level))
+    state = {}
+    if os.path.exists(state_filename):
+        with open(state_filename) as f:
+            state = json.load(f)
+
+    streams = {}
+    for name in sorted(os.listdir(in_folder)):
+        path = os.path.join(in_folder, name)
+        stem, ext = os.path.splitext(name)
+        if (name.startswith('.') or ext[1:] in LEVELS
+                or not os.path.isfile(path)):
+            continue
+        try:
+            reader = getReader(path)
+        except (RaspyreFileFormatException, ValueError, struct.error):
+            logger.info("Skipping {}: not a Raspyre file".format(name))
+            continue
+        reader.f.close()
+        streams.setdefault(stream_name(name), []).append(
+            (reader.header['time'], name))
+
+    written = 0
+    for stream, files in sorted(streams.items()):
+        stream_state = state.setdefault(stream, {'files': {},
+                                                 'pending': None,
+                                                 'output': None})
+        for _, name in sorted(files):
+            reader = getReader(os.path.join(in_folder, name))
+            try:
+                try:
+                    convert = wall_clock(reader)
+                except RaspyreFileFormatException as e:
+                    logger.warning("Skipping {}: {}".format(name, e))
+                    continue
+                done = stream_state['files'].get(name, 0)
+                if 'columns' not in stream_state:
+                    stream_state['columns'] = list(reader.header['columns'])
+                elif stream_state['columns'] != list(reader.header['columns']):
+                    logger.warning("Skipping {}: columns differ from stream {}"
+                                   .format(name, stream))
+                    continue
+                for array in reader.iter_arrays(chunk_rows, done):
+                    if convert is not None:
+                        array = _to_wall_clock(array, convert)
+                    written += _resample_chunk(array, stream, stream_state,
+                                               reader.header, out_folder,
+                                               level)
+                    done += len(array)
+                    stream_state['files'][name] = done
+                    # keep the state consistent with the written output
+                    # after every chunk so that an interrupted run can be
+                    # resumed
+                    _save_state(state_filename, state)
+            finally:
+                reader.f.close()
+    return written
+
+
+def _save_state(filename, state):
+    # replace the state at once, an interrupted write must not lose it
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(filename + '.tmp', filename)
+
+
+def stream_name(filename):
+    """returns the descriptive part of a data file name, i.e. the name
+    without extension and trailing timestamp
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return FILE_TIME_PATTERN.sub('', stem)
+
+
+def block_start(timestamp, blocksize):
+    """returns the UTC timestamp of the beginning of the block containing
+    timestamp. Weeks start on Monday.
+    """
+    if blocksize == 'hour':
+        return timestamp // 3600 * 3600
+    day = timestamp // 86400 * 86400
+    if blocksize == 'day':
+        return day
+    date = datetime.datetime.utcfromtimestamp(day)
+    if blocksize == 'week':
+        return day - date.weekday() * 86400
+    if blocksize == 'month':
+        return day - (date.day - 1) * 86400
+    raise ValueError("Unknown blocksize {}".format(blocksize))
+
+
+def _resample_chunk(array, stream, stream_state, header, out_folder, level):
+    interval, blocksize = LEVELS[level]
+    names = array.dtype.names
+    times = array[names[0]].astype(np.float64)
+    values = np.empty((len(array), len(names) - 1))
+    for i, name in enumerate(names[1:]):
+        values[:, i] = array[name]
+    indices = np.floor(times / interval).astype(np.int64)
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(indices)) + 1))
+    counts = np.diff(np.append(bounds, len(indices)))
+    minima = np.minimum.reduceat(values, bounds)
+    maxima = np.maximum.reduceat(values, bounds)
+    sums = np.add.reduceat(values, bounds)
+    squares = np.add.reduceat(values * values, bounds)
+
+    rows = []
+    pending = stream_state['pending']
+    for i, index in enumerate(indices[bounds].tolist()):
+        if pending is not None and index < pending['interval']:
+            logging.getLogger(__name__).warning(
+                "Dropping {} samples of {}: timestamps are not ordered"
+                .format(counts[i], stream))
+            continue
+        if pending is not None and index == pending['interval']:
+            pending['count'] += int(counts[i])
+            pending['min'] = np.minimum(pending['min'], minima[i]).tolist()
+            pending['max'] = np.maximum(pending['max'], maxima[i]).tolist()
+            pending['sum'] = (np.add(pending['sum'], sums[i])).tolist()
+            pending['sumsq'] = (np.add(pending['sumsq'],
+                                       squares[i])).tolist()
+            continue
+        if pending is not None:
+            rows.append(_aggregate_row(pending, interval))
+        pending = {'interval': index,
+                   'count': int(counts[i]),
+                   'min': minima[i].tolist(),
+                   'max': maxima[i].tolist(),
+                   'sum': sums[i].tolist(),
+                   'sumsq': squares[i].tolist()}
+    stream_state['pending'] = pending
+
+    blocks = {}
+    for row in rows:
+        blocks.setdefault(block_start(row[0], blocksize), []).append(row)
+    for start, block_rows in sorted(blocks.items()):
+        filename = os.path.join(out_folder, "{}_{}.{}".format(
+            stream,
+            datetime.datetime.utcfromtimestamp(start).strftime(
+                FILE_TIME_FORMAT),
+            level))
+        with _open_output(filename, stream_state) as f:
+            if f.tell() == 0:
+                f.write(_resampled_header(start, stream_state['columns'],
+                                          header, level))
+            f.write(np.array(block_rows, dtype=np.float64).tobytes())
+            stream_state['output'] = [os.path.basename(filename), f.tell()]
+    return len(rows)
+
+
+def _open_output(filename, stream_state):
+    """opens a resampled file for appending. Rows an interrupted run
+    wrote after the state was saved the last time are removed, the output
+    of a stream only ever grows at its last file.
+    """
+    output = stream_state.get('output', False)
+    if output is False:
+        # state of an older version that did not record the output
+        return open(filename, 'ab')
+    size = 0
+    if output and output[0] == os.path.basename(filename):
+        size = output[1]
+    if not os.path.exists(filename):
+        return open(filename, 'wb')
+    f = open(filename, 'r+b')
+    f.seek(min(size, os.path.getsize(filename)))
+    f.truncate()
+    return f
+
+
+def _aggregate_row(pending, interval):
+    count = pending['count']
+    mean = np.divide(pending['sum'], count)
+    rms = np.sqrt(np.divide(pending['sumsq'], count))
+    row = [pending['interval'] * interval, count]
+    for values in zip(pending['min'], pending['max'], mean, rms):
+        row.extend(values)
+    return row
+
+
+def _resampled_header(start, columns, header, level):
+    interval, blocksize = LEVELS[level]
+    metadata = dict(header['metadata'])
+    metadata['level'] = level
+    if 'timestamps' in metadata:
+        # monotonic timestamps are converted before resampling
+        metadata['timestamps'] = 'realtime'
+    metadata['interval'] = interval
+    metadata['blocksize'] = blocksize
+    units = ['dt64', '1']
+    column_names = [columns[0], 'count']
+    input_units = list(header['units'][1:])
+    input_units += ['-'] * (len(columns) - 1 - len(input_units))
+    for column, unit in zip(columns[1:], input_units):
+        for aggregate in AGGREGATES:
+            units.append(unit)
+            column_names.append("{}_{}".format(column, aggregate))
+    fmt = 'd' * len(column_names)
+    return build_binary_header(start, metadata, fmt, units, column_names)
+
+
+def read_time_range(filename, t0, t1):
+    """returns the rows of a data file with t0 <= time < t1 as a numpy
+    structured array.
+
+    For binary files the timestamps in the first column are binary
+    searched in the memory mapped file, so only O(log n) rows plus the
+    result have to be read. The timestamps are expected to be ascending,
+    as written by the HandlerProcess. Monotonic timestamps are converted
+    to wall clock time, see :py:func:`wall_clock`, and the whole file is
+    scanned.
+    """
+    reader = getReader(filename)
+    convert = wall_clock(reader)
+    if not reader.binary:
+        reader.f.close()
+        array = reader.read_array()
+        if convert is not None:
+            array = _to_wall_clock(array, convert)
+        times = array[array.dtype.names[0]]
+        return array[(times >= t0) & (times < t1)]
+    reader.f.close()
+    if convert is not None:
+        arrays = list(_time_range_chunks(reader, convert, t0, t1))
+        if not arrays:
+            return np.empty(0, dtype=reader.dtype())
+        return np.concatenate(arrays)
+    view = reader.mmap_view()
+    times = view.column(view.dtype.names[0])
+    start = _bisect_left(times, t0)
+    stop = _bisect_left(times, t1, start)
+    return np.array(view[start:stop])
+
+
+def _bisect_left(values, value, lo=0):
+    # bisect on the strided memmap column, np.searchsorted would copy it
+    hi = len(values)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if values[mid] < value:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def read_anchors(filename):
+    """returns the clock anchors of a data file recorded with monotonic
+    timestamps as an array of (monotonic, realtime) rows.
+
+    :param filename: data file or its anchor file
+    """
+    if not filename.endswith(ANCHOR_SUFFIX):
+        filename += ANCHOR_SUFFIX
+    with warnings.catch_warnings():
+        # an empty file is reported below
+        warnings.simplefilter('ignore', UserWarning)
+        anchors = np.loadtxt(filename, ndmin=2)
+    if not len(anchors):
+        raise ValueError("No clock anchors in {}".format(filename))
+    return anchors
+
+
+def wall_time(times, anchors):
+    """converts monotonic timestamps to wall clock time.
+
+    The offset between both clocks is interpolated linearly between the
+    anchors and kept constant before the first and after the last one, so
+    steps of the wall clock (e.g. by NTP) show up in the result without
+    disturbing the spacing of the samples in between.
+
+    :param times: array of monotonic timestamps
+    :param anchors: array of (monotonic, realtime) rows as returned by
+                    :py:func:`read_anchors`
+    """
+    monotonic = anchors[:, 0]
+    offset = anchors[:, 1] - monotonic
+    return np.asarray(times) + np.interp(times, monotonic, offset)
+
+
+def wall_clock(reader):
+    """returns a function converting the timestamps of a data file to wall
+    clock time with the clock anchors of the file, or None if the file
+    has wall clock timestamps.
+
+    :raises RaspyreFileFormatException: if the file has monotonic
+                                        timestamps but no anchors
+    """
+    if reader.header['metadata'].get('timestamps') != 'monotonic':
+        return None
+    try:
+        anchors = read_anchors(reader.filename)
+    except (IOError, ValueError):
+        raise RaspyreFileFormatException(
+            "Monotonic timestamps without clock anchors in {}".format(
+                reader.filename))
+    return lambda times: wall_time(times, anchors)
+
+
+def _to_wall_clock(array, convert):
+    """returns a copy of a structured array of rows with the timestamps
+    converted by convert
+    """
+    array = np.array(array)
+    name = array.dtype.names[0]
+    array[name] = convert(array[name])
+    return array
+
+
+def _time_range_chunks(reader, convert, t0, t1, chunk_rows=65536):
+    """generates the rows with t0 <= time < t1 of a file whose timestamps
+    are converted by convert. The converted timestamps are not necessarily
+    ascending, so all rows are scanned.
+    """
+    for array in reader.iter_arrays(chunk_rows):
+        array = _to_wall_clock(array, convert)
+        times = array[array.dtype.names[0]]
+        selected = array[(times >= t0) & (times < t1)]
+        if len(selected):
+            yield selected
+
+
+def _binary_header_size(data):
+    """returns the size and the datatypes of the header at the start of
+    the bytes of a binary data file
+    """
+    if data[:2] != b'\xeb\xff':
+        raise RaspyreFileFormatException(
+            "Magic bytes not found in binary file")
+    lengths = struct.unpack_from('4i', data, 12)
+    start = 28 + lengths[0]
+    datatypes = bytes(data[start:start + lengths[1]]).decode('utf-8')
+    return 28 + sum(lengths), datatypes
+
+
+def _delta_timestamps(datatypes):
+    # the 8 byte timestamps of the first column are delta encoded
+    return datatypes[:1] in ('d', 'q', 'Q')
+
+
+def delta_filter(filename, chunk_rows=65536):
+    """generates the delta filtered bytes of a binary data file.
+
+    The filter rearranges the rows losslessly so that general purpose
+    compressors work much better on them: the header is passed unchanged,
+    the rows follow in blocks of at most chunk_rows rows. Each block starts
+    with its row count as 'q' and holds the bytes of its rows shuffled into
+    planes, i.e. all first bytes of the rows, then all second bytes and so
+    on. Before shuffling, the 8 byte timestamps of the first column are
+    replaced by the differences of their int64 bit patterns, which are
+    small and constant for a steady sampling rate. A block with zero rows
+    ends the data and is followed by a partially written last row, if any.
+
+    :param filename: binary data file
+    :param chunk_rows: rows per block
+    :returns: generator of byte strings
+    """
+    reader = getReader(filename)
+    if not reader.binary or reader.version != (0, 4):
+        raise RaspyreFileFormatException(
+            "Delta filter requires a binary file of version 0.4")
+    with reader.f as f:
+        f.seek(0)
+        yield f.read(reader.data_offset)
+        row_size = reader.chunksize
+        delta = _delta_timestamps(reader.header['datatypes'])
+        while True:
+            data = f.read(chunk_rows * row_size)
+            rows = len(data) // row_size
+            if not rows:
+                break
+            block = np.frombuffer(data, np.uint8, rows * row_size).reshape(
+                rows, row_size).copy()
+            if delta:
+                times = block[:, :8].copy().view(np.int64).ravel()
+                times[1:] = np.diff(times)
+                block[:, :8] = times.view(np.uint8).reshape(rows, 8)
+            yield struct.pack('q', rows)
+            yield block.T.tobytes()
+            if len(data) < chunk_rows * row_size:
+                break
+        yield struct.pack('q', 0)
+        yield data[rows * row_size:]
+
+
+def delta_unfilter(data):
+    """restores the bytes of a binary data file from the output of
+    :py:func:`delta_filter`.
+
+    :param data: bytes of the filtered file
+    :returns: bytes of the original file
+    """
+    header_size, datatypes = _binary_header_size(data)
+    row_size = struct.calcsize(datatypes)
+    delta = _delta_timestamps(datatypes)
+    result = [data[:header_size]]
+    offset = header_size
+    while True:
+        rows, = struct.unpack_from('q', data, offset)
+        offset += 8
+        if not rows:
+            break
+        size = rows * row_size
+        block = np.frombuffer(data, np.uint8, size, offset).reshape(
+            row_size, rows).T.copy()
+        offset += size
+        if delta:
+            times = np.cumsum(block[:, :8].copy().view(np.int64).ravel(),
+                              dtype=np.int64)
+            block[:, :8] = times.view(np.uint8).reshape(rows, 8)
+        result.append(block.tobytes())
+    result.append(data[offset:])
+    return b''.join(result)
+
+
+class Dataset(object):
+    """A directory of binary data files accessed as one timeline.
+
+    The directory is scanned once into a catalog holding node,
+    measurement, sensor, first and last timestamp and row count of every
+    binary file. The catalog is cached in the directory and refreshed
+    incrementally: only files whose size or modification time changed are
+    opened again. Node, measurement and sensor are taken from the file
+    names written by the HandlerProcess and are None for other names.
+
+    :Example:
+
+    >>> dataset = Dataset('/home/pi/data')
+    >>> for array in dataset.read_time_range(t0, t1, sensor='S1'):
+    ...     process(array)
     """
-    raise NotImplementedError
+
+    def __init__(self, directory, cache=True):
+        self.directory = directory
+        self.cache = cache
+        self.catalog = {}
+        # size and mtime of files that are no binary data files
+        self.skipped = {}
+        self.cache_filename = os.path.join(directory, CATALOG_FILE)
+        if cache and os.path.exists(self.cache_filename):
+            try:
+                with open(self.cache_filename) as f:
+                    cached = json.load(f)
+                self.catalog = cached['catalog']
+                self.skipped = cached['skipped']
+            except (ValueError, KeyError):
+                logging.getLogger(__name__).warning(
+                    "Ignoring invalid catalog {}".format(self.cache_filename))
+        self.refresh()
+
+    def refresh(self):
+        """updates the catalog with added, changed and removed files.
+
+        :returns: True if the catalog changed
+        """
+        changed = False
+        names = set()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.') or not os.path.isfile(path):
+                continue
+            names.add(name)
+            stat = os.stat(path)
+            entry = self.catalog.get(name)
+            if (entry is not None and entry['size'] == stat.st_size
+                    and entry['mtime'] == stat.st_mtime):
+                continue
+            if self.skipped.get(name) == [stat.st_size, stat.st_mtime]:
+                continue
+            entry = self._scan(name, path, stat)
+            if entry is None:
+                self.catalog.pop(name, None)
+                self.skipped[name] = [stat.st_size, stat.st_mtime]
+            else:
+                self.catalog[name] = entry
+                self.skipped.pop(name, None)
+            changed = True
+        for name in set(self.catalog) - names:
+            del self.catalog[name]
+            changed = True
+        for name in set(self.skipped) - names:
+            del self.skipped[name]
+            changed = True
+        if changed and self.cache:
+            with open(self.cache_filename, 'w') as f:
+                json.dump({'catalog': self.catalog, 'skipped': self.skipped},
+                          f)
+        return changed
+
+    def _scan(self, name, path, stat):
+        try:
+            with open(path, 'rb') as f:
+                if f.read(2) != b'\xeb\xff':
+                    return None
+            reader = getReader(path)
+        except (RaspyreFileFormatException, struct.error):
+            return None
+        reader.f.close()
+        match = FILE_NAME_PATTERN.match(os.path.splitext(name)[0])
+        fields = match.groupdict() if match else {}
+        try:
+            convert = wall_clock(reader)
+        except RaspyreFileFormatException:
+            return None
+        rows = reader.row_count()
+        start = end = reader.header['time']
+        if rows:
+            start = float(reader.read_array(0, 1)[0][0])
+            end = float(reader.read_array(rows - 1, rows)[0][0])
+            if convert is not None:
+                start, end = convert([start, end]).tolist()
+        return {'node': fields.get('node'),
+                'measurement': fields.get('measurement'),
+                'sensor': fields.get('sensor'),
+                'start': start,
+                'end': end,
+                'rows': rows,
+                'columns': reader.header['columns'],
+                'size': stat.st_size,
+                'mtime': stat.st_mtime}
+
+    def files(self, sensor=None, node=None, measurement=None):
+        """returns the sorted file names matching the given filters"""
+        entries = [(entry['start'], name)
+                   for name, entry in self.catalog.items()
+                   if (sensor is None or entry['sensor'] == sensor)
+                   and (node is None or entry['node'] == node)
+                   and (measurement is None
+                        or entry['measurement'] == measurement)]
+        return [name for _, name in sorted(entries)]
+
+    def sensors(self):
+        return sorted(set(entry['sensor'] for entry in self.catalog.values()
+                          if entry['sensor'] is not None))
+
+    def read_time_range(self, t0, t1, sensor=None, node=None,
+                        measurement=None, chunk_rows=65536):
+        """returns a generator of structured arrays holding the rows with
+        t0 <= time < t1 of all matching files in time order. Each array
+        has at most chunk_rows rows and only the files overlapping the
+        range are opened.
+        """
+        for name in self.files(sensor, node, measurement):
+            entry = self.catalog[name]
+            if entry['end'] < t0 or entry['start'] >= t1:
+                continue
+            reader = getReader(os.path.join(self.directory, name))
+            reader.f.close()
+            convert = wall_clock(reader)
+            if convert is not None:
+                for array in _time_range_chunks(reader, convert, t0, t1,
+                                                chunk_rows):
+                    yield array
+                continue
+            view = reader.mmap_view()
+            times = view.column(view.dtype.names[0])
+            start = _bisect_left(times, t0)
+            stop = _bisect_left(times, t1, start)
+            for i in range(start, stop, chunk_rows):
+                yield np.array(view[i:min(i + chunk_rows, stop)])
 
 
 def getReader(filename):
     try:
         with open(filename, 'rb') as f:
-            magic = f.read(2)
+            magic = f.read(4)
     except:
         raise
-    if magic == b'\xeb\xff':
+    if magic[2:] == bytes(BLOCK_VERSION) and magic[:2] == b'\xeb\xff':
+        reader = BlockReader(filename)
+    elif magic[:2] == b'\xeb\xff':
         reader = BinReader(filename)
     else:
         reader = CSVReader(filename)
@@ -90,6 +714,7 @@ class CSVReader(Reader):
         #parse the header with regard to the version number
         self.delimiter = " "
         self.parseHeader()
+        self.data_offset = self.f.tell()
 
         self.reader = csv.reader(self.f, delimiter=self.delimiter)
 
@@ -112,6 +737,60 @@ class CSVReader(Reader):
             yield tuple(data)
         self.f.close()
 
+    def dtype(self):
+        """returns the NumPy structured dtype of the arrays returned by
+        :py:meth:`read_array`, see :py:data:`CSV_TYPES`
+        """
+        datatypes = self.header['datatypes']
+        names = list(self.header['columns'])
+        if len(names) != len(datatypes) or len(set(names)) != len(names):
+            names = ["f{}".format(i) for i in range(len(datatypes))]
+        return np.dtype([(name, CSV_TYPES[datatype])
+                         for name, datatype in zip(names, datatypes)
+                         if datatype in CSV_TYPES])
+
+    def read_array(self, start=0, stop=None):
+        """parses the data rows [start, stop) at once. Other than
+        :py:meth:`data` this does not consume the rows of the reader.
+
+        :param start: index of the first row
+        :param stop: index after the last row, None reads to the end
+        :returns: numpy structured array with one field per column
+        """
+        with open(self.filename) as f:
+            f.seek(self.data_offset)
+            return self._parse(list(itertools.islice(f, start, stop)))
+
+    def iter_arrays(self, chunk_rows=65536, start=0):
+        """returns a generator for structured arrays of at most chunk_rows
+        rows covering the file from row start on.
+        """
+        with open(self.filename) as f:
+            f.seek(self.data_offset)
+            # skip the rows line by line instead of reading them at once
+            for _ in itertools.islice(f, start):
+                pass
+            while True:
+                lines = list(itertools.islice(f, chunk_rows))
+                if not lines:
+                    break
+                yield self._parse(lines)
+
+    def _parse(self, lines):
+        # all columns are parsed as floats in one pass, integer columns
+        # written by the Writer are formatted as floats as well
+        dtype = self.dtype()
+        usecols = [i for i, datatype in enumerate(self.header['datatypes'])
+                   if datatype in CSV_TYPES]
+        lines = [line for line in lines if line.strip()]
+        array = np.empty(len(lines), dtype=dtype)
+        if lines:
+            values = np.loadtxt(lines, delimiter=self.delimiter,
+                                usecols=usecols, dtype=np.float64, ndmin=2)
+            for i, name in enumerate(dtype.names):
+                array[name] = values[:, i]
+        return array
+
     def _getNextLine(self):
         l = cleanCSVLine(self.f.readline())
         while not l:
@@ -233,34 +912,90 @@ class CSVReader(Reader):
 
 
 class BinReader(Reader):
+    VERSIONS = ((0, 4), )
+
     def __init__(self, filename):
         Reader.__init__(self, filename)
         self.binary = True
 
         self.f = open(filename, 'rb')
         magic_bytes = self.f.read(2)
-        if not (magic_bytes[0] == b'\xeb' and magic_bytes[1] == b'\xff'):
+        if magic_bytes != b'\xeb\xff':
             raise RaspyreFileFormatException(
                 "Magic bytes not found in binary file")
         version_bytes = self.f.read(2)
         self.version = struct.unpack('BB', version_bytes)
 
         self.parseHeader()
+        self.data_offset = self.f.tell()
 
     def data(self):
         while True:
             data_bytes = self.f.read(self.chunksize)
-            if data_bytes:
+            if len(data_bytes) == self.chunksize:
                 yield struct.unpack(self.header['datatypes'], data_bytes)
             else:
                 break
         self.f.close()
 
+    def row_count(self):
+        """returns the number of complete data rows currently in the file.
+        A partially written row at the end of the file is not counted.
+        """
+        data_size = os.path.getsize(self.filename) - self.data_offset
+        return max(data_size, 0) // self.chunksize
+
+    def dtype(self):
+        """returns the NumPy structured dtype matching one data row"""
+        return numpy_dtype(self.header['datatypes'], self.header['columns'])
+
+    def read_array(self, start=0, stop=None):
+        """reads the data rows [start, stop) with a single read call.
+
+        :param start: index of the first row
+        :param stop: index after the last row, None reads to the end
+        :returns: numpy structured array with one field per column
+        """
+        rows = self.row_count()
+        start, stop, _ = slice(start, stop).indices(rows)
+        count = max(stop - start, 0)
+        with open(self.filename, 'rb') as f:
+            f.seek(self.data_offset + start * self.chunksize)
+            data_bytes = f.read(count * self.chunksize)
+        count = len(data_bytes) // self.chunksize
+        return np.frombuffer(data_bytes, dtype=self.dtype(), count=count)
+
+    def read_columns(self, start=0, stop=None):
+        """reads the data rows [start, stop) and returns a dictionary
+        mapping each column name to a contiguous array of its values.
+        """
+        array = self.read_array(start, stop)
+        return {name: np.ascontiguousarray(array[name])
+                for name in array.dtype.names}
+
+    def iter_arrays(self, chunk_rows=65536, start=0):
+        """returns a generator for structured arrays of at most chunk_rows
+        rows covering the file from row start on.
+        """
+        while True:
+            array = self.read_array(start, start + chunk_rows)
+            if not len(array):
+                break
+            yield array
+            start += len(array)
+
+    def mmap_view(self):
+        """returns a read-only memory mapped view of the data rows, see
+        :py:class:`BinView`
+        """
+        return BinView(self.filename, self.data_offset, self.dtype())
+
     def parseHeader(self):
         header = {}
-        if self.version == (0, 4):
+        if self.version in self.VERSIONS:
             """
-            Parser for version 0.4
+            Parser for version 0.4, also the start of the header of
+            version 0.5
             """
             try:
                 time_bytes = self.f.read(8)
@@ -280,6 +1015,7 @@ class BinReader(Reader):
                 meta_bytes = self.f.read(len_metadata)
                 meta_data = struct.unpack('{}s'.format(len_metadata),
                                           meta_bytes)[0]
+                meta_data = meta_data.decode('utf-8')
                 meta_lines = meta_data.split('\r\n')
                 header['metadata'] = {}
                 for line in meta_lines:
@@ -289,15 +1025,16 @@ class BinReader(Reader):
             except:
                 raise RaspyreFileFormatException("Error in metadata string")
 
-            header['datatypes'] = self.f.read(len_types)
+            header['datatypes'] = self.f.read(len_types).decode('ascii')
             try:
                 self.chunksize = struct.calcsize(header['datatypes'])
             except:
                 raise RaspyreFileFormatException("Invalid datatypes")
 
-            header['units'] = self.f.read(len_units).split()
+            header['units'] = self.f.read(len_units).decode('utf-8').split()
 
-            header['columns'] = self.f.read(len_column_names).split()
+            header['columns'] = self.f.read(
+                len_column_names).decode('utf-8').split()
 
         else:
             raise RaspyreFileFormatException(
@@ -305,6 +1042,412 @@ class BinReader(Reader):
         self.header = header
 
 
+class BinView(object):
+    """Read-only memory mapped view of the data section of a binary file.
+
+    Indexing the view by row index, slice or column name returns numpy
+    views on the mapped file without copying the data. Files that are
+    still being appended by the HandlerProcess can be followed by calling
+    :py:meth:`refresh` which maps the rows written in the meantime.
+    """
+
+    def __init__(self, filename, data_offset, dtype):
+        self.filename = filename
+        self.data_offset = data_offset
+        self.dtype = dtype
+        self.rows = None
+        self.refresh()
+
+    def refresh(self):
+        """maps all complete rows currently in the file.
+
+        :returns: the number of rows that were added since the last call
+        """
+        old_rows = len(self.rows) if self.rows is not None else 0
+        data_size = os.path.getsize(self.filename) - self.data_offset
+        count = max(data_size, 0) // self.dtype.itemsize
+        if self.rows is not None and count == old_rows:
+            return 0
+        if count == 0:
+            # mmap does not allow mapping empty regions
+            self.rows = np.empty(0, dtype=self.dtype)
+        else:
+            self.rows = np.memmap(self.filename, dtype=self.dtype, mode='r',
+                                  offset=self.data_offset, shape=(count,))
+        return count - old_rows
+
+    def column(self, name):
+        return self.rows[name]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, key):
+        return self.rows[key]
+
+
+def block_header_extension(datatypes, block_rows=BLOCK_ROWS,
+                           quantization=None):
+    """returns the part of the header of the block based format 0.5
+    following the header fields of version 0.4: the rows per block and
+    the quantization step of each column.
+    """
+    quantization = _quantization(datatypes, quantization)
+    return struct.pack('i', block_rows) + struct.pack(
+        '{}d'.format(len(datatypes)), *quantization)
+
+
+def _quantization(datatypes, quantization):
+    if not quantization:
+        return [0.0] * len(datatypes)
+    quantization = [float(step or 0.0) for step in quantization]
+    if len(quantization) != len(datatypes):
+        raise ValueError("Expected {} quantization steps, got {}".format(
+            len(datatypes), len(quantization)))
+    if quantization[0]:
+        raise ValueError("Timestamps can not be quantized")
+    return quantization
+
+
+def _encode_block(rows, datatypes, quantization, level):
+    """compresses a structured array of rows into the payload of a block.
+
+    The columns are stored one after another with their bytes shuffled
+    into planes. Timestamps are stored as differences of their int64 bit
+    patterns, so they are restored exactly, columns with a quantization
+    step as int64 multiples of the step.
+    """
+    parts = []
+    for i, name in enumerate(rows.dtype.names):
+        values = np.ascontiguousarray(rows[name])
+        if i == 0 and _delta_timestamps(datatypes):
+            values = values.view(np.int64).copy()
+            values[1:] = np.diff(values)
+        elif quantization[i]:
+            values = np.round(values / quantization[i]).astype(np.int64)
+        parts.append(values.view(np.uint8).reshape(
+            len(rows), values.dtype.itemsize).T.tobytes())
+    return zlib.compress(b''.join(parts), level)
+
+
+def _decode_block(payload, rows, dtype, datatypes, quantization):
+    """restores the structured array of rows from the payload of a block"""
+    data = zlib.decompress(payload)
+    array = np.zeros(rows, dtype=dtype)
+    offset = 0
+    for i, name in enumerate(dtype.names):
+        stored = dtype.fields[name][0]
+        if quantization[i] or (i == 0 and _delta_timestamps(datatypes)):
+            stored = np.dtype(np.int64)
+        size = rows * stored.itemsize
+        values = np.frombuffer(data, np.uint8, size, offset).reshape(
+            stored.itemsize, rows).T.copy().view(stored).ravel()
+        offset += size
+        if i == 0 and _delta_timestamps(datatypes):
+            values = np.cumsum(values, dtype=np.int64).view(
+                dtype.fields[name][0])
+        elif quantization[i]:
+            values = values * quantization[i]
+        array[name] = values
+    return array
+
+
+class BlockFile(object):
+    """File object writing the data rows of the block based binary format
+    0.5 to a file that already holds the header.
+
+    The rows are passed to :py:meth:`write` as bytes in the layout of the
+    datatypes, like the rows of version 0.4, and are written in compressed
+    blocks of block_rows rows. Each block starts with a BLOCK_HEADER
+    holding its row count, the size of the compressed data and its first
+    and last timestamp. :py:meth:`close` writes the remaining rows as a
+    shorter last block followed by the index of all blocks, which allows
+    readers to seek to any block. Files of an interrupted measurement have
+    no index and are read by scanning the block headers.
+
+    Rows are only written once a block is complete, a HandlerProcess
+    holds up to block_rows samples in memory.
+
+    :param f: binary file opened for writing, positioned after the header
+    :param datatypes: struct format string of one row
+    :param block_rows: rows per block
+    :param quantization: quantization step of each column, 0 stores the
+                         values exactly (default)
+    :param level: zlib compression level
+    """
+
+    def __init__(self, f, datatypes, block_rows=BLOCK_ROWS, quantization=None,
+                 level=6):
+        self.f = f
+        self.datatypes = datatypes
+        self.dtype = numpy_dtype(datatypes)
+        self.block_rows = block_rows
+        self.quantization = _quantization(datatypes, quantization)
+        self.level = level
+        self.pending = bytearray()
+        self.index = []
+
+    def write(self, data):
+        self.pending += data
+        block_size = self.block_rows * self.dtype.itemsize
+        while len(self.pending) >= block_size:
+            self._write_block(self.pending[:block_size])
+            del self.pending[:block_size]
+        return len(data)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        if self.f.closed:
+            return
+        rows = len(self.pending) // self.dtype.itemsize
+        if rows:
+            self._write_block(self.pending[:rows * self.dtype.itemsize])
+        if len(self.pending) % self.dtype.itemsize:
+            logging.getLogger(__name__).warning(
+                "Discarding incomplete row at the end of {}".format(
+                    self.f.name))
+        self.pending = bytearray()
+        index_offset = self.f.tell()
+        for entry in self.index:
+            self.f.write(INDEX_ENTRY.pack(*entry))
+        self.f.write(INDEX_TRAILER.pack(INDEX_MARKER, index_offset))
+        self.f.close()
+
+    def _write_block(self, data):
+        rows = np.frombuffer(bytes(data), dtype=self.dtype)
+        payload = _encode_block(rows, self.datatypes, self.quantization,
+                                self.level)
+        first = float(rows[0][0])
+        last = float(rows[-1][0])
+        self.index.append((self.f.tell(), len(rows), first, last))
+        self.f.write(BLOCK_HEADER.pack(BLOCK_MARKER, len(rows), len(payload),
+                                       first, last))
+        self.f.write(payload)
+        # complete blocks are visible to readers of the growing file
+        self.f.flush()
+
+
+class BlockReader(BinReader):
+    """Reader of the block based binary format 0.5 written by
+    :py:class:`BlockFile`.
+
+    Rows are decompressed block by block, so reading a range of rows only
+    touches the blocks containing it. The block index is read from the end
+    of the file or, for a file that is still being written, built from
+    the block headers.
+    """
+    VERSIONS = (BLOCK_VERSION, )
+
+    def __init__(self, filename):
+        self.block_offsets = []
+        self.block_rows = []
+        self.block_starts = [0]
+        self.block_times = []
+        self.complete = False
+        self.scan_offset = None
+        self.cached_block = (None, None)
+        BinReader.__init__(self, filename)
+        self.scan_offset = self.data_offset
+
+    def parseHeader(self):
+        BinReader.parseHeader(self)
+        datatypes = self.header['datatypes']
+        self.header['block_rows'] = struct.unpack('i', self.f.read(4))[0]
+        self.header['quantization'] = list(struct.unpack(
+            '{}d'.format(len(datatypes)), self.f.read(8 * len(datatypes))))
+
+    def data(self):
+        for block in range(self.block_count()):
+            for row in self.read_block(block):
+                yield tuple(row.tolist())
+        self.f.close()
+
+    def block_count(self):
+        """returns the number of complete blocks currently in the file"""
+        if not self.complete:
+            self._scan()
+        return len(self.block_offsets)
+
+    def row_count(self):
+        self.block_count()
+        return self.block_starts[-1]
+
+    def read_block(self, block):
+        """returns the rows of a block as structured array"""
+        if self.cached_block[0] == block:
+            return self.cached_block[1]
+        with open(self.filename, 'rb') as f:
+            f.seek(self.block_offsets[block])
+            _, rows, size, _, _ = BLOCK_HEADER.unpack(
+                f.read(BLOCK_HEADER.size))
+            payload = f.read(size)
+        array = _decode_block(payload, rows, self.dtype(),
+                              self.header['datatypes'],
+                              self.header['quantization'])
+        self.cached_block = (block, array)
+        return array
+
+    def find_block(self, row):
+        """returns the block containing the row"""
+        return bisect.bisect_right(self.block_starts, row) - 1
+
+    def read_array(self, start=0, stop=None):
+        rows = self.row_count()
+        start, stop, _ = slice(start, stop).indices(rows)
+        # np.concatenate would drop the alignment padding of the dtype
+        result = np.zeros(max(stop - start, 0), dtype=self.dtype())
+        if stop <= start:
+            return result
+        for block in range(self.find_block(start),
+                           self.find_block(stop - 1) + 1):
+            first = self.block_starts[block]
+            array = self.read_block(block)[max(start - first, 0):stop - first]
+            offset = max(first - start, 0)
+            result[offset:offset + len(array)] = array
+        return result
+
+    def mmap_view(self):
+        """returns a read-only view of the data rows with the interface of
+        :py:class:`BinView`, see :py:class:`BlockView`
+        """
+        return BlockView(self)
+
+    def _scan(self):
+        """adds the blocks written since the last scan to the index"""
+        size = os.path.getsize(self.filename)
+        with open(self.filename, 'rb') as f:
+            if size >= self.scan_offset + INDEX_TRAILER.size:
+                f.seek(size - INDEX_TRAILER.size)
+                marker, index_offset = INDEX_TRAILER.unpack(
+                    f.read(INDEX_TRAILER.size))
+                index_size = size - INDEX_TRAILER.size - index_offset
+                if (marker == INDEX_MARKER and
+                        index_offset >= self.data_offset and
+                        index_size % INDEX_ENTRY.size == 0):
+                    f.seek(index_offset)
+                    self._reset_index()
+                    for _ in range(index_size // INDEX_ENTRY.size):
+                        self._add_block(*INDEX_ENTRY.unpack(
+                            f.read(INDEX_ENTRY.size)))
+                    self.complete = True
+                    return
+            f.seek(self.scan_offset)
+            while True:
+                header = f.read(BLOCK_HEADER.size)
+                if len(header) < BLOCK_HEADER.size:
+                    break
+                marker, rows, payload_size, first, last = BLOCK_HEADER.unpack(
+                    header)
+                end = self.scan_offset + BLOCK_HEADER.size + payload_size
+                if marker != BLOCK_MARKER or end > size:
+                    # the block is still being written
+                    break
+                self._add_block(self.scan_offset, rows, first, last)
+                self.scan_offset = end
+                f.seek(end)
+
+    def _reset_index(self):
+        self.block_offsets = []
+        self.block_rows = []
+        self.block_starts = [0]
+        self.block_times = []
+
+    def _add_block(self, offset, rows, first, last):
+        self.block_offsets.append(offset)
+        self.block_rows.append(rows)
+        self.block_starts.append(self.block_starts[-1] + rows)
+        self.block_times.append((first, last))
+
+
+class BlockView(object):
+    """Read-only view of the data rows of a block based binary file with
+    the interface of :py:class:`BinView`.
+
+    Indexing returns numpy arrays of the decompressed rows. The last
+    accessed block is kept, so bisecting a column decompresses only a
+    few blocks.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.dtype = reader.dtype()
+        self.rows = 0
+        self.refresh()
+
+    def refresh(self):
+        old_rows = self.rows
+        self.rows = self.reader.row_count()
+        return self.rows - old_rows
+
+    def column(self, name):
+        return BlockColumn(self, name)
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.reader.read_array(0, self.rows)[key]
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.rows)
+            return self.reader.read_array(start, stop)[::step]
+        if key < 0:
+            key += self.rows
+        if not 0 <= key < self.rows:
+            raise IndexError("Row {} out of range".format(key))
+        block = self.reader.find_block(key)
+        return self.reader.read_block(block)[
+            key - self.reader.block_starts[block]]
+
+
+class BlockColumn(object):
+    """A column of a :py:class:`BlockView`"""
+
+    def __init__(self, view, name):
+        self.view = view
+        self.name = name
+        self.dtype = view.dtype.fields[name][0]
+
+    def __len__(self):
+        return len(self.view)
+
+    def __getitem__(self, key):
+        return self.view[key][self.name]
+
+
+def numpy_dtype(datatypes, columns=None):
+    """builds a NumPy structured dtype with the same memory layout as the
+    struct format string datatypes, so that a data row of a binary file
+    maps onto one element of the dtype.
+
+    :param datatypes: struct format string of one row, e.g. "dddd"
+    :param columns: list of column names, numbered fields are used if the
+                    names do not match the datatypes
+    """
+    if datatypes[:1] in ('@', '=', '<', '>', '!'):
+        raise RaspyreFileFormatException(
+            "Byte order prefix not supported: {}".format(datatypes))
+    names = list(columns) if columns else []
+    if len(names) != len(datatypes) or len(set(names)) != len(names):
+        names = ["f{}".format(i) for i in range(len(datatypes))]
+    formats = []
+    offsets = []
+    for i, char in enumerate(datatypes):
+        if char not in "bBhHiIlLqQfd?":
+            raise RaspyreFileFormatException(
+                "Unsupported datatype {}".format(char))
+        # struct inserts the same native alignment padding as a C struct
+        offsets.append(struct.calcsize(datatypes[:i + 1]) -
+                       struct.calcsize(char))
+        formats.append(np.dtype(char))
+    return np.dtype({'names': names,
+                     'formats': formats,
+                     'offsets': offsets,
+                     'itemsize': struct.calcsize(datatypes)})
+
+
 def cleanCSVLine(line):
     """cleans a CSV header line from leading # and whitespaces and
     trailing \n and whitespaces used for header parsing :param line:
@@ -319,11 +1462,26 @@ def cleanCSVLine(line):
 
 
 class Writer(object):
+    """Writer of binary and csv data files.
+
+    :param version: binary format version, (0, 4) writes raw rows,
+                    BLOCK_VERSION compressed blocks, see :py:class:`BlockFile`
+    :param block_rows: rows per block of the block based format
+    :param quantization: quantization step of each column of the block
+                         based format
+    """
     # TODO: this class should implement the Context Manager Interface
-    def __init__(self, filename, binary=True):
+    def __init__(self, filename, binary=True, version=(0, 4),
+                 block_rows=BLOCK_ROWS, quantization=None):
         self.filename = filename
         self.binary = binary
-        self.f = open(filename, "w")
+        self.version = tuple(version)
+        if self.version not in ((0, 4), BLOCK_VERSION):
+            raise RaspyreFileFormatException(
+                "Can not write file format version {}.{}".format(*version))
+        self.block_rows = block_rows
+        self.quantization = quantization
+        self.f = open(filename, "wb" if binary else "w")
 
     def writeHeader(self, header):
         meta = header['metadata']
@@ -334,11 +1492,15 @@ class Writer(object):
         date = header['time']
         if self.binary:
             header_string = build_binary_header(date, meta, fmt, units,
-                                                column_names)
+                                                column_names, self.version)
         else:
             header_string = build_csv_header(date, meta, fmt, units,
                                              column_names)
         self.f.write(header_string)
+        if self.binary and self.version == BLOCK_VERSION:
+            self.f.write(block_header_extension(fmt, self.block_rows,
+                                                self.quantization))
+            self.f = BlockFile(self.f, fmt, self.block_rows, self.quantization)
 
     def writeRow(self, row):
         if self.binary:
@@ -347,24 +1509,39 @@ class Writer(object):
             self.f.write(" ".join(["{:.19f}".format(val)
                                    for val in row]) + "\r\n")
 
+    def writeRows(self, array):
+        """writes a structured array of rows at once. The output is the
+        same as writing the rows one by one with :py:meth:`writeRow`.
+        """
+        if self.binary:
+            dtype = numpy_dtype(self.fmt, array.dtype.names)
+            self.f.write(array.astype(dtype, copy=False).tobytes())
+        else:
+            values = recfunctions.structured_to_unstructured(
+                array, dtype=np.float64)
+            np.savetxt(self.f, values, fmt="%.19f", delimiter=" ",
+                       newline="\r\n")
+
     def close(self):
         self.f.close()
 
 
-def build_binary_header(date_float, metadata, fmt, units, column_names):
-    (MAJOR_VERSION, MINOR_VERSION) = (0, 4)
+def build_binary_header(date_float, metadata, fmt, units, column_names,
+                        version=(0, 4)):
+    (MAJOR_VERSION, MINOR_VERSION) = version
     byte_buffer = io.BytesIO()
     byte_buffer.write(struct.pack('2B', *MAGIC_ID_BYTES))
     byte_buffer.write(struct.pack('2B', MAJOR_VERSION, MINOR_VERSION))
     byte_buffer.write(struct.pack('d', date_float))
     metadatastring = "\r\n".join([
         key + " " + str(value) for key, value in metadata.items()
-    ])  # TODO: does the string concat explode?
+    ]).encode('utf-8')  # TODO: does the string concat explode?
     metadatasize = len(metadatastring)
+    fmt = fmt.encode('ascii')
     fmt_size = len(fmt)
-    column_names_line = " ".join(column_names)
+    column_names_line = " ".join(column_names).encode('utf-8')
     column_names_size = len(column_names_line)
-    units_line = " ".join(units)
+    units_line = " ".join(units).encode('utf-8')
     units_size = len(units_line)
     # write size of metadatastring
     byte_buffer.write(struct.pack('i', metadatasize))
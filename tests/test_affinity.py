@@ -0,0 +1,25 @@
+from raspyre.rpc import affinity
+
+
+def test_parse_cpus():
+    assert affinity.parse_cpus(None) is None
+    assert affinity.parse_cpus(3) == [3]
+    assert affinity.parse_cpus("2-3,5") == [2, 3, 5]
+    assert affinity.parse_cpus("1,0,1\n") == [0, 1]
+    assert affinity.parse_cpus([3, 1]) == [1, 3]
+
+
+def test_isolated_cpus(tmpdir):
+    isolated = tmpdir.join("isolated")
+    isolated.write("2-3\n")
+    assert affinity.isolated_cpus(str(isolated)) == [2, 3]
+    isolated.write("\n")
+    assert affinity.isolated_cpus(str(isolated)) == []
+    assert affinity.isolated_cpus(str(tmpdir.join("missing"))) == []
+
+
+def test_set_affinity():
+    cpus = affinity.get_affinity()
+    assert affinity.set_affinity(None) == cpus
+    assert affinity.set_affinity(cpus[:1]) == cpus[:1]
+    assert affinity.set_affinity(cpus) == cpus
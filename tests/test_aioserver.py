@@ -0,0 +1,116 @@
+from raspyre.rpc import aioserver
+from raspyre import storage
+import asyncio
+import gzip
+import struct
+import threading
+import time
+import urllib.request
+import xmlrpc.client
+import pytest
+
+
+class Service(object):
+    def ping(self):
+        return True
+
+    def slow(self, seconds):
+        time.sleep(seconds)
+        return seconds
+
+    def fail(self):
+        raise ValueError("failed")
+
+
+@pytest.fixture
+def server(tmpdir):
+    server = aioserver.AsyncXMLRPCServer(('127.0.0.1', 0), workers=2,
+                                         directory=str(tmpdir),
+                                         allow_none=True)
+    server.register_instance(Service())
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+    server.url = "http://127.0.0.1:{}".format(
+        server.server.sockets[0].getsockname()[1])
+    yield server
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def test_rpc_calls(server):
+    with xmlrpc.client.ServerProxy(server.url + "/RPC2") as proxy:
+        assert proxy.ping()
+        assert proxy.ping()
+        with pytest.raises(xmlrpc.client.Fault):
+            proxy.fail()
+
+
+def test_concurrent_calls(server):
+    results = []
+
+    def slow_call():
+        with xmlrpc.client.ServerProxy(server.url) as proxy:
+            results.append(proxy.slow(0.5))
+    thread = threading.Thread(target=slow_call)
+    thread.start()
+    time.sleep(0.1)
+    start = time.time()
+    with xmlrpc.client.ServerProxy(server.url) as proxy:
+        assert proxy.ping()
+    assert time.time() - start < 0.4
+    thread.join()
+    assert results == [0.5]
+
+
+def test_file_download(server, tmpdir):
+    tmpdir.join("data.bin").write_binary(b"\x00\x01" * 1000)
+    with urllib.request.urlopen(server.url + "/data.bin") as response:
+        assert response.status == 200
+        assert response.headers['Content-Length'] == "2000"
+        assert response.read() == b"\x00\x01" * 1000
+    with pytest.raises(urllib.error.HTTPError) as e:
+        urllib.request.urlopen(server.url + "/../missing.bin")
+    assert e.value.code == 404
+
+
+def test_file_download_range(server, tmpdir):
+    tmpdir.join("data.bin").write_binary(bytes(range(256)) * 4)
+    request = urllib.request.Request(server.url + "/data.bin",
+                                     headers={'Range': 'bytes=1000-'})
+    with urllib.request.urlopen(request) as response:
+        assert response.status == 206
+        assert response.headers['Content-Range'] == "bytes 1000-1023/1024"
+        assert response.read() == bytes(range(232, 256))
+        etag = response.headers['ETag']
+    request = urllib.request.Request(
+        server.url + "/data.bin",
+        headers={'Range': 'bytes=1000-', 'If-Range': '"changed"'})
+    with urllib.request.urlopen(request) as response:
+        assert response.status == 200
+        assert len(response.read()) == 1024
+    assert etag
+
+
+def test_file_download_compressed(server, tmpdir):
+    filename = str(tmpdir.join("data.bin"))
+    with open(filename, 'wb') as f:
+        f.write(storage.build_binary_header(0.0, {}, "dd", ["s", "g"],
+                                            ["time", "accx"]))
+        for i in range(1000):
+            f.write(struct.pack("dd", i * 0.01, 1.0))
+    with open(filename, 'rb') as f:
+        content = f.read()
+    request = urllib.request.Request(
+        server.url + "/data.bin",
+        headers={'Accept-Encoding': 'gzip, x-raspyre-delta'})
+    with urllib.request.urlopen(request) as response:
+        assert response.status == 200
+        assert response.headers['Content-Encoding'] == "x-raspyre-delta, gzip"
+        assert response.headers['Content-Length'] is None
+        body = response.read()
+    assert len(body) < len(content) / 4
+    assert storage.delta_unfilter(gzip.decompress(body)) == content
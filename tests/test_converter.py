@@ -1,5 +1,7 @@
 from raspyre import converter
+import numpy as np
 import pytest
+import json
 import os
 
 
@@ -311,3 +313,112 @@ def test_argparse_non_existing_output_folder(mocker):
 
     #assert e.type == SystemExit
     #assert e.value.code == 4
+
+
+def test_convert_binary_to_csv_chunks(tmpdir):
+    source = "converter_tests/input_folder/level0_test1.bin"
+    target = str(tmpdir.join("chunked.csv"))
+    converter.convert_binary_to_csv(source, target, chunk_rows=7)
+
+    expected = str(tmpdir.join("rows.csv"))
+    reader = converter.storage.getReader(source)
+    writer = converter.storage.Writer(expected, binary=False)
+    writer.writeHeader(reader.header)
+    for row in reader.data():
+        writer.writeRow(row)
+    writer.close()
+    with open(target) as f, open(expected) as g:
+        assert f.read() == g.read()
+
+
+def test_argparse_jobs(mocker, tmpdir, capsys):
+    testargs = [
+        "prog", "converter_tests/input_folder/level0_test1.bin",
+        "converter_tests/input_folder/level0_test3.bin",
+        "-o", str(tmpdir), "-j", "2"
+    ]
+    mocker.patch.object(converter.sys, 'argv', testargs)
+    converter.main()
+    assert tmpdir.join("level0_test1.csv").check()
+    assert tmpdir.join("level0_test3.csv").check()
+    out, err = capsys.readouterr()
+    assert "Converted 2 of 2 files" in out
+
+
+def test_convert_binary_to_npz(tmpdir):
+    source = "converter_tests/input_folder/level0_test1.bin"
+    target = str(tmpdir.join("out.npz"))
+    converter.convert_binary_to_npz(source, target, chunk_rows=7)
+    reader = converter.storage.getReader(source)
+    expected = reader.read_array()
+    with np.load(target) as archive:
+        for name in expected.dtype.names:
+            assert archive[name].tolist() == expected[name].tolist()
+        header = json.loads(str(archive['__header__']))
+    assert header['columns'] == reader.header['columns']
+    assert header['units'] == reader.header['units']
+
+
+def test_convert_binary_to_npy(tmpdir):
+    source = "converter_tests/input_folder/level0_test1.bin"
+    target = str(tmpdir.join("out.npy"))
+    converter.convert_binary_to_npy(source, target, chunk_rows=7)
+    reader = converter.storage.getReader(source)
+    assert np.load(target).tolist() == reader.read_array().tolist()
+    with open(target + ".json") as f:
+        assert json.load(f)['metadata'] == reader.header['metadata']
+
+
+def test_convert_binary_to_hdf5(tmpdir):
+    h5py = pytest.importorskip("h5py")
+    source = "converter_tests/input_folder/level0_test1.bin"
+    target = str(tmpdir.join("out.h5"))
+    converter.convert_binary_to_hdf5(source, target, chunk_rows=7)
+    reader = converter.storage.getReader(source)
+    expected = reader.read_array()
+    units = dict(zip(expected.dtype.names, reader.header['units']))
+    with h5py.File(target, 'r') as f:
+        for name in expected.dtype.names:
+            assert f[name][:].tolist() == expected[name].tolist()
+            assert f[name].attrs['unit'] == units[name]
+        header = json.loads(f.attrs['raspyre_header'])
+    assert header['columns'] == reader.header['columns']
+
+
+def test_convert_binary_to_parquet(tmpdir):
+    pq = pytest.importorskip("pyarrow.parquet")
+    source = "converter_tests/input_folder/level0_test1.bin"
+    target = str(tmpdir.join("out.parquet"))
+    converter.convert_binary_to_parquet(source, target, chunk_rows=7)
+    reader = converter.storage.getReader(source)
+    expected = reader.read_array()
+    units = dict(zip(expected.dtype.names, reader.header['units']))
+    table = pq.read_table(target)
+    assert table.column_names == list(expected.dtype.names)
+    for name in expected.dtype.names:
+        assert table.column(name).to_pylist() == expected[name].tolist()
+        field = table.schema.field(name)
+        assert field.metadata[b'unit'].decode() == units[name]
+    header = json.loads(table.schema.metadata[b'raspyre'])
+    assert header['columns'] == reader.header['columns']
+
+
+def test_argparse_format_missing_module(mocker):
+    testargs = [
+        "prog", "converter_tests/input_folder/level0_test1.bin",
+        "--format", "parquet"
+    ]
+    mocker.patch.object(converter.sys, 'argv', testargs)
+    mocker.patch.object(converter.importlib.util, 'find_spec',
+                        return_value=None)
+    with pytest.raises(SystemExit) as e:
+        converter.main()
+    assert e.value.code == 12
+
+
+def test_convert_csv_to_binary_chunks(tmpdir):
+    source = "converter_tests/input_folder/level0_test3.csv"
+    target = str(tmpdir.join("out.bin"))
+    converter.convert_csv_to_binary(source, target, chunk_rows=7)
+    rows = list(converter.storage.getReader(source).data())
+    assert list(converter.storage.getReader(target).data()) == rows
@@ -0,0 +1,154 @@
+import ctypes
+import glob
+import mmap
+import os
+import struct
+import time
+
+import pytest
+
+zmq = pytest.importorskip("zmq")
+from raspyre import storage
+from raspyre.rpc import handler, ringbuffer
+from raspyre.sensors.mockup import Mockup
+
+DATA_SIZE = struct.calcsize('dd')
+RING_SIZE = 16
+BUFFER_SIZE = ctypes.sizeof(ringbuffer.RingHeader) + RING_SIZE * DATA_SIZE
+# a multiple of the chunk length
+T0 = 1500000000.0
+
+
+class Producer(object):
+    """writes samples into the ring buffer like the PollingProcess"""
+
+    def __init__(self, path):
+        with open(path, 'wb') as f:
+            f.write(b'\x00' * BUFFER_SIZE)
+        self.f = open(path, 'r+b')
+        self.buf = mmap.mmap(self.f.fileno(), BUFFER_SIZE)
+        self.header = ringbuffer.RingHeader.from_buffer(self.buf)
+
+    def write(self, timestamps):
+        for timestamp in timestamps:
+            seq = self.header.write_seq
+            offset = (ctypes.sizeof(ringbuffer.RingHeader) +
+                      seq % RING_SIZE * DATA_SIZE)
+            struct.pack_into('dd', self.buf, offset, timestamp, float(seq))
+            self.header.write_seq = seq + 1
+
+
+class Socket(object):
+    def __init__(self):
+        self.messages = []
+
+    def send(self, data):
+        self.messages.append(bytes(data))
+
+
+def handler_process(tmpdir, **kwargs):
+    mmap_file = str(tmpdir.join("buf"))
+    data_dir = tmpdir.mkdir("data")
+    producer = Producer(mmap_file)
+    process = handler.HandlerProcess(
+        sensor=Mockup(sps=1000), sensor_name="mockup", config={},
+        frequency=1, axis=['x'], mmap_file=mmap_file,
+        buffer_size=BUFFER_SIZE, data_dir=str(data_dir), publish=False,
+        **kwargs)
+    return producer, process, data_dir
+
+
+def read_files(data_dir):
+    files = sorted(glob.glob(os.path.join(str(data_dir), '*.bin')))
+    return [[row[0] for row in storage.getReader(name).data()]
+            for name in files]
+
+
+def test_drain_across_ring_wrap(tmpdir):
+    producer, process, data_dir = handler_process(tmpdir, batch_size=3)
+    socket = Socket()
+    process.attach(socket)
+    timestamps = [T0 + i for i in range(40)]
+    # every drain but the first wraps around the end of the ring
+    for start in range(0, 40, 10):
+        producer.write(timestamps[start:start + 10])
+        process.poll()
+    process.detach()
+
+    assert read_files(data_dir) == [timestamps]
+    samples = [struct.unpack_from('dd', message, offset)[0]
+               for message in socket.messages
+               for offset in range(0, len(message), DATA_SIZE)]
+    assert samples == timestamps
+    assert max(len(message) for message in socket.messages) == 3 * DATA_SIZE
+    assert process.ring.reader.overruns == 0
+
+
+def test_chunk_end(tmpdir):
+    _, process, _ = handler_process(tmpdir, chunked=True, chunk_minutes=10)
+    assert process._chunk_end(T0) == T0 + 600
+    assert process._chunk_end(T0 + 599.9) == T0 + 600
+    assert process._chunk_end(T0 + 600) == T0 + 1200
+
+
+def test_chunks_without_lost_samples(tmpdir):
+    producer, process, data_dir = handler_process(tmpdir, chunked=True,
+                                                  chunk_minutes=1)
+    process.attach()
+    # chunk boundaries fall inside the drained regions and onto the first
+    # slot of a region, once together with the ring wrap
+    timestamps = [T0 + 10 + 7 * i for i in range(45)]
+    start = 0
+    for count in (5, 11, 1, 9, 7, 12):
+        producer.write(timestamps[start:start + count])
+        start += count
+        process.poll()
+    process.detach()
+
+    chunks = read_files(data_dir)
+    assert [t for chunk in chunks for t in chunk] == timestamps
+    assert len(chunks) == 6
+    for chunk in chunks:
+        start = process._chunk_end(chunk[0]) - 60
+        assert all(start <= t < start + 60 for t in chunk)
+
+
+def test_find_chunk_split(tmpdir):
+    producer, process, _ = handler_process(tmpdir, chunked=True,
+                                           chunk_minutes=1)
+    producer.write([T0 + 55 + i for i in range(10)])
+    process.chunk_end = T0 + 60
+    assert process._find_chunk_split(0, 10) == 5
+    assert process._find_chunk_split(5, 10) == 5
+    assert process._find_chunk_split(0, 4) == 4
+
+
+def test_monotonic_anchors(tmpdir):
+    producer, process, data_dir = handler_process(
+        tmpdir, timestamps='monotonic', anchor_interval=0.0)
+    process.attach()
+    monotonic = time.clock_gettime(time.CLOCK_MONOTONIC)
+    producer.write([monotonic, monotonic + 0.001])
+    process.poll()
+    process.poll()
+    process.detach()
+
+    name, = glob.glob(os.path.join(str(data_dir), '*.bin'))
+    with open(name + storage.ANCHOR_SUFFIX) as f:
+        assert f.readline() == "# monotonic realtime\n"
+    anchors = storage.read_anchors(name)
+    # one anchor when the file is opened and one per poll
+    assert len(anchors) == 3
+    assert all(anchors[1:, 0] >= anchors[:-1, 0])
+    offset = time.time() - time.clock_gettime(time.CLOCK_MONOTONIC)
+    assert abs(anchors[:, 1] - anchors[:, 0] - offset).max() < 0.01
+    assert process.anchors is None
+
+
+def test_run_stores_last_samples(tmpdir):
+    producer, process, data_dir = handler_process(tmpdir)
+    producer.write([T0 + i for i in range(5)])
+    # the samples are written after the last poll of the loop
+    process.shutdown()
+    process.run()
+    assert read_files(data_dir) == [[T0 + i for i in range(5)]]
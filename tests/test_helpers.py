@@ -0,0 +1,21 @@
+import pytest
+
+from raspyre.helpers import rec2DF
+from raspyre.record import record_type
+
+pandas = pytest.importorskip("pandas")
+
+
+def test_rec2DF_fast_records():
+    FastRecord = record_type(['x'])
+    df = rec2DF([FastRecord(1.0, 2.0), FastRecord(2.0, 3.0)])
+    assert list(df.columns) == ['time', 'x']
+    assert df['x'].tolist() == [2.0, 3.0]
+
+
+def test_rec2DF_plain_tuples():
+    df = rec2DF([(1.0, 2.0, 3.0), (2.0, 4.0, 5.0)], axis=['x', 'y'])
+    assert list(df.columns) == ['time', 'x', 'y']
+    assert df['y'].tolist() == [3.0, 5.0]
+    # without axis pandas numbers the columns
+    assert rec2DF([(1.0, 2.0)]).shape == (1, 2)
@@ -0,0 +1,105 @@
+from raspyre.rpc import httpfiles
+import email.utils
+import gzip
+import os
+import time
+
+
+def test_parse_range():
+    assert httpfiles.parse_range("bytes=0-99", 1000) == (0, 100)
+    assert httpfiles.parse_range("bytes=900-", 1000) == (900, 1000)
+    assert httpfiles.parse_range("bytes=-100", 1000) == (900, 1000)
+    assert httpfiles.parse_range("bytes=900-2000", 1000) == (900, 1000)
+    assert httpfiles.parse_range("bytes=1000-", 1000) is False
+    assert httpfiles.parse_range("bytes=0-1,5-9", 1000) is None
+    assert httpfiles.parse_range("items=0-1", 1000) is None
+    assert httpfiles.parse_range("bytes=9-5", 1000) is None
+
+
+def test_file_response(tmpdir):
+    filename = tmpdir.join("data.bin")
+    filename.write_binary(b"x" * 1000)
+    stat = os.stat(str(filename))
+    tag = httpfiles.etag(stat)
+
+    response = httpfiles.file_response(stat, {}, "application/octet-stream")
+    assert (response.status, response.start, response.length) == (200, 0, 1000)
+    assert ('ETag', tag) in response.headers
+
+    response = httpfiles.file_response(stat, {'range': 'bytes=100-'}, "x")
+    assert (response.status, response.start, response.length) == (206, 100, 900)
+    assert ('Content-Range', 'bytes 100-999/1000') in response.headers
+
+    response = httpfiles.file_response(
+        stat, {'range': 'bytes=100-', 'if-range': tag}, "x")
+    assert response.status == 206
+    last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+    response = httpfiles.file_response(
+        stat, {'range': 'bytes=100-', 'if-range': last_modified}, "x")
+    assert response.status == 206
+    # the file changed since the first part was downloaded
+    response = httpfiles.file_response(
+        stat, {'range': 'bytes=100-', 'if-range': '"other"'}, "x")
+    assert (response.status, response.length) == (200, 1000)
+
+    response = httpfiles.file_response(stat, {'range': 'bytes=2000-'}, "x")
+    assert (response.status, response.length) == (416, 0)
+    assert ('Content-Range', 'bytes */1000') in response.headers
+
+    response = httpfiles.file_response(stat, {'if-none-match': tag}, "x")
+    assert (response.status, response.length) == (304, 0)
+
+
+def test_negotiate(tmpdir, monkeypatch):
+    filename = tmpdir.join("data.bin")
+    filename.write_binary(b"\xeb\xff\x00\x04")
+    path = str(filename)
+    monkeypatch.setattr(httpfiles, "available", lambda coding: coding == "gzip")
+    assert httpfiles.negotiate({}, path) == []
+    assert httpfiles.negotiate({'accept-encoding': 'gzip, deflate'}, path) == ['gzip']
+    assert httpfiles.negotiate({'accept-encoding': 'zstd'}, path) == []
+    assert httpfiles.negotiate({'accept-encoding': 'gzip;q=0'}, path) == []
+    assert httpfiles.negotiate(
+        {'accept-encoding': 'zstd, x-raspyre-delta, gzip;q=0.5'}, path) == [
+            'x-raspyre-delta', 'gzip']
+    tmpdir.join("notes.txt").write("text")
+    assert httpfiles.negotiate({'accept-encoding': 'x-raspyre-delta, *'},
+                               str(tmpdir.join("notes.txt"))) == ['gzip']
+
+
+def test_open_file_compressed(tmpdir):
+    filename = tmpdir.join("data.txt")
+    content = b"0.5 1.5\r\n" * 1000
+    filename.write_binary(content)
+    path = str(filename)
+    headers = {'accept-encoding': 'gzip'}
+
+    # the file may still be written to, it is compressed on the fly
+    f, response = httpfiles.open_file(path, headers, "text/plain")
+    f.close()
+    assert response.length is None
+    assert ('Content-Encoding', 'gzip') in response.headers
+    assert gzip.decompress(b"".join(response.stream)) == content
+    assert not tmpdir.join(".data.txt.gz").exists()
+
+    old = time.time() - 2 * httpfiles.FINALIZED_AGE
+    os.utime(path, (old, old))
+    f, response = httpfiles.open_file(path, headers, "text/plain")
+    with f:
+        assert response.stream is None
+        assert response.status == 200
+        assert gzip.decompress(f.read()) == content
+    cached = tmpdir.join(".data.txt.gz")
+    assert response.length == cached.size()
+    assert ('Content-Encoding', 'gzip') in response.headers
+
+    # the cached copy is reused and supports ranges
+    mtime = cached.mtime()
+    f, response = httpfiles.open_file(
+        path, dict(headers, range='bytes=10-'), "text/plain")
+    f.close()
+    assert response.status == 206
+    assert cached.mtime() == mtime
+
+    httpfiles.remove_cached(path)
+    assert not cached.exists()
@@ -0,0 +1,113 @@
+import mmap
+
+import pytest
+
+try:
+    from raspyre.rpc import pollingprocess
+except OSError:
+    # the real time functions are loaded from librt.so
+    pytest.skip("librt.so is not available", allow_module_level=True)
+from raspyre.rpc.pollingprocess import NSEC_PER_SEC, Timespec, timespec_ns
+from raspyre.rpc.ringbuffer import TimingStats
+from raspyre.sensors.mockup import Mockup
+
+DELAY = NSEC_PER_SEC // 1000
+# close to a full second to cover the carry into tv_sec
+START = 1000 * NSEC_PER_SEC + NSEC_PER_SEC - DELAY // 2
+
+
+def timespec(nanoseconds):
+    return Timespec(nanoseconds // NSEC_PER_SEC, nanoseconds % NSEC_PER_SEC)
+
+
+@pytest.mark.parametrize("policy, lateness, read, skipped, gaps, moved", [
+    ('burst', 0, True, 0, 0, 0),
+    ('skip', 0, True, 0, 0, 0),
+    ('resync', 0, True, 0, 0, 0),
+    ('burst', DELAY // 2, True, 0, 0, 0),
+    ('skip', DELAY // 2, True, 0, 0, 0),
+    ('resync', DELAY // 2, True, 0, 0, 0),
+    # the deadline of the following period passed
+    ('burst', 3 * DELAY + DELAY // 2, True, 1, 0, 0),
+    ('skip', 3 * DELAY + DELAY // 2, True, 3, 1, 3 * DELAY),
+    ('resync', 3 * DELAY + DELAY // 2, False, 4, 1, 3 * DELAY),
+    ('skip', DELAY, True, 1, 1, DELAY),
+    ('resync', DELAY, False, 2, 1, DELAY),
+])
+def test_catch_up(policy, lateness, read, skipped, gaps, moved):
+    deadline = timespec(START)
+    woken = timespec(START + lateness)
+    timings = [TimingStats(), TimingStats()]
+    assert pollingprocess.catch_up(policy, deadline, woken, DELAY,
+                                   timings) is read
+    assert timespec_ns(deadline) == START + moved
+    # every sensor of a group gets the same statistics
+    for timing in timings:
+        assert timing.skipped_periods == skipped
+        assert timing.gaps == gaps
+        assert timing.max_lateness_ns == lateness
+        assert sum(timing.lateness) == 1
+        assert (timing.last_gap_time > 0) == (gaps > 0)
+
+
+def test_catch_up_burst_counts_each_missed_period():
+    deadline = timespec(START)
+    woken = timespec(START + 3 * DELAY + DELAY // 2)
+    timing = TimingStats()
+    reads = 0
+    # the polling loop does not sleep until it caught up with the clock
+    while timespec_ns(deadline) <= timespec_ns(woken):
+        if pollingprocess.catch_up('burst', deadline, woken, DELAY, [timing]):
+            reads += 1
+        pollingprocess.advance(deadline, DELAY)
+    assert reads == 4
+    assert timing.skipped_periods == 3
+    assert timing.gaps == 0
+
+
+def polling_process(tmpdir, name, frequency):
+    return pollingprocess.PollingProcess(
+        sensor=Mockup(sps=1000), sensor_name=name, config={},
+        frequency=frequency, axis=['x'], data_dir=str(tmpdir),
+        mmap_file=str(tmpdir.join(name)), buffer_size=mmap.PAGESIZE)
+
+
+def test_group_schedule(tmpdir):
+    members = [polling_process(tmpdir, name, frequency)
+               for name, frequency in (('slow', 10), ('fast', 100),
+                                       ('half', 50))]
+    group = pollingprocess.GroupPollingProcess(members)
+    assert [m.sensor_name for m in group.members] == ['fast', 'half', 'slow']
+    assert group.divisors == [1, 2, 10]
+    reads = {member.sensor_name: 0 for member in members}
+    for tick in range(100):
+        due = group.due(tick)
+        # every tick starts with the fastest sensor
+        assert due[0].sensor_name == 'fast'
+        for member in due:
+            reads[member.sensor_name] += 1
+    assert reads == {'fast': 100, 'half': 50, 'slow': 10}
+    assert [m.sensor_name for m in group.due(0)] == ['fast', 'half', 'slow']
+    assert [m.sensor_name for m in group.due(5)] == ['fast']
+    for member in members:
+        member.close()
+
+
+def test_group_rejects_non_divisor(tmpdir):
+    members = [polling_process(tmpdir, 'fast', 100),
+               polling_process(tmpdir, 'odd', 30)]
+    with pytest.raises(ValueError):
+        pollingprocess.GroupPollingProcess(members)
+    for member in members:
+        member.close()
+
+
+def test_group_divisors():
+    assert pollingprocess.group_divisors({'a': 100, 'b': 25.0, 'c': 100}) == {
+        'a': 1, 'b': 4, 'c': 1}
+    assert pollingprocess.group_divisors({'a': 0.5}) == {'a': 1}
+    with pytest.raises(ValueError, match='"b"'):
+        pollingprocess.group_divisors({'a': 100, 'b': 30})
+    # a faster sensor may invalidate the group
+    with pytest.raises(ValueError):
+        pollingprocess.group_divisors({'a': 100, 'b': 50, 'c': 150})
@@ -36,3 +36,68 @@ def test_sensor_units():
     test_sensor = TestSensor()
     units = test_sensor.units(['att2', 'att4', 'att3'])
     assert units == ['s', 'g', 'C']
+
+def test_sensor_read_into():
+    import struct
+    from raspyre.record import Record
+
+    class RecordSensor(TestSensor):
+        def getRecord(self, *args):
+            record = Record({'att1': 1.5, 'att2': 7})
+            record['time'] = 10.0
+            return record
+
+    packer = struct.Struct('ddi')
+    buf = bytearray(64)
+    RecordSensor().read_into(buf, 4, packer, 'att1', 'att2')
+    assert packer.unpack_from(buf, 4) == (10.0, 1.5, 7)
+
+    from raspyre.sensors.mockup import Mockup
+    sensor = Mockup(sps=100)
+    sensor.read_into(buf, 4, struct.Struct('ddd'), 'x', 'z')
+    with pytest.raises(KeyError):
+        sensor.read_into(buf, 4, struct.Struct('dd'), 'q')
+
+def test_sensor_block_read():
+    from raspyre.sensors.mockup import Mockup
+    assert not TestSensor().supportsBlockRead()
+    with pytest.raises(NotImplementedError):
+        TestSensor().getRecords(10, 'att1')
+
+    sensor = Mockup(sps=1000)
+    assert sensor.supportsBlockRead()
+    sensor.lastSample -= 0.5
+    rows = sensor.getRecords(100, 'x', 'y')
+    assert len(rows) == 100
+    assert all(len(row) == 3 for row in rows)
+    assert rows[1][0] - rows[0][0] == pytest.approx(0.001, abs=1e-6)
+
+def test_fast_record():
+    from raspyre.record import Record, record_type
+    XY = record_type(['x', 'y'])
+    assert record_type(('x', 'y')) is XY
+    rec = XY(5.0, 0.1, 0.2)
+    assert rec['time'] == rec['timestamp'] == rec.time == 5.0
+    assert rec['y'] == rec.y == rec[2] == 0.2
+    assert tuple(rec) == (5.0, 0.1, 0.2)
+    with pytest.raises(KeyError):
+        rec['z']
+
+    record = Record({'x': 1})
+    assert record['timestamp'] == record['time']
+    with pytest.raises(KeyError):
+        record['y']
+
+
+def test_sensor_read_into_fast_record():
+    import struct
+    from raspyre.record import record_type
+
+    class FastSensor(TestSensor):
+        def getRecord(self, *args):
+            return record_type(args)(3.0, 2.5, 4)
+
+    packer = struct.Struct('ddi')
+    buf = bytearray(packer.size)
+    FastSensor().read_into(buf, 0, packer, 'att4', 'att2')
+    assert packer.unpack(bytes(buf)) == (3.0, 2.5, 4)
@@ -0,0 +1,179 @@
+from raspyre.rpc import ringbuffer
+import ctypes
+import mmap
+import struct
+
+
+DATA_SIZE = struct.calcsize('dd')
+BUFFER_SIZE = ctypes.sizeof(ringbuffer.RingHeader) + 10 * DATA_SIZE
+
+
+class Producer(object):
+    def __init__(self, path):
+        with open(path, 'wb') as f:
+            f.write(b'\x00' * BUFFER_SIZE)
+        self.f = open(path, 'r+b')
+        self.buf = mmap.mmap(self.f.fileno(), BUFFER_SIZE)
+        self.header = ringbuffer.RingHeader.from_buffer(self.buf)
+
+    def write(self, count):
+        for _ in range(count):
+            seq = self.header.write_seq
+            offset = ctypes.sizeof(ringbuffer.RingHeader) + seq % 10 * DATA_SIZE
+            struct.pack_into('dd', self.buf, offset, float(seq), 0.0)
+            self.header.write_seq = seq + 1
+
+
+def collect(reader):
+    timestamps = []
+
+    def drain(start, stop):
+        timestamps.extend(reader.timestamp(slot) for slot in range(start, stop))
+    reader.read(drain)
+    return timestamps
+
+
+def test_notifier_without_waiter(tmpdir):
+    header = ringbuffer.RingHeader()
+    header.readers[0].active = 1
+    notifier = ringbuffer.RingNotifier(str(tmpdir.join("buf")), header)
+    notifier.post()
+    assert notifier.fds == [None] * ringbuffer.MAX_READERS
+
+
+def test_notifier_wakes_active_waiters(tmpdir):
+    mmap_file = str(tmpdir.join("buf"))
+    header = ringbuffer.RingHeader()
+    waiters = []
+    for slot in (0, 2):
+        header.readers[slot].active = 1
+        waiter = ringbuffer.RingWaiter(ringbuffer.notify_path(mmap_file, slot))
+        waiter.open()
+        waiters.append(waiter)
+    notifier = ringbuffer.RingNotifier(mmap_file, header, every=3)
+
+    notifier.post()
+    notifier.post()
+    assert not waiters[0].wait(0)
+    notifier.post()
+    assert waiters[0].wait(0)
+    assert waiters[1].wait(0)
+    assert not waiters[0].wait(0)
+
+    header.readers[2].active = 0
+    for _ in range(3):
+        notifier.post()
+    assert waiters[0].wait(0)
+    assert not waiters[1].wait(0)
+
+    notifier.close()
+    for waiter in waiters:
+        waiter.close()
+    assert not tmpdir.join("buf.notify0").exists()
+
+
+def test_readers_are_independent(tmpdir):
+    mmap_file = str(tmpdir.join("buf"))
+    producer = Producer(mmap_file)
+    handler = ringbuffer.RingReader(mmap_file, BUFFER_SIZE, DATA_SIZE)
+    handler.attach()
+    producer.write(3)
+    stream = ringbuffer.RingReader(mmap_file, BUFFER_SIZE, DATA_SIZE, slot=1)
+    stream.attach(from_start=False)
+
+    producer.write(4)
+    assert collect(handler) == [0, 1, 2, 3, 4, 5, 6]
+    producer.write(6)
+    assert collect(handler) == [7, 8, 9, 10, 11, 12]
+
+    # the stream fell behind and lost the oldest sample
+    assert collect(stream) == [4, 5, 6, 7, 8, 9, 10, 11, 12]
+    stats = ringbuffer.read_header(mmap_file)
+    assert stats['write_seq'] == 13
+    assert stats['readers'] == [
+        {'slot': 0, 'read_seq': 13, 'overruns': 0, 'lost': 0,
+         'last_gap_time': 0.0},
+        {'slot': 1, 'read_seq': 13, 'overruns': 1, 'lost': 1,
+         'last_gap_time': 4.0}]
+
+    stream.detach()
+    assert [r['slot'] for r in ringbuffer.read_header(mmap_file)['readers']] == [0]
+
+
+def test_read_sequence():
+    header = ringbuffer.RingHeader(write_seq=2**40 + 3)
+    assert ringbuffer.read_sequence(header, 'write_seq') == 2**40 + 3
+
+
+def test_timing_stats(tmpdir):
+    assert ringbuffer.histogram_bin(999) == 0
+    assert ringbuffer.histogram_bin(1000) == 1
+    assert ringbuffer.histogram_bin(3999) == 2
+    assert ringbuffer.histogram_bin(10 ** 12) == ringbuffer.HISTOGRAM_BINS - 1
+
+    mmap_file = str(tmpdir.join("buf"))
+    producer = Producer(mmap_file)
+    timing = producer.header.timing
+    timing.periods = 3
+    timing.lateness[ringbuffer.histogram_bin(1500)] += 3
+    stats = ringbuffer.read_timing(mmap_file)
+    assert stats['periods'] == 3
+    assert stats['deadline_misses'] == 0
+    assert stats['lateness'][1] == 3
+    assert len(stats['bin_edges_us']) == ringbuffer.HISTOGRAM_BINS
+    assert stats['bin_edges_us'][1:3] == [1, 2]
+
+
+def test_wait_any(tmpdir):
+    mmap_file = str(tmpdir.join("buf"))
+    producer = Producer(mmap_file)
+    readers = [ringbuffer.RingReader(mmap_file, BUFFER_SIZE, DATA_SIZE, slot)
+               for slot in (0, 1)]
+    for reader in readers:
+        reader.attach()
+    notifier = ringbuffer.RingNotifier(mmap_file, producer.header)
+
+    assert not ringbuffer.wait_any(readers, 0)
+    notifier.post()
+    assert ringbuffer.wait_any(readers, 0)
+    assert not ringbuffer.wait_any(readers, 0)
+
+    notifier.close()
+    for reader in readers:
+        reader.detach()
+
+
+def test_notifier_counts_blocks(tmpdir):
+    mmap_file = str(tmpdir.join("buf"))
+    header = ringbuffer.RingHeader()
+    header.readers[0].active = 1
+    waiter = ringbuffer.RingWaiter(ringbuffer.notify_path(mmap_file, 0))
+    waiter.open()
+    notifier = ringbuffer.RingNotifier(mmap_file, header, every=4)
+    notifier.post(3)
+    assert not waiter.wait(0)
+    notifier.post(3)
+    assert waiter.wait(0)
+    notifier.close()
+    waiter.close()
+
+
+def test_overwritten_while_draining(tmpdir):
+    mmap_file = str(tmpdir.join("buf"))
+    producer = Producer(mmap_file)
+    reader = ringbuffer.RingReader(mmap_file, BUFFER_SIZE, DATA_SIZE)
+    reader.attach()
+    producer.write(2)
+
+    def drain(start, stop):
+        # the producer catches up with the first drained slot
+        producer.write(8)
+    reader.read(drain)
+    assert reader.reader.overruns == 1
+
+
+def test_timing_histograms_do_not_wrap():
+    timing = ringbuffer.TimingStats()
+    timing.lateness[0] = 2 ** 32
+    timing.lateness[0] += 1
+    assert timing.lateness[0] == 2 ** 32 + 1
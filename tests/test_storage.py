@@ -1,7 +1,9 @@
 from raspyre import storage
+import numpy as np
 import pytest
 from mock import mock_open, patch
 import struct
+import zlib
 
 
 def setup_module(storage):
@@ -115,3 +117,430 @@ def test_bin_reader_constructor():
 #     os.remove(finalfile)
     # os.remove(finalcsvfile)
 
+
+
+def test_numpy_dtype_layout():
+    dtype = storage.numpy_dtype("dfd", ["time", "a", "b"])
+    assert dtype.names == ("time", "a", "b")
+    assert dtype.itemsize == struct.calcsize("dfd")
+    assert dtype.fields["b"][1] == struct.calcsize("dfd") - 8
+
+    dtype = storage.numpy_dtype("ddd", ["time", "time", "x"])
+    assert dtype.names == ("f0", "f1", "f2")
+
+    with pytest.raises(storage.RaspyreFileFormatException):
+        storage.numpy_dtype("d10s")
+
+
+def test_bin_reader_read_array():
+    filename = "converter_tests/input_folder/level0_test1.bin"
+    rows = list(storage.BinReader(filename).data())
+    reader = storage.BinReader(filename)
+    assert reader.header["datatypes"] == "dddd"
+    assert reader.header["columns"] == ["time", "accx", "accy", "accz"]
+    assert reader.row_count() == len(rows)
+
+    array = reader.read_array()
+    assert len(array) == len(rows)
+    assert tuple(array[0]) == rows[0]
+    assert tuple(array[-1]) == rows[-1]
+
+    part = reader.read_array(10, 20)
+    assert [tuple(r) for r in part] == rows[10:20]
+    assert len(reader.read_array(len(rows) - 5, len(rows) + 5)) == 5
+
+    columns = reader.read_columns(stop=100)
+    assert list(columns["accy"]) == [r[2] for r in rows[:100]]
+
+    chunks = list(reader.iter_arrays(chunk_rows=10000))
+    assert sum(len(chunk) for chunk in chunks) == len(rows)
+
+
+def test_bin_view_follows_appended_rows(tmpdir):
+    source = "converter_tests/input_folder/level0_test3.bin"
+    reader = storage.BinReader(source)
+    filename = str(tmpdir.join("growing.bin"))
+    with open(source, 'rb') as f:
+        header = f.read(reader.data_offset)
+        rows = f.read()
+    with open(filename, 'wb') as f:
+        f.write(header)
+
+    view = storage.BinReader(filename).mmap_view()
+    assert len(view) == 0
+
+    with open(filename, 'ab') as f:
+        f.write(rows[:reader.chunksize * 3 + 5])
+    assert view.refresh() == 3
+    assert view.refresh() == 0
+    with open(filename, 'ab') as f:
+        f.write(rows[reader.chunksize * 3 + 5:])
+    assert view.refresh() == reader.row_count() - 3
+
+    assert len(view) == reader.row_count()
+    assert view.column("time")[1] == reader.read_array()["time"][1]
+    assert tuple(view[-1]) == tuple(reader.read_array()[-1])
+    assert not view.column("accx").flags.writeable
+
+
+def _write_binary(filename, start, rows, mode='wb'):
+    with open(filename, mode) as f:
+        if mode == 'wb':
+            f.write(storage.build_binary_header(
+                start, {"name": "S1"}, "dd", ["dt64", "g"], ["time", "accx"]))
+        for row in rows:
+            f.write(struct.pack("dd", *row))
+
+
+def test_process_files_incremental(tmpdir):
+    in_folder = tmpdir.mkdir("in")
+    out_folder = tmpdir.mkdir("out")
+    start = 1500000000.0
+    rows = [(start + i * 0.25, float(i)) for i in range(40)]
+    filename = str(in_folder.join("node_m1_S1_2017-07-14-02-40-00.bin"))
+
+    _write_binary(filename, start, rows[:10])
+    assert storage.process_files(str(in_folder), str(out_folder), "rm02") == 2
+    _write_binary(filename, start, rows[10:], mode='ab')
+    assert storage.process_files(str(in_folder), str(out_folder), "rm02") == 7
+    assert storage.process_files(str(in_folder), str(out_folder), "rm02") == 0
+
+    reader = storage.getReader(
+        str(out_folder.join("node_m1_S1_2017-07-14-02-00-00.rm02")))
+    assert reader.header["columns"] == [
+        "time", "count", "accx_min", "accx_max", "accx_mean", "accx_rms"]
+    result = [tuple(row) for row in reader.read_array()]
+    assert len(result) == 9
+    assert result[0] == (start, 4, 0.0, 3.0, 1.5, (14 / 4.0) ** 0.5)
+    assert result[2] == (start + 2, 4, 8.0, 11.0, 9.5,
+                         ((64 + 81 + 100 + 121) / 4.0) ** 0.5)
+    assert result[-1][0] == start + 8
+
+
+def test_process_files_interrupted(tmpdir, monkeypatch):
+    in_folder = tmpdir.mkdir("in")
+    start = 1500000000.0
+    rows = [(start + i * 0.25, float(i)) for i in range(40)]
+    _write_binary(str(in_folder.join("node_m1_S1_2017-07-14-02-40-00.bin")),
+                  start, rows)
+    expected = tmpdir.mkdir("expected")
+    storage.process_files(str(in_folder), str(expected), "rm02", chunk_rows=7)
+
+    out_folder = tmpdir.mkdir("out")
+    save_state = storage._save_state
+    calls = []
+
+    def interrupt(filename, state):
+        calls.append(filename)
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        save_state(filename, state)
+    monkeypatch.setattr(storage, "_save_state", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        storage.process_files(str(in_folder), str(out_folder), "rm02",
+                              chunk_rows=7)
+    monkeypatch.setattr(storage, "_save_state", save_state)
+    storage.process_files(str(in_folder), str(out_folder), "rm02",
+                          chunk_rows=7)
+    name = "node_m1_S1_2017-07-14-02-00-00.rm02"
+    assert (out_folder.join(name).read_binary() ==
+            expected.join(name).read_binary())
+
+
+def test_process_files_closes_skipped(tmpdir, monkeypatch):
+    in_folder = tmpdir.mkdir("in")
+    start = 1500000000.0
+    _write_binary(str(in_folder.join("node_m1_S1_2017-07-14-02-40-00.bin")),
+                  start, [(start, 1.0)])
+    with open(str(in_folder.join("node_m1_S1_2017-07-14-03-40-00.bin")),
+              'wb') as f:
+        f.write(storage.build_binary_header(
+            start + 3600, {"name": "S1"}, "dd", ["dt64", "g"],
+            ["time", "accy"]))
+        f.write(struct.pack("dd", start + 3600, 2.0))
+    readers = []
+    get_reader = storage.getReader
+
+    def record(filename):
+        readers.append(get_reader(filename))
+        return readers[-1]
+    monkeypatch.setattr(storage, "getReader", record)
+    storage.process_files(str(in_folder), str(tmpdir.mkdir("out")), "rm02")
+    # the second file is skipped for its column names
+    assert len(readers) == 4
+    assert all(reader.f.closed for reader in readers)
+
+
+def test_resample_without_values(tmpdir):
+    in_folder = tmpdir.mkdir("in")
+    out_folder = tmpdir.mkdir("out")
+    start = 1500000000.0
+    with open(str(in_folder.join("node_m1_S1_2017-07-14-02-40-00.bin")),
+              'wb') as f:
+        f.write(storage.build_binary_header(start, {}, "d", ["dt64"],
+                                            ["time"]))
+        for i in range(10):
+            f.write(struct.pack("d", start + i * 0.25))
+    assert storage.process_files(str(in_folder), str(out_folder), "rm02") == 2
+
+
+def test_csv_iter_arrays_start():
+    reader = storage.getReader("storage_tests/csv.rm01")
+    rows = reader.read_array()
+    arrays = list(reader.iter_arrays(2, 1))
+    assert [len(array) for array in arrays[:-1]] == [2] * (len(arrays) - 1)
+    assert (sum((array.tolist() for array in arrays), []) ==
+            rows[1:].tolist())
+
+
+def test_block_start():
+    # 2017-07-14 02:40:00 UTC was a Friday
+    timestamp = 1500000000
+    assert storage.block_start(timestamp, "hour") == 1499997600
+    assert storage.block_start(timestamp, "day") == 1499990400
+    assert storage.block_start(timestamp, "week") == 1499990400 - 4 * 86400
+    assert storage.block_start(timestamp, "month") == 1498867200
+
+
+def test_read_time_range():
+    filename = "converter_tests/input_folder/level0_test1.bin"
+    times = storage.BinReader(filename).read_array()["time"]
+    t0 = times[1000]
+    t1 = times[2000]
+    result = storage.read_time_range(filename, t0, t1)
+    assert len(result) == 1000
+    assert result["time"][0] == t0
+    assert result["time"][-1] == times[1999]
+
+    assert len(storage.read_time_range(filename, 0, times[0])) == 0
+    assert len(storage.read_time_range(filename, times[-1], 1e12)) == 1
+
+    csv_times = [row[0] for row in storage.getReader(
+        "converter_tests/input_folder/level0_test3.csv").data()]
+    result = storage.read_time_range(
+        "converter_tests/input_folder/level0_test3.csv",
+        csv_times[1], csv_times[3])
+    assert list(result[result.dtype.names[0]]) == csv_times[1:3]
+
+
+def test_dataset(tmpdir):
+    start = 1500000000.0
+    for i in range(3):
+        rows = [(start + i * 10 + j, float(j)) for j in range(10)]
+        _write_binary(str(tmpdir.join(
+            "node1_m_1_S1_2017-07-14-02-40-{:02d}.bin".format(i * 10))),
+            start + i * 10, rows)
+    _write_binary(str(tmpdir.join("node1_m_1_S2_2017-07-14-02-40-00.bin")),
+                  start, [(start, 1.0)])
+    tmpdir.join("notes.txt").write("not a data file")
+
+    dataset = storage.Dataset(str(tmpdir))
+    assert dataset.sensors() == ["S1", "S2"]
+    files = dataset.files(sensor="S1")
+    assert len(files) == 3
+    entry = dataset.catalog[files[1]]
+    assert (entry["node"], entry["measurement"]) == ("node1", "m_1")
+    assert (entry["start"], entry["end"], entry["rows"]) == (
+        start + 10, start + 19, 10)
+
+    arrays = list(dataset.read_time_range(start + 5, start + 25,
+                                          sensor="S1", chunk_rows=4))
+    times = [t for array in arrays for t in array["time"]]
+    assert times == [start + t for t in range(5, 25)]
+
+    assert not storage.Dataset(str(tmpdir)).refresh()
+    _write_binary(str(tmpdir.join(files[2])), start, [(start + 30, 0.0)],
+                  mode='ab')
+    assert dataset.refresh()
+    assert dataset.catalog[files[2]]["end"] == start + 30
+
+
+def test_wall_time(tmpdir):
+    anchors = tmpdir.join("data.bin.anchors")
+    anchors.write("# monotonic realtime\n"
+                  "100.0 1000100.0\n"
+                  "110.0 1000110.5\n")
+    pairs = storage.read_anchors(str(tmpdir.join("data.bin")))
+    assert pairs.shape == (2, 2)
+    times = storage.wall_time([90.0, 100.0, 105.0, 120.0], pairs)
+    assert times.tolist() == pytest.approx(
+        [1000090.0, 1000100.0, 1000105.25, 1000120.5])
+
+
+def test_read_anchors_empty(tmpdir, recwarn):
+    anchors = tmpdir.join("data.bin.anchors")
+    anchors.write("# monotonic realtime\n")
+    with pytest.raises(ValueError):
+        storage.read_anchors(str(anchors))
+    assert not recwarn.list
+
+
+def test_csv_read_array():
+    reader = storage.getReader("storage_tests/csv.rm01")
+    array = reader.read_array()
+    rows = list(reader.data())
+    assert array.tolist() == rows
+    assert reader.read_array(2, 5).tolist() == rows[2:5]
+    chunks = list(reader.iter_arrays(chunk_rows=3))
+    assert max(len(chunk) for chunk in chunks) == 3
+    assert sum((chunk.tolist() for chunk in chunks), []) == rows
+
+
+def test_csv_read_array_types(tmpdir):
+    filename = str(tmpdir.join("types.csv"))
+    writer = storage.Writer(filename, binary=False)
+    writer.writeHeader({'time': 1488201843.0, 'metadata': {},
+                        'datatypes': 'diB', 'units': ['s', '-', '-'],
+                        'columns': ['time', 'count', 'flag']})
+    writer.writeRow((1.5, 3, True))
+    writer.writeRow((2.5, -4, False))
+    writer.close()
+    array = storage.getReader(filename).read_array()
+    assert array.dtype.names == ('time', 'count', 'flag')
+    assert array['count'].tolist() == [3, -4]
+    assert array['flag'].tolist() == [True, False]
+    # the integers are written as floats
+    result = storage.read_time_range(filename, 2.0, 3.0)
+    assert result.tolist() == [(2.5, -4, False)]
+
+
+def test_delta_filter(tmpdir):
+    filename = str(tmpdir.join("data.bin"))
+    _write_binary(filename, 1000.0,
+                  [(1000.0 + i * 0.01, i % 7 - 3.5) for i in range(250)])
+    with open(filename, 'ab') as f:
+        # partially written row
+        f.write(b"\x01\x02\x03")
+    with open(filename, 'rb') as f:
+        original = f.read()
+    filtered = b"".join(storage.delta_filter(filename, chunk_rows=100))
+    assert len(filtered) == len(original) + 4 * 8
+    assert storage.delta_unfilter(filtered) == original
+    assert len(zlib.compress(filtered)) < len(zlib.compress(original)) / 2
+
+
+def _block_rows(count):
+    rows = np.zeros(count, dtype=storage.numpy_dtype(
+        "dfd", ["time", "accx", "temp"]))
+    rows["time"] = 1.5e9 + np.arange(count) * 0.01
+    rows["accx"] = np.sin(np.arange(count) / 20.0)
+    rows["temp"] = 20.0 + np.arange(count) % 50 * 0.01
+    return rows
+
+
+def _block_header(rows):
+    return {"time": float(rows["time"][0]), "metadata": {"name": "S1"},
+            "datatypes": "dfd", "units": ["dt64", "g", "C"],
+            "columns": ["time", "accx", "temp"]}
+
+
+def test_block_format(tmpdir):
+    rows = _block_rows(2500)
+    filename = str(tmpdir.join("data.bin"))
+    writer = storage.Writer(filename, version=storage.BLOCK_VERSION,
+                            block_rows=1000)
+    writer.writeHeader(_block_header(rows))
+    writer.writeRows(rows)
+    writer.close()
+    raw = str(tmpdir.join("raw.bin"))
+    writer = storage.Writer(raw)
+    writer.writeHeader(_block_header(rows))
+    writer.writeRows(rows)
+    writer.close()
+    assert tmpdir.join("data.bin").size() < tmpdir.join("raw.bin").size() / 3
+
+    reader = storage.getReader(filename)
+    assert isinstance(reader, storage.BlockReader)
+    assert reader.header["block_rows"] == 1000
+    assert reader.header["columns"] == ["time", "accx", "temp"]
+    assert reader.row_count() == 2500
+    assert reader.block_count() == 3
+    assert reader.complete
+    assert reader.read_array().tolist() == rows.tolist()
+    assert reader.read_array(990, 2010).tolist() == rows[990:2010].tolist()
+    assert next(reader.data()) == tuple(rows[0].tolist())
+
+    t0, t1 = rows["time"][1234], rows["time"][1240]
+    assert (storage.read_time_range(filename, t0, t1).tolist() ==
+            rows[1234:1240].tolist())
+
+
+def test_block_format_quantization(tmpdir):
+    rows = _block_rows(100)
+    filename = str(tmpdir.join("data.bin"))
+    writer = storage.Writer(filename, version=storage.BLOCK_VERSION,
+                            quantization=[0, 0.001, 0.1])
+    writer.writeHeader(_block_header(rows))
+    writer.writeRows(rows)
+    writer.close()
+    array = storage.getReader(filename).read_array()
+    assert (array["time"] == rows["time"]).all()
+    assert abs(array["accx"] - rows["accx"]).max() <= 0.0005 + 1e-7
+    assert abs(array["temp"] - rows["temp"]).max() <= 0.05 + 1e-9
+
+    with pytest.raises(ValueError):
+        storage.BlockFile(None, "dd", quantization=[0.1, 0.1])
+
+
+def test_block_file_growing(tmpdir):
+    rows = _block_rows(250)
+    filename = str(tmpdir.join("data.bin"))
+    f = open(filename, "wb")
+    f.write(storage.build_binary_header(
+        0.0, {}, "dfd", ["dt64", "g", "C"], ["time", "accx", "temp"],
+        storage.BLOCK_VERSION))
+    f.write(storage.block_header_extension("dfd", 100))
+    blocks = storage.BlockFile(f, "dfd", 100)
+    blocks.write(rows[:150].tobytes())
+
+    # without index the blocks written so far are found by their headers
+    reader = storage.getReader(filename)
+    view = reader.mmap_view()
+    assert len(view) == 100
+    assert not reader.complete
+    blocks.write(rows[150:].tobytes())
+    assert view.refresh() == 100
+    assert view.column("accx")[150] == rows["accx"][150]
+    assert view[-1]["time"] == rows["time"][199]
+
+    blocks.close()
+    assert view.refresh() == 50
+    assert reader.complete
+    assert view[200:250].tolist() == rows[200:].tolist()
+
+
+def test_monotonic_timestamps(tmpdir):
+    in_folder = tmpdir.mkdir("in")
+    filename = str(in_folder.join("node_m1_S1_2017-07-14-02-40-00.bin"))
+    with open(filename, 'wb') as f:
+        f.write(storage.build_binary_header(
+            1500000000.0, {"name": "S1", "timestamps": "monotonic"}, "dd",
+            ["dt64", "g"], ["time", "accx"]))
+        for i in range(40):
+            f.write(struct.pack("dd", 100.0 + i * 0.25, float(i)))
+    # the file has no anchors yet
+    with pytest.raises(storage.RaspyreFileFormatException):
+        storage.read_time_range(filename, 0, 1e10)
+    out_folder = tmpdir.mkdir("out")
+    assert storage.process_files(str(in_folder), str(out_folder), "rm02") == 0
+
+    with open(filename + storage.ANCHOR_SUFFIX, 'w') as f:
+        f.write("# monotonic realtime\n"
+                "100.0 1500000000.0\n")
+    start = 1500000000.0
+    array = storage.read_time_range(filename, start + 1, start + 2)
+    assert array["time"].tolist() == [start + 1, start + 1.25,
+                                      start + 1.5, start + 1.75]
+    assert array["accx"].tolist() == [4.0, 5.0, 6.0, 7.0]
+
+    assert storage.process_files(str(in_folder), str(out_folder), "rm02") == 9
+    reader = storage.getReader(
+        str(out_folder.join("node_m1_S1_2017-07-14-02-00-00.rm02")))
+    assert reader.read_array()["time"][0] == start
+    assert reader.header["metadata"]["timestamps"] == "realtime"
+
+    dataset = storage.Dataset(str(in_folder), cache=False)
+    entry = dataset.catalog["node_m1_S1_2017-07-14-02-40-00.bin"]
+    assert (entry["start"], entry["end"]) == (start, start + 9.75)
+    arrays = list(dataset.read_time_range(start + 9, start + 20))
+    assert [row[1] for row in arrays[0].tolist()] == [36.0, 37.0, 38.0, 39.0]